@@ -1,4 +1,3 @@
-import requests
 import pandas as pd
 import streamlit as st
 import plotly.express as px
@@ -7,8 +6,13 @@ import os
 import re
 from datetime import datetime, timedelta
 import pytz
-from database import LoyverseDB
+from database import LoyverseDB, MAINTENANCE_AFTER_SYNC, IN_REQUEST_MAINTENANCE_TASKS
 from utils.reference_data import ReferenceData
+from utils.loyverse_client import get_client
+from utils.async_ingest import ingest, save_ingest
+from utils.receipt_fetcher import FETCH_WORKERS, fetch_receipts_sharded, utc_bounds
+from utils.receipt_sync import ReceiptGuardrail, stream_receipts_to_db, sync_updated_receipts
+from utils.sync_dates import utc_to_bangkok_date
 from utils import charts
 
 # Load environment variables from .env file if it exists
@@ -178,15 +182,16 @@ TRANSLATIONS = {
         "settings_sync_caption": "Sync settings are prioritized for daily operations and reconciliation.",
         "settings_sync_header": "Sync Settings",
         "settings_sync_last_date": "Sync from last date",
-        "settings_sync_last_date_help": "Intelligently sync from the latest stored transaction up to now.",
+        "settings_sync_last_date_help": "Fetch only receipts created or changed (edits, refunds, cancellations) since the last sync.",
         "settings_sync_metadata": "Sync metadata",
         "settings_sync_metadata_help": "Fetch customers, payment types, stores, employees, categories, and items.",
         "settings_sync_metadata_running": "Syncing metadata...",
-        "settings_sync_metadata_done": "Metadata sync complete: {total} records updated.",
+        "settings_sync_metadata_done": "Metadata sync complete: {total} records updated, {unchanged} unchanged.",
         "settings_custom_range": "Custom range",
         "settings_theme_locked_light": "Theme is locked to Light on this deployment.",
         "settings_store_filter": "Store ID filter (optional)",
         "settings_store_filter_help": "Leave empty to sync all stores.",
+        "settings_sync_fresh": "Start fresh (don't resume an unfinished run)",
         "settings_sync_preview_caption": "Will sync {days} day(s): {start_date} -> {end_date}",
         "settings_sync_custom_range": "Sync custom range",
         "settings_invalid_date_range": "Start date must be before or equal to end date.",
@@ -206,6 +211,10 @@ TRANSLATIONS = {
         "settings_db_range": "Data range",
         "settings_recent_imports": "Recent imported receipts",
         "settings_no_receipts_preview": "No receipts found in database yet.",
+        "settings_maintenance_log": "Database maintenance",
+        "settings_no_maintenance": "No maintenance runs recorded yet.",
+        "settings_sync_runs": "Sync runs (re-running an unfinished range resumes it)",
+        "settings_no_sync_runs": "No range syncs recorded yet.",
         "settings_basic_preferences": "Basic Preferences",
         "settings_language": "Language"
     },
@@ -367,15 +376,16 @@ TRANSLATIONS = {
         "settings_sync_caption": "ให้ความสำคัญกับการตั้งค่าซิงค์สำหรับการใช้งานประจำวันและการกระทบยอด",
         "settings_sync_header": "การตั้งค่าการซิงค์",
         "settings_sync_last_date": "ซิงค์จากวันที่ล่าสุด",
-        "settings_sync_last_date_help": "ซิงค์อย่างชาญฉลาดจากรายการล่าสุดที่จัดเก็บไว้จนถึงปัจจุบัน",
+        "settings_sync_last_date_help": "ดึงเฉพาะใบเสร็จที่สร้างใหม่หรือมีการเปลี่ยนแปลง (แก้ไข คืนเงิน ยกเลิก) ตั้งแต่การซิงค์ครั้งล่าสุด",
         "settings_sync_metadata": "ซิงค์เมทาดาทา",
         "settings_sync_metadata_help": "ดึงข้อมูลลูกค้า ประเภทการชำระเงิน สาขา พนักงาน หมวดหมู่ และสินค้า",
         "settings_sync_metadata_running": "กำลังซิงค์เมทาดาทา...",
-        "settings_sync_metadata_done": "ซิงค์เมทาดาทาเสร็จสิ้น: อัปเดต {total} รายการ",
+        "settings_sync_metadata_done": "ซิงค์เมทาดาทาเสร็จสิ้น: อัปเดต {total} รายการ, ไม่เปลี่ยนแปลง {unchanged} รายการ",
         "settings_custom_range": "ช่วงวันที่กำหนดเอง",
         "settings_theme_locked_light": "ธีมถูกล็อกเป็นโหมดสว่างสำหรับดีพลอยนี้",
         "settings_store_filter": "กรองด้วย Store ID (ไม่บังคับ)",
         "settings_store_filter_help": "เว้นว่างไว้เพื่อซิงค์ทุกสาขา",
+        "settings_sync_fresh": "เริ่มซิงค์ใหม่ (ไม่ทำต่อจากรอบที่ค้าง)",
         "settings_sync_preview_caption": "จะซิงค์ {days} วัน: {start_date} -> {end_date}",
         "settings_sync_custom_range": "ซิงค์ช่วงวันที่กำหนดเอง",
         "settings_invalid_date_range": "วันที่เริ่มต้นต้องน้อยกว่าหรือเท่ากับวันที่สิ้นสุด",
@@ -395,6 +405,10 @@ TRANSLATIONS = {
         "settings_db_range": "ช่วงข้อมูล",
         "settings_recent_imports": "ใบเสร็จที่นำเข้าล่าสุด",
         "settings_no_receipts_preview": "ยังไม่พบใบเสร็จในฐานข้อมูล",
+        "settings_maintenance_log": "การบำรุงรักษาฐานข้อมูล",
+        "settings_no_maintenance": "ยังไม่มีประวัติการบำรุงรักษา",
+        "settings_sync_runs": "ประวัติการซิงค์ (ซิงค์ช่วงที่ค้างอยู่ซ้ำเพื่อทำต่อ)",
+        "settings_no_sync_runs": "ยังไม่มีประวัติการซิงค์ตามช่วงวันที่",
         "settings_basic_preferences": "การตั้งค่าพื้นฐาน",
         "settings_language": "ภาษา"
     }
@@ -522,7 +536,6 @@ def get_heading(key):
 
 # ========= CONFIG =========
 LOYVERSE_TOKEN = os.getenv("LOYVERSE_TOKEN", "d18826e6c76345888204b310aaca1351")
-BASE_URL = "https://api.loyverse.com/v1.0/receipts"
 PAGE_LIMIT = 250
 FORCE_LIGHT_THEME = os.getenv("STREAMLIT_THEME_BASE", "").lower() == "light"
 
@@ -1060,163 +1073,11 @@ def initialize_selected_tab():
 
 # ===== FUNCTION DEFINITIONS (Must be before use) =====
 
-# --- Fetch customers from Loyverse API ---
-@st.cache_data(ttl=3600)  # Cache for 1 hour
-def fetch_all_customers(token):
-    """Fetch all customers from Loyverse API"""
-    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-    url = "https://api.loyverse.com/v1.0/customers"
-    
-    all_customers = []
-    cursor = None
-    limit = 250
-    
-    while True:
-        params = {"limit": limit}
-        if cursor:
-            params["cursor"] = cursor
-            
-        try:
-            res = requests.get(url, headers=headers, params=params)
-            if res.status_code != 200:
-                st.error(f"Error fetching customers: {res.status_code} - {res.text}")
-                break
-                
-            data = res.json()
-            customers = data.get("customers", [])
-            all_customers.extend(customers)
-            
-            cursor = data.get("cursor")
-            if not cursor:
-                break
-                
-        except Exception as e:
-            st.error(f"Exception fetching customers: {str(e)}")
-            break
-    
-    return all_customers
-
-# --- Fetch payment types ---
-@st.cache_data(ttl=3600)  # Cache for 1 hour (payment types rarely change)
-def fetch_all_payment_types(token):
-    """Fetch all payment types from Loyverse API"""
-    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-    url = "https://api.loyverse.com/v1.0/payment_types"
-    
-    try:
-        res = requests.get(url, headers=headers)
-        if res.status_code != 200:
-            st.error(f"Error fetching payment types: {res.status_code}")
-            return []
-        
-        data = res.json()
-        return data.get("payment_types", [])
-    except Exception as e:
-        st.error(f"Exception fetching payment types: {str(e)}")
-        return []
-
-# --- Fetch stores ---
-@st.cache_data(ttl=3600)  # Cache for 1 hour (stores rarely change)
-def fetch_all_stores(token):
-    """Fetch all stores from Loyverse API"""
-    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-    url = "https://api.loyverse.com/v1.0/stores"
-    
-    try:
-        res = requests.get(url, headers=headers)
-        if res.status_code != 200:
-            st.error(f"Error fetching stores: {res.status_code}")
-            return []
-        
-        data = res.json()
-        return data.get("stores", [])
-    except Exception as e:
-        st.error(f"Exception fetching stores: {str(e)}")
-        return []
-
-# --- Fetch employees ---
-@st.cache_data(ttl=3600)  # Cache for 1 hour
-def fetch_all_employees(token):
-    """Fetch all employees from Loyverse API"""
-    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-    url = "https://api.loyverse.com/v1.0/employees"
-    
-    try:
-        res = requests.get(url, headers=headers)
-        if res.status_code != 200:
-            st.error(f"Error fetching employees: {res.status_code}")
-            return []
-        
-        data = res.json()
-        return data.get("employees", [])
-    except Exception as e:
-        st.error(f"Exception fetching employees: {str(e)}")
-        return []
-
-# --- Fetch categories ---
-@st.cache_data(ttl=3600)  # Cache for 1 hour
-def fetch_all_categories(token):
-    """Fetch all categories from Loyverse API (your 23 locations!)"""
-    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-    url = "https://api.loyverse.com/v1.0/categories"
-    
-    try:
-        res = requests.get(url, headers=headers)
-        if res.status_code != 200:
-            st.error(f"Error fetching categories: {res.status_code}")
-            return []
-        
-        data = res.json()
-        return data.get("categories", [])
-    except Exception as e:
-        st.error(f"Exception fetching categories: {str(e)}")
-        return []
-
-# --- Fetch items ---
-@st.cache_data(ttl=3600)  # Cache for 1 hour
-def fetch_all_items(token):
-    """Fetch all items from Loyverse API (links products to categories/locations)"""
-    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-    url = "https://api.loyverse.com/v1.0/items"
-    
-    all_items = []
-    cursor = None
-    limit = 250
-    
-    while True:
-        params = {"limit": limit}
-        if cursor:
-            params["cursor"] = cursor
-            
-        try:
-            res = requests.get(url, headers=headers, params=params)
-            if res.status_code != 200:
-                st.error(f"Error fetching items: {res.status_code}")
-                break
-                
-            data = res.json()
-            items = data.get("items", [])
-            all_items.extend(items)
-            
-            cursor = data.get("cursor")
-            if not cursor:
-                break
-                
-        except Exception as e:
-            st.error(f"Exception fetching items: {str(e)}")
-            break
-    
-    return all_items
-
 # --- Loyverse Importer Class (Robust & Idempotent) ---
 class LoyverseImporter:
     def __init__(self, token):
         self.token = token
-        self.headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        }
+        self.client = get_client(token)
 
     def check_exists(self, created_at, total_money, receipt_number=None):
         """
@@ -1231,20 +1092,19 @@ class LoyverseImporter:
         }
         
         try:
-            res = requests.get(BASE_URL, headers=self.headers, params=params, timeout=10)
-            if res.status_code == 200:
-                candidates = res.json().get('receipts', [])
-                for r in candidates:
-                    # 1. Check receipt number if provided (Strongest check)
-                    if receipt_number and r.get('receipt_number') == receipt_number:
-                        return r.get('id') or "EXISTING_NO_ID"
+            # An API error after retries counts as a failed check, never as "not found"
+            candidates = self.client.get("receipts", params).get('receipts', [])
+            for r in candidates:
+                # 1. Check receipt number if provided (Strongest check)
+                if receipt_number and r.get('receipt_number') == receipt_number:
+                    return r.get('id') or "EXISTING_NO_ID"
+                
+                # 2. Check total money (Secondary check)
+                # Note: Float comparison needs epsilon, but API returns string or float
+                api_total = float(r.get('total_money', 0))
+                if abs(api_total - float(total_money)) < 0.01:
+                    return r.get('id') or "EXISTING_NO_ID"
                     
-                    # 2. Check total money (Secondary check)
-                    # Note: Float comparison needs epsilon, but API returns string or float
-                    api_total = float(r.get('total_money', 0))
-                    if abs(api_total - float(total_money)) < 0.01:
-                        return r.get('id') or "EXISTING_NO_ID"
-                        
             return None
         except Exception as e:
             print(f"⚠️ Check failed: {e}")
@@ -1273,7 +1133,7 @@ class LoyverseImporter:
 
         # 2. Create
         try:
-            res = requests.post(BASE_URL, headers=self.headers, json=receipt_data, timeout=10)
+            res = self.client.post("receipts", receipt_data)
             if res.status_code == 201:
                 new_id = res.json().get('id')
                 print(f"✅ Created: {created_at} - {total_money} (ID: {new_id})")
@@ -1286,43 +1146,11 @@ class LoyverseImporter:
             return False
 
 # --- Helper: API call with pagination for receipts ---
-def fetch_all_receipts(token, start_date, end_date, store_id=None, limit=250, render_ui=True, debug_sink=None):
-    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-    
-    # Handle both date and datetime objects
-    if isinstance(start_date, datetime):
-        # If it's already a datetime, use it directly
-        start_datetime_utc = start_date
-        if start_datetime_utc.tzinfo is None:
-            start_datetime_utc = pytz.UTC.localize(start_datetime_utc)
-        elif start_datetime_utc.tzinfo != pytz.UTC:
-            start_datetime_utc = start_datetime_utc.astimezone(pytz.UTC)
-    else:
-        # Convert GMT+7 date to UTC for API call
-        gmt_plus_7 = pytz.timezone('Asia/Bangkok')  # GMT+7 timezone
-        start_datetime_gmt7 = gmt_plus_7.localize(datetime.combine(start_date, datetime.min.time()))
-        start_datetime_utc = start_datetime_gmt7.astimezone(pytz.UTC)
-    
-    if isinstance(end_date, datetime):
-        # If it's already a datetime, use it directly
-        end_datetime_utc = end_date
-        if end_datetime_utc.tzinfo is None:
-            end_datetime_utc = pytz.UTC.localize(end_datetime_utc)
-        elif end_datetime_utc.tzinfo != pytz.UTC:
-            end_datetime_utc = end_datetime_utc.astimezone(pytz.UTC)
-    else:
-        # Convert GMT+7 date to UTC (end of day in GMT+7)
-        gmt_plus_7 = pytz.timezone('Asia/Bangkok')  # GMT+7 timezone
-        end_datetime_gmt7 = gmt_plus_7.localize(datetime.combine(end_date, datetime.max.time()))
-        end_datetime_utc = end_datetime_gmt7.astimezone(pytz.UTC)
-    
-    params = {
-        "created_at_min": start_datetime_utc.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
-        "created_at_max": end_datetime_utc.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
-        "limit": limit
-    }
-    if store_id:
-        params["store_id"] = store_id
+def fetch_all_receipts(token, start_date, end_date, store_id=None, limit=250, render_ui=True, debug_sink=None,
+                       shard_window="day", max_workers=FETCH_WORKERS):
+    # Bangkok dates and UTC datetimes are both accepted; the range is split into
+    # day (or hour) shards that are fetched in parallel and merged in order.
+    start_datetime_utc, end_datetime_utc = utc_bounds(start_date, end_date)
 
     if debug_sink is not None:
         debug_sink["date_range_gmt7"] = {"start": str(start_date), "end": str(end_date)}
@@ -1339,60 +1167,49 @@ def fetch_all_receipts(token, start_date, end_date, store_id=None, limit=250, re
             st.write(f"**Date Range (GMT+7):** {start_date} to {end_date}")
             st.write(f"**API Range (UTC):** {start_datetime_utc.strftime('%Y-%m-%d %H:%M:%S')} to {end_datetime_utc.strftime('%Y-%m-%d %H:%M:%S')}")
             st.write(f"**Store Filter:** {store_id if store_id else 'All stores'}")
-    
-    all_receipts = []
-    cursor = None
-    page_count = 0
+            st.write(f"**Shards:** {shard_window} windows, {max_workers} workers")
+
     progress_bar = st.progress(0) if render_ui else None
     status_text = st.empty() if render_ui else None
+    if status_text is not None:
+        status_text.text("Shards loaded: 0 | Receipts loaded: 0")
+
+    loaded = {"receipts": 0}
 
-    while True:
-        page_count += 1
+    def on_shard_done(shard_stats, done, total):
+        loaded["receipts"] += shard_stats["receipts"]
         if status_text is not None:
-            status_text.text(f"Pages loaded: {page_count - 1} | Receipts loaded: {len(all_receipts)}")
-        
-        if cursor:
-            params["cursor"] = cursor
-        
-        try:
-            res = requests.get(BASE_URL, headers=headers, params=params)
-            
-            if res.status_code != 200:
-                if render_ui:
-                    st.error(f"❌ **Error {res.status_code}:** {res.text}")
-                if debug_sink is not None:
-                    debug_sink["error"] = f"Error {res.status_code}: {res.text}"
-                break
-                
-            data = res.json()
-            receipts = data.get("receipts", [])
-            
-            all_receipts.extend(receipts)
-            cursor = data.get("cursor")
-            if status_text is not None:
-                status_text.text(f"Pages loaded: {page_count} | Receipts loaded: {len(all_receipts)}")
-            
-            if progress_bar is not None:
-                progress_bar.progress(min(page_count * 20, 100))
-            
-            if not cursor:
-                if status_text is not None:
-                    status_text.text(f"✅ Completed! Pages loaded: {page_count} | Receipts loaded: {len(all_receipts)}")
-                break
-                
-        except Exception as e:
-            if render_ui:
-                st.error(f"❌ **Exception:** {str(e)}")
-            if debug_sink is not None:
-                debug_sink["error"] = f"Exception: {str(e)}"
-            break
-    
-    if progress_bar is not None:
-        progress_bar.progress(100)
+            status_text.text(f"Shards loaded: {done}/{total} | Receipts loaded: {loaded['receipts']}")
+        if progress_bar is not None:
+            progress_bar.progress(int(done * 100 / total))
+
+    result = fetch_receipts_sharded(
+        get_client(token),
+        start_date,
+        end_date,
+        window=shard_window,
+        store_ids=[store_id] if store_id else None,
+        max_workers=max_workers,
+        limit=limit,
+        on_shard_done=on_shard_done,
+    )
+
+    if result.errors:
+        message = "; ".join(f"{shard['shard']}: {shard['error']}" for shard in result.errors)
+        if render_ui:
+            st.error(f"❌ **{len(result.errors)} shard(s) failed:** {message}")
+        if debug_sink is not None:
+            debug_sink["error"] = message
+    elif status_text is not None:
+        status_text.text(f"✅ Completed! Pages loaded: {result.pages} | Receipts loaded: {len(result.receipts)}")
+
     if debug_sink is not None:
-        debug_sink["pages_fetched"] = page_count
-        debug_sink["receipts_found"] = len(all_receipts)
-    return all_receipts
+        debug_sink["pages_fetched"] = result.pages
+        debug_sink["receipts_found"] = len(result.receipts)
+        debug_sink["shard_duplicates"] = result.duplicates
+        debug_sink["fetch_seconds"] = result.seconds
+        debug_sink["shards"] = result.shards
+    return result.receipts
 
 # --- Helper: Convert UTC timestamp to GMT+7 date ---
 def convert_utc_to_gmt7_date(utc_timestamp):
@@ -1498,68 +1315,22 @@ def categorize_ice_product_name(product_name, manual_categories=None):
 
 # --- Helper: Get smart sync date range ---
 def get_smart_sync_range(db):
-    """Get intelligent sync date range based on existing data - starts from exact latest timestamp"""
-    date_range = db.get_date_range()
-    
-    # Debug information
-    with st.expander("🔍 Sync Missing Data Debug", expanded=False):
-        st.write(f"**Raw date range from DB:** {date_range}")
-        if date_range and date_range[1]:
-            st.write(f"**Latest timestamp:** {date_range[1]}")
-    
-    if date_range and date_range[1]:  # If we have data, start from exact latest timestamp
-        latest_timestamp = date_range[1]
-        
+    """
+    Range for "Sync last date". With an updated_at watermark the sync fetches
+    only receipts created or changed since it (edits, refunds, cancellations
+    included), so the range runs from the watermark's Bangkok day to today.
+    """
+    watermark = db.get_receipts_watermark()
+    end_date = datetime.now(pytz.timezone('Asia/Bangkok')).date()
+
+    if watermark:
         try:
-            # Parse the latest timestamp as UTC
-            if latest_timestamp.endswith('Z'):
-                latest_utc = datetime.fromisoformat(latest_timestamp.replace('Z', '+00:00'))
-            else:
-                latest_utc = datetime.fromisoformat(latest_timestamp)
-            
-            # Ensure it's timezone aware (UTC)
-            if latest_utc.tzinfo is None:
-                latest_utc = pytz.UTC.localize(latest_utc)
-            elif latest_utc.tzinfo != pytz.UTC:
-                latest_utc = latest_utc.astimezone(pytz.UTC)
-            
-            # Start from latest timestamp + 1 second to avoid duplicates
-            start_utc = latest_utc + timedelta(seconds=1)
-            end_utc = datetime.now(pytz.UTC)
-            
-            # Convert to GMT+7 for display
-            gmt_plus_7 = pytz.timezone('Asia/Bangkok')
-            start_gmt7 = start_utc.astimezone(gmt_plus_7)
-            end_gmt7 = end_utc.astimezone(gmt_plus_7)
-            
-            # Convert to date objects for the return (API will handle precise timestamps)
-            start_date = start_gmt7.date()
-            end_date = end_gmt7.date()
-            
-            # Debug info
-            with st.expander("🔍 Sync Missing Data Debug", expanded=False):
-                st.write(f"**Raw date range from DB:** {date_range}")
-                st.write(f"**Latest timestamp (UTC):** {latest_utc}")
-                st.write(f"**Start timestamp (UTC):** {start_utc}")
-                st.write(f"**End timestamp (UTC):** {end_utc}")
-                st.write(f"**Start date (GMT+7):** {start_date}")
-                st.write(f"**End date (GMT+7):** {end_date}")
-            
-            # If start is in the future, sync last 7 days instead
-            if start_date > end_date:
-                end_date = datetime.today().date()
-                start_date = end_date - timedelta(days=7)
-                return start_date, end_date, f"Start date was in future, syncing last 7 days from {end_date}"
-            
-            return start_date, end_date, f"Continuing from exact timestamp {latest_utc.strftime('%Y-%m-%d %H:%M:%S')} UTC"
-            
-        except Exception as e:
-            # If we can't parse the timestamp, fall back to last 30 days
-            end_date = datetime.today().date()
+            start_date = min(utc_to_bangkok_date(watermark), end_date)
+            return start_date, end_date, f"Fetching receipts updated since {watermark} UTC"
+        except ValueError as e:
             start_date = end_date - timedelta(days=30)
-            return start_date, end_date, f"Could not parse latest timestamp '{latest_timestamp}': {str(e)}. Syncing last 30 days"
+            return start_date, end_date, f"Could not parse watermark '{watermark}': {str(e)}. Syncing last 30 days"
     else:  # If no data, start from 30 days ago
-        end_date = datetime.today().date()
         start_date = end_date - timedelta(days=30)
         return start_date, end_date, "No existing data, syncing last 30 days"
 
@@ -1582,20 +1353,20 @@ except Exception as e:
     db = LoyverseDB("loyverse_data.db")
     print(f"✅ Fallback database created at: {db.db_path}")
 
-# Initialize reference data
-if 'ref_data' not in st.session_state:
-    try:
-        st.session_state.ref_data = ReferenceData(db)
-        print("✅ Reference data initialized successfully")
-    except Exception as e:
-        print(f"⚠️ Reference data initialization failed: {e}")
-        # Create empty reference data
-        st.session_state.ref_data = ReferenceData(db)
-ref_data = st.session_state.ref_data
+# Reference data is shared by every session in the process and reloads itself
+# when a metadata save bumps the database's metadata version.
+@st.cache_resource
+def get_shared_reference_data(db_path, _db):
+    ref = ReferenceData(_db)
+    print("✅ Reference data initialized successfully")
+    return ref
+
+ref_data = get_shared_reference_data(db.db_path, db)
+ref_data.refresh_if_stale()
 
-# Ensure customer map is always initialized for customer analysis/rendering.
+# Session-only manual customer names, layered over the shared customer map.
 if 'customer_map' not in st.session_state:
-    st.session_state.customer_map = db.get_customer_map() or {}
+    st.session_state.customer_map = {}
 customer_map = st.session_state.get('customer_map', {})
 
 # Ensure manual product categories are always available across tabs.
@@ -1620,7 +1391,7 @@ with load_col:
             if not db.verify_tables_exist():
                 st.sidebar.error("Database tables not initialized.")
                 st.stop()
-            df = db.get_receipts_dataframe()
+            df = db.load_receipts_snapshot()
             if not df.empty:
                 st.session_state.receipts_df = df
                 total_receipts = db.get_receipt_count()
@@ -1749,35 +1520,22 @@ if st.session_state.selected_tab == SETTINGS_TAB:
             use_container_width=True,
         ):
             with st.spinner(get_text("settings_sync_metadata_running")):
-                total_synced = 0
-
-                customers = fetch_all_customers(LOYVERSE_TOKEN)
-                if customers:
-                    total_synced += db.save_customers(customers)
-
-                payment_types = fetch_all_payment_types(LOYVERSE_TOKEN)
-                if payment_types:
-                    total_synced += db.save_payment_types(payment_types)
-
-                stores = fetch_all_stores(LOYVERSE_TOKEN)
-                if stores:
-                    total_synced += db.save_stores(stores)
-
-                employees = fetch_all_employees(LOYVERSE_TOKEN)
-                if employees:
-                    total_synced += db.save_employees(employees)
-
-                categories = fetch_all_categories(LOYVERSE_TOKEN)
-                if categories:
-                    total_synced += db.save_categories(categories)
-
-                items = fetch_all_items(LOYVERSE_TOKEN)
-                if items:
-                    total_synced += db.save_items(items)
-
-                ref_data.refresh()
-
-            st.success(get_text("settings_sync_metadata_done", total=total_synced))
+                db.last_metadata_stats = {}
+
+                # All metadata endpoints are fetched concurrently, then saved in the usual order
+                metadata = ingest(LOYVERSE_TOKEN)
+                save_ingest(db, metadata)
+                for endpoint, error in metadata.errors.items():
+                    st.error(f"Error fetching {endpoint}: {error}")
+
+                ref_data.refresh_if_stale()
+
+            # Only new or changed rows are written; unchanged ones are skipped by content hash
+            metadata_stats = db.last_metadata_stats.values()
+            total_synced = sum(stat["inserted"] + stat["updated"] for stat in metadata_stats)
+            total_unchanged = sum(stat["unchanged"] for stat in metadata_stats)
+            print(f"🔄 Metadata sync: {db.last_metadata_stats}")
+            st.success(get_text("settings_sync_metadata_done", total=total_synced, unchanged=total_unchanged))
             st.rerun()
 
     with sync_col2:
@@ -1814,6 +1572,7 @@ if st.session_state.selected_tab == SETTINGS_TAB:
             key="settings_store_filter",
         )
         st.session_state.sync_store_filter = sync_store_filter
+        st.checkbox(get_text("settings_sync_fresh"), value=False, key="settings_sync_fresh")
 
         st.session_state.sync_start_date = sync_start
         st.session_state.sync_end_date = sync_end
@@ -1860,6 +1619,20 @@ if st.session_state.selected_tab == SETTINGS_TAB:
         receipts_loaded = fetch_debug.get("receipts_found")
         if pages is not None and receipts_loaded is not None:
             st.caption(f"Pages loaded: {pages} | Receipts loaded: {receipts_loaded}")
+        if fetch_debug.get("shards_skipped") or fetch_debug.get("shards_resumed"):
+            st.caption(
+                f"Resumed sync run #{fetch_debug['run_id']}: {fetch_debug['shards_skipped']} of "
+                f"{fetch_debug['shards_total']} shards already done, {fetch_debug['shards_resumed']} "
+                "continued from their last cursor"
+            )
+        shards = fetch_debug.get("shards") or []
+        if shards:
+            slowest = max(shards, key=lambda shard: shard["seconds"])
+            st.caption(
+                f"Shards: {len(shards)} in {fetch_debug.get('fetch_seconds', 0):.1f}s | "
+                f"slowest {slowest['shard']} ({slowest['seconds']:.1f}s) | "
+                f"boundary duplicates: {fetch_debug.get('shard_duplicates', 0)}"
+            )
 
     st.markdown("---")
 
@@ -1946,9 +1719,8 @@ See `API_REFERENCE.md` for complete details, response examples, and curl command
     # 3) Imported Data Snapshot
     st.markdown(f"### {get_text('settings_imported_snapshot')}")
     try:
+        snapshot_stats = db.get_database_stats()
         conn = db.get_connection()
-        receipt_count_df = pd.read_sql_query("SELECT COUNT(*) AS c FROM receipts", conn)
-        line_count_df = pd.read_sql_query("SELECT COUNT(*) AS c FROM line_items", conn)
         recent_receipts = pd.read_sql_query(
             """
             SELECT
@@ -1957,19 +1729,19 @@ See `API_REFERENCE.md` for complete details, response examples, and curl command
                 receipt_type,
                 total_money,
                 total_discount,
-                COALESCE(receipt_date, created_at) AS event_ts
+                event_ts
             FROM receipts
-            ORDER BY COALESCE(receipt_date, created_at) DESC
+            ORDER BY event_ts DESC
             LIMIT 20
             """,
             conn,
         )
         conn.close()
-        db_date_range = db.get_date_range()
+        db_date_range = snapshot_stats['date_range']
 
         snapshot_col1, snapshot_col2, snapshot_col3 = st.columns(3)
-        snapshot_col1.metric(get_text("settings_db_receipts"), f"{int(receipt_count_df['c'].iloc[0]):,}")
-        snapshot_col2.metric(get_text("settings_db_line_items"), f"{int(line_count_df['c'].iloc[0]):,}")
+        snapshot_col1.metric(get_text("settings_db_receipts"), f"{int(snapshot_stats['receipts']):,}")
+        snapshot_col2.metric(get_text("settings_db_line_items"), f"{int(snapshot_stats['line_items']):,}")
         if db_date_range and db_date_range[0] and db_date_range[1]:
             snapshot_col3.metric(get_text("settings_db_range"), f"{db_date_range[0][:10]} -> {db_date_range[1][:10]}")
         else:
@@ -1980,6 +1752,20 @@ See `API_REFERENCE.md` for complete details, response examples, and curl command
             st.info(get_text("settings_no_receipts_preview"))
         else:
             st.dataframe(recent_receipts, use_container_width=True, hide_index=True)
+
+        st.markdown(f"**{get_text('settings_maintenance_log')}**")
+        maintenance_log = db.get_maintenance_log(10)
+        if maintenance_log.empty:
+            st.info(get_text("settings_no_maintenance"))
+        else:
+            st.dataframe(maintenance_log, use_container_width=True, hide_index=True)
+
+        st.markdown(f"**{get_text('settings_sync_runs')}**")
+        sync_runs = db.get_sync_runs(10)
+        if sync_runs.empty:
+            st.info(get_text("settings_no_sync_runs"))
+        else:
+            st.dataframe(sync_runs, use_container_width=True, hide_index=True)
     except Exception as e:
         st.warning(f"Snapshot unavailable: {str(e)}")
 
@@ -2210,52 +1996,17 @@ if sync_data:
     }
     set_sync_status("info", f"🔄 Syncing receipts from {sync_start_date} to {sync_end_date}")
     
-    # Handle precise timestamps for sync missing data
-    if st.session_state.get('is_sync_missing', False):
-        # For sync missing data, we need to get the precise timestamps
-        # Re-call get_smart_sync_range to get the exact UTC timestamps
-        start_date, end_date, message = get_smart_sync_range(db)
-        
-        # Get the precise timestamps from the database
-        date_range = db.get_date_range()
-        if date_range and date_range[1]:
-            latest_timestamp = date_range[1]
-            try:
-                # Parse the latest timestamp as UTC
-                if latest_timestamp.endswith('Z'):
-                    latest_utc = datetime.fromisoformat(latest_timestamp.replace('Z', '+00:00'))
-                else:
-                    latest_utc = datetime.fromisoformat(latest_timestamp)
-                
-                # Ensure it's timezone aware (UTC)
-                if latest_utc.tzinfo is None:
-                    latest_utc = pytz.UTC.localize(latest_utc)
-                elif latest_utc.tzinfo != pytz.UTC:
-                    latest_utc = latest_utc.astimezone(pytz.UTC)
-                
-                # Start from latest timestamp + 1 second to avoid duplicates
-                sync_start_datetime = latest_utc + timedelta(seconds=1)
-                sync_end_datetime = datetime.now(pytz.UTC)
-                api_start = sync_start_datetime
-                api_end = sync_end_datetime
-            except Exception as e:
-                # Fallback: use Bangkok calendar dates for API (same as custom sync)
-                api_start = sync_start_date
-                api_end = sync_end_date
-        else:
-            # Fallback: use Bangkok calendar dates for API
-            api_start = sync_start_date
-            api_end = sync_end_date
-        
-        # Clear the flag
-        st.session_state.is_sync_missing = False
-    else:
-        # For custom/range sync: user picks Bangkok calendar dates.
-        # Pass DATE objects so fetch_all_receipts converts Bangkok -> UTC correctly.
-        # (Previously we passed naive datetime and it was treated as UTC, missing
-        # 00:00-06:59 Bangkok and misaligning with POS export.)
-        api_start = sync_start_date
-        api_end = sync_end_date
+    # "Sync last date" is incremental: receipts created or changed since the
+    # stored updated_at watermark. Without a watermark it is a range sync.
+    incremental_since = db.get_receipts_watermark() if st.session_state.get('is_sync_missing', False) else None
+    st.session_state.is_sync_missing = False
+
+    # For custom/range sync: user picks Bangkok calendar dates.
+    # Pass DATE objects so they are converted Bangkok -> UTC correctly.
+    # (Previously we passed naive datetime and it was treated as UTC, missing
+    # 00:00-06:59 Bangkok and misaligning with POS export.)
+    api_start = sync_start_date
+    api_end = sync_end_date
     sync_report["api_range"] = {"start": str(api_start), "end": str(api_end)}
     
     # Check what's already in database for this range (DB stores UTC; we query by date strings)
@@ -2267,99 +2018,56 @@ if sync_data:
     existing_count = len(existing_df) if not existing_df.empty else 0
     sync_report["existing_count"] = existing_count
     
-    fetch_debug = {}
-    with st.spinner(f"Fetching receipts from API ({sync_start_date} to {sync_end_date})..."):
-        receipts = fetch_all_receipts(
-            LOYVERSE_TOKEN,
-            api_start,
-            api_end,
-            store_filter,
-            render_ui=False,
-            debug_sink=fetch_debug,
-        )
+    if incremental_since:
+        guardrail = None
+        sync_report["updated_since"] = incremental_since
+        with st.spinner(f"Fetching receipts updated since {incremental_since}..."):
+            fetch_debug = sync_updated_receipts(db, get_client(LOYVERSE_TOKEN), incremental_since)
+    else:
+        # Each page is deduplicated and saved in its own transaction while the next
+        # pages download, so memory stays at a few pages and a crash keeps what was written.
+        guardrail = ReceiptGuardrail(db, sync_start_date.isoformat(), sync_end_date.isoformat(), store_filter or None)
+        api_start_utc, api_end_utc = utc_bounds(api_start, api_end)
+        fetch_debug = {
+            "date_range_gmt7": {"start": str(api_start), "end": str(api_end)},
+            "api_range_utc": {
+                "start": api_start_utc.strftime("%Y-%m-%d %H:%M:%S"),
+                "end": api_end_utc.strftime("%Y-%m-%d %H:%M:%S"),
+            },
+            "store_filter": store_filter if store_filter else "All stores",
+        }
+        with st.spinner(f"Fetching receipts from API ({sync_start_date} to {sync_end_date})..."):
+            fetch_debug.update(stream_receipts_to_db(
+                db, get_client(LOYVERSE_TOKEN), api_start, api_end, guardrail, store_filter or None,
+                fresh=st.session_state.get("settings_sync_fresh", False),
+            ))
     sync_report["fetch_debug"] = fetch_debug
-    set_sync_status("info", f"🔍 Fetch completed: found {len(receipts) if receipts else 0} receipts.")
-    sync_report["fetched_count"] = len(receipts) if receipts else 0
+    fetched_count = fetch_debug["receipts_found"]
+    set_sync_status("info", f"🔍 Fetch completed: found {fetched_count} receipts.")
+    sync_report["fetched_count"] = fetched_count
     
-    if receipts:
-        # --- DEDUP GUARDRAILS ---
-        # Guardrail: never dedupe by (created_at + amount) alone because many
-        # legitimate receipts can share the same second and value.
-        conn = db.get_connection()
-        existing_core_query = """
-            SELECT receipt_id, receipt_number, store_id, created_at, receipt_date, total_money
-            FROM receipts
-            WHERE DATE(COALESCE(receipt_date, created_at)) >= ? AND DATE(COALESCE(receipt_date, created_at)) <= ?
-        """
-        query_params = [sync_start_date.isoformat(), sync_end_date.isoformat()]
-        if store_filter:
-            existing_core_query += " AND store_id = ?"
-            query_params.append(store_filter)
-        existing_core = pd.read_sql_query(existing_core_query, conn, params=query_params)
-        conn.close()
-
-        existing_receipt_ids = set(existing_core["receipt_id"].dropna().astype(str).tolist())
-        existing_number_keys = set(
-            zip(
-                existing_core["store_id"].fillna("").astype(str),
-                existing_core["receipt_number"].fillna("").astype(str),
-            )
-        )
-        existing_time_amount_store_keys = set(
-            zip(
-                existing_core["created_at"].fillna("").astype(str),
-                existing_core["total_money"].fillna(0).astype(float).round(2),
-                existing_core["store_id"].fillna("").astype(str),
-            )
-        )
-
-        unique_receipts = []
-        duplicate_by_id_count = 0
-        duplicate_by_number_count = 0
-        suspicious_time_amount_collisions = 0
-
-        for r in receipts:
-            receipt_id = str(r.get("id") or r.get("receipt_number") or "")
-            receipt_number = str(r.get("receipt_number") or "")
-            receipt_store = str(r.get("store_id") or "")
-            receipt_created = str(r.get("created_at") or "")
-            receipt_total = round(float(r.get("total_money", 0) or 0), 2)
-
-            if receipt_id and receipt_id in existing_receipt_ids:
-                duplicate_by_id_count += 1
-                continue
-
-            if receipt_number and (receipt_store, receipt_number) in existing_number_keys:
-                duplicate_by_number_count += 1
-                continue
-
-            # Guardrail signal only: we don't skip on this weak key.
-            if (receipt_created, receipt_total, receipt_store) in existing_time_amount_store_keys:
-                suspicious_time_amount_collisions += 1
-
-            unique_receipts.append(r)
-            if receipt_id:
-                existing_receipt_ids.add(receipt_id)
-            if receipt_number:
-                existing_number_keys.add((receipt_store, receipt_number))
-
-        skipped_duplicates = duplicate_by_id_count + duplicate_by_number_count
-        sync_report["duplicate_skips"] = skipped_duplicates
-        sync_report["duplicate_by_id"] = duplicate_by_id_count
-        sync_report["duplicate_by_receipt_number"] = duplicate_by_number_count
-        sync_report["collision_signals"] = suspicious_time_amount_collisions
-        # Save to database (INSERT OR REPLACE = merge/upsert)
-        saved_count = db.save_receipts(unique_receipts)
+    if fetched_count:
+        if guardrail is not None:
+            sync_report["duplicate_skips"] = guardrail.duplicates
+            sync_report["duplicate_by_id"] = guardrail.duplicate_by_id
+            sync_report["duplicate_by_receipt_number"] = guardrail.duplicate_by_number
+            sync_report["collision_signals"] = guardrail.collisions
+        saved_count = fetch_debug["saved_count"]
         db.update_sync_time('receipts', f"{saved_count} receipts")
+        if MAINTENANCE_AFTER_SYNC:
+            sync_report["maintenance"] = [
+                entry["task"]
+                for entry in db.run_scheduled_maintenance(tasks=IN_REQUEST_MAINTENANCE_TASKS, full_vacuum=False)
+            ]
         sync_report["saved_count"] = saved_count
-        sync_report["unique_receipts_count"] = len(unique_receipts)
+        sync_report["unique_receipts_count"] = fetch_debug.get("unique_count", saved_count)
 
         # Post-sync integrity guardrail: duplicate receipt numbers in range.
         conn = db.get_connection()
         dup_num_query = """
             SELECT store_id, receipt_number, COUNT(*) AS c
             FROM receipts
-            WHERE DATE(COALESCE(receipt_date, created_at)) >= ? AND DATE(COALESCE(receipt_date, created_at)) <= ?
+            WHERE business_day >= ? AND business_day <= ?
               AND receipt_number IS NOT NULL
             GROUP BY store_id, receipt_number
             HAVING c > 1
@@ -2396,7 +2104,7 @@ if sync_data:
             set_sync_status("success", f"✅ Sync completed. Updated {saved_count} receipts (no new data).")
         
         # Load ALL data from database (not just this date range)
-        df = db.get_receipts_dataframe()
+        df = db.load_receipts_snapshot()
         st.session_state.receipts_df = df
     else:
         set_sync_status("warning", f"⚠️ No receipts found in range {sync_start_date} to {sync_end_date}.")
@@ -2410,7 +2118,7 @@ if sync_data:
 # Load from database
 if load_db:
     # Load ALL data from database (not filtered by date range)
-    df = db.get_receipts_dataframe()
+    df = db.load_receipts_snapshot()
     
     if not df.empty:
         st.session_state.receipts_df = df
@@ -2430,11 +2138,17 @@ if st.session_state.selected_tab != SETTINGS_TAB and 'receipts_df' in st.session
     if not df.empty:
         # --- Data Cleaning ---
         df["date"] = pd.to_datetime(df["date"])
-        # Convert UTC timestamps to GMT+7 dates for proper display
-        df["day"] = df["date"].apply(lambda x: convert_utc_to_gmt7_date(x) if pd.notna(x) else None)
+        # Bangkok business day is stored at ingest; only rows missing it are converted here
+        df["day"] = pd.to_datetime(df["business_day"], errors="coerce").dt.date
+        missing_day = df["day"].isna() & df["date"].notna()
+        if missing_day.any():
+            df.loc[missing_day, "day"] = df.loc[missing_day, "date"].apply(convert_utc_to_gmt7_date)
         
         # Enrich with reference data (adds customer_name, payment_name, store_name, employee_name)
         df = ref_data.enrich_dataframe(df)
+        if customer_map and 'customer_name' in df.columns:
+            manual_names = df['customer_id'].map(customer_map)
+            df['customer_name'] = manual_names.fillna(df['customer_name'])
         
         # Apply quick date filter if set
         if 'view_start_date' in st.session_state and 'view_end_date' in st.session_state:
@@ -2500,6 +2214,7 @@ if st.session_state.selected_tab != SETTINGS_TAB and 'receipts_df' in st.session
         st.sidebar.subheader("Filters")
         
         # Location filter
+        selected_location = "All"
         if "location" in df.columns:
             unique_locations = sorted(df["location"].dropna().unique())
             selected_location = st.sidebar.selectbox("Location", ["All"] + list(unique_locations))
@@ -2561,6 +2276,7 @@ if st.session_state.selected_tab != SETTINGS_TAB and 'receipts_df' in st.session
                 "payment_name",
                 "location",
                 "receipt_total",
+                "signed_net_satang",
             ]:
                 if col in source_df.columns:
                     agg_map[col] = "first"
@@ -2570,7 +2286,10 @@ if st.session_state.selected_tab != SETTINGS_TAB and 'receipts_df' in st.session
             if "receipt_discount" in receipt_df_local.columns:
                 receipt_df_local["receipt_discount"] = receipt_df_local["receipt_discount"].fillna(0)
 
-            if (
+            if "signed_net" not in receipt_df_local.columns and "signed_net_satang" in receipt_df_local.columns:
+                # Stored at ingest as exact integer satang
+                receipt_df_local["signed_net"] = receipt_df_local["signed_net_satang"].fillna(0) / 100
+            elif (
                 "signed_net" not in receipt_df_local.columns
                 and {"receipt_total", "receipt_discount", "receipt_type"}.issubset(receipt_df_local.columns)
             ):
@@ -2650,14 +2369,48 @@ if st.session_state.selected_tab != SETTINGS_TAB and 'receipts_df' in st.session
                 "txn_gap": txn_gap,
             }
 
+        def load_summary_daily(start, end, store_id):
+            """
+            Per-day sales, items, receipts and customers from the daily_sales_summary
+            table, plus unique customers over the range; None when it has no rows.
+            """
+            by_customer = db.get_daily_summary(start, end, store_id, group_by=("business_day", "customer_id"))
+            if by_customer.empty:
+                return None, 0
+            by_customer["has_customer"] = by_customer["customer_id"] != ""
+            daily = by_customer.groupby("business_day", as_index=False).agg(
+                total_sales=("signed_net", "sum"),
+                items=("quantity", "sum"),
+                transactions=("receipt_count", "sum"),
+                customers=("has_customer", "sum"),
+            )
+            daily["day"] = pd.to_datetime(daily["business_day"]).dt.date
+            customers = int(by_customer.loc[by_customer["has_customer"], "customer_id"].nunique())
+            return daily[["day", "total_sales", "items", "transactions", "customers"]], customers
+
         receipt_df = build_receipt_frame(line_df)
         df = line_df
 
+        # Date and store views read the pre-aggregated daily summary; location and
+        # payment filters cut receipts by line, so those still aggregate the frame
+        summary_daily, summary_customers = None, 0
+        if selected_location == "All" and selected_payment == "All":
+            summary_daily, summary_customers = load_summary_daily(
+                st.session_state.get("view_start_date"),
+                st.session_state.get("view_end_date"),
+                None if selected_store == "All" else selected_store,
+            )
+
         # --- KPI Cards ---
-        kpi_summary = compute_sales_kpis(receipt_df, line_df)
-        total_sales = kpi_summary["total_sales"]
-        total_items = kpi_summary["total_items"]
-        unique_customers = kpi_summary["unique_customers"]
+        if summary_daily is not None:
+            total_sales = float(summary_daily["total_sales"].sum())
+            total_items = float(summary_daily["items"].sum())
+            unique_customers = summary_customers
+        else:
+            kpi_summary = compute_sales_kpis(receipt_df, line_df)
+            total_sales = kpi_summary["total_sales"]
+            total_items = kpi_summary["total_items"]
+            unique_customers = kpi_summary["unique_customers"]
         
         # Calculate bags per day
         if 'view_start_date' in st.session_state and 'view_end_date' in st.session_state:
@@ -2700,7 +2453,9 @@ if st.session_state.selected_tab != SETTINGS_TAB and 'receipts_df' in st.session
             st.markdown(f"### {get_text('key_metrics')}")
             
             # Calculate daily aggregations using receipt-level signed net
-            if receipt_day_sales is not None:
+            if summary_daily is not None:
+                daily_agg = summary_daily.copy()
+            elif receipt_day_sales is not None:
                 # Sales and transaction/customer counts from receipt-level data
                 sales_agg = receipt_day_sales.groupby("day", as_index=False).agg(
                     signed_net=("signed_net", "sum"),
@@ -2793,7 +2548,9 @@ if st.session_state.selected_tab != SETTINGS_TAB and 'receipts_df' in st.session
             st.markdown(f"### {get_text('sales_overview')}")
             
             # Bar chart - Full width using receipt-level signed net
-            if receipt_day_sales is not None:
+            if summary_daily is not None:
+                daily_sales = summary_daily[["day", "total_sales"]].rename(columns={"total_sales": "total"})
+            elif receipt_day_sales is not None:
                 daily_sales = (
                     receipt_day_sales.groupby("day", as_index=False)["signed_net"]
                     .sum()
@@ -2831,7 +2588,16 @@ if st.session_state.selected_tab != SETTINGS_TAB and 'receipts_df' in st.session
                     st.info("ℹ️ **No discounts found in the data**")
             
             # Line chart with hover details - receipt-level sales totals
-            if receipt_day_sales is not None:
+            if summary_daily is not None:
+                daily_details = summary_daily[["day", "total_sales", "items", "transactions"]].rename(
+                    columns={
+                        "day": "Date",
+                        "total_sales": "Total Sales",
+                        "items": "Items Sold",
+                        "transactions": "Transactions",
+                    }
+                )
+            elif receipt_day_sales is not None:
                 sales_details = receipt_day_sales.groupby("day", as_index=False).agg(
                     signed_net=("signed_net", "sum"),
                     bill_number=("bill_number", "nunique"),
@@ -2860,6 +2626,26 @@ if st.session_state.selected_tab != SETTINGS_TAB and 'receipts_df' in st.session
             fig2.update_traces(line_color='#3b82f6', line_width=2, marker=dict(size=5))
             fig2.update_layout(**CHART_LAYOUT, height=400)
             st.plotly_chart(fig2, use_container_width=True)
+
+            # Full-history monthly trend with year-over-year change, aggregated by the
+            # analytics engine (DuckDB over its Parquet snapshot, or SQLite) without
+            # loading history into pandas
+            with st.expander("Monthly Trend (full history, year over year)", expanded=False):
+                monthly = db.analytics_query(
+                    "monthly_trend", store_id=None if selected_store == "All" else selected_store
+                )
+                if monthly.empty:
+                    st.info("No receipts in the database yet.")
+                else:
+                    monthly["Month"] = pd.to_datetime(
+                        monthly["year"].astype(str) + "-" + monthly["month"].astype(str).str.zfill(2) + "-01"
+                    )
+                    fig_monthly = px.bar(monthly, x="Month", y="signed_net", title="Monthly Net Sales",
+                                         labels={"signed_net": "Net Sales"},
+                                         hover_data={"receipts": True, "yoy_change": ":.1%"})
+                    fig_monthly.update_traces(marker_color="#3b82f6")
+                    fig_monthly.update_layout(**CHART_LAYOUT, showlegend=False, height=400)
+                    st.plotly_chart(fig_monthly, use_container_width=True)
             
             st.markdown("---")
             
@@ -5215,11 +5001,14 @@ if st.session_state.selected_tab != SETTINGS_TAB and 'receipts_df' in st.session
                 conn = db.get_connection()
                 receipts_core = pd.read_sql_query(
                     """
-                    SELECT receipt_id, receipt_number, created_at, receipt_date, store_id, receipt_type,
-                           total_money, total_discount, source, dining_option
+                    SELECT receipt_id, receipt_number, created_at, receipt_date, business_day, store_id,
+                           receipt_type, total_money, total_discount, source, dining_option,
+                           signed_net_satang
                     FROM receipts
+                    WHERE business_day >= ? AND business_day <= ?
                     """,
                     conn,
+                    params=[recon_start.isoformat(), recon_end.isoformat()],
                 )
                 payments_map = pd.read_sql_query(
                     """
@@ -5236,15 +5025,11 @@ if st.session_state.selected_tab != SETTINGS_TAB and 'receipts_df' in st.session
                 out["created_at"] = pd.to_datetime(out["created_at"], utc=True, errors="coerce")
                 out["receipt_date"] = pd.to_datetime(out["receipt_date"], utc=True, errors="coerce")
                 out["event_ts"] = out["receipt_date"].fillna(out["created_at"])
-                out["day_bkk"] = out["event_ts"].dt.tz_convert("Asia/Bangkok").dt.date
-                out = out[(out["day_bkk"] >= recon_start) & (out["day_bkk"] <= recon_end)]
+                out["day_bkk"] = pd.to_datetime(out["business_day"]).dt.date
                 if selected_store_id:
                     out = out[out["store_id"] == selected_store_id]
                 out["receipt_net"] = out["total_money"].fillna(0) - out["total_discount"].fillna(0)
-                out["signed_net"] = out.apply(
-                    lambda x: -x["receipt_net"] if str(x["receipt_type"]).lower() == "refund" else x["receipt_net"],
-                    axis=1,
-                )
+                out["signed_net"] = out["signed_net_satang"].fillna(0) / 100
                 return out
 
             def _guardrail_import(receipts_payload):
@@ -5252,7 +5037,7 @@ if st.session_state.selected_tab != SETTINGS_TAB and 'receipts_df' in st.session
                 existing_core_query = """
                     SELECT receipt_id, receipt_number, store_id, created_at, receipt_date, total_money
                     FROM receipts
-                    WHERE DATE(COALESCE(receipt_date, created_at)) >= ? AND DATE(COALESCE(receipt_date, created_at)) <= ?
+                    WHERE business_day >= ? AND business_day <= ?
                 """
                 params = [recon_start.isoformat(), recon_end.isoformat()]
                 if selected_store_id:
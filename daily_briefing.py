@@ -1,7 +1,7 @@
 import os
 import json
 from datetime import datetime, date, timedelta
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple
 
 import pandas as pd
 import pytz
@@ -9,6 +9,7 @@ import requests
 from dotenv import load_dotenv
 
 from database import LoyverseDB
+from utils.async_ingest import ingest, save_ingest
 
 
 def get_bangkok_yesterday() -> Tuple[date, date]:
@@ -19,51 +20,15 @@ def get_bangkok_yesterday() -> Tuple[date, date]:
     return yesterday_bkk, yesterday_bkk
 
 
-def fetch_receipts_headless(
-    token: str,
-    start_date: date,
-    end_date: date,
-    store_id: Optional[str] = None,
-    limit: int = 250,
-) -> List[Dict]:
-    """Fetch receipts from Loyverse API for a date range (Bangkok -> UTC) without Streamlit UI."""
-    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-    base_url = "https://api.loyverse.com/v1.0/receipts"
-
-    # Convert Bangkok local date range to UTC timestamps expected by API
-    tz = pytz.timezone("Asia/Bangkok")
-    start_dt_utc = tz.localize(datetime.combine(start_date, datetime.min.time())).astimezone(pytz.UTC)
-    end_dt_utc = tz.localize(datetime.combine(end_date, datetime.max.time())).astimezone(pytz.UTC)
-
-    params: Dict[str, str] = {
-        "created_at_min": start_dt_utc.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
-        "created_at_max": end_dt_utc.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
-        "limit": limit,
-    }
-    if store_id:
-        params["store_id"] = store_id
-
-    all_receipts: List[Dict] = []
-    cursor: Optional[str] = None
-
-    while True:
-        if cursor:
-            params["cursor"] = cursor
-        res = requests.get(base_url, headers=headers, params=params, timeout=60)
-        if res.status_code != 200:
-            raise RuntimeError(f"Loyverse API error {res.status_code}: {res.text}")
-        data = res.json() if res.text else {}
-        batch = data.get("receipts", [])
-        all_receipts.extend(batch)
-        cursor = data.get("cursor")
-        if not cursor:
-            break
-
-    return all_receipts
-
-
 def compute_signed_net(df: pd.DataFrame) -> Tuple[pd.DataFrame, float]:
     """Compute receipt-level signed net and attach to rows; returns (df_with_signed, total_sales)."""
+    if {"bill_number", "signed_net_satang"}.issubset(df.columns):
+        # Stored at ingest as exact integer satang
+        receipt_level = df.groupby("bill_number", as_index=False)["signed_net_satang"].first()
+        total_sales = int(receipt_level["signed_net_satang"].fillna(0).sum()) / 100
+        receipt_level["signed_net"] = receipt_level["signed_net_satang"].fillna(0) / 100
+        df_with = df.merge(receipt_level[["bill_number", "signed_net"]], on="bill_number", how="left")
+        return df_with, total_sales
     if {"bill_number", "receipt_total", "receipt_discount", "receipt_type"}.issubset(df.columns):
         receipt_level = df.groupby(["bill_number", "receipt_type"], as_index=False).agg(
             {"receipt_total": "first", "receipt_discount": "first"}
@@ -83,6 +48,27 @@ def compute_signed_net(df: pd.DataFrame) -> Tuple[pd.DataFrame, float]:
     return df, total_sales
 
 
+def load_customer_daily_sales(db: LoyverseDB, chunk_size: int = 50000) -> pd.DataFrame:
+    """Receipt-grain signed net per customer and Bangkok day, streamed in chunks."""
+    columns = ["business_day", "customer_id", "signed_net_satang"]
+    partials = []
+    for chunk in db.iter_receipts(columns=columns, chunk_size=chunk_size):
+        chunk = chunk[chunk["customer_id"].notna() & chunk["business_day"].notna()]
+        if chunk.empty:
+            continue
+        partials.append(chunk.groupby(["customer_id", "business_day"], as_index=False)["signed_net_satang"].sum())
+    if not partials:
+        return pd.DataFrame(columns=["customer_id", "day", "signed_net"])
+    daily = (
+        pd.concat(partials, ignore_index=True)
+        .groupby(["customer_id", "business_day"], as_index=False)["signed_net_satang"]
+        .sum()
+    )
+    daily["signed_net"] = daily["signed_net_satang"] / 100
+    daily["day"] = pd.to_datetime(daily["business_day"])
+    return daily.drop(columns=["business_day", "signed_net_satang"])
+
+
 def categorize_product(product_name: str, manual_categories: Dict[str, str] = None) -> str:
     """Map item name to ice categories, using manual overrides first."""
     if pd.isna(product_name):
@@ -238,13 +224,23 @@ def main() -> None:
     start_date, end_date = get_bangkok_yesterday()
     report_date = start_date
 
-    # Fetch and sync yesterday's receipts
+    # Fetch yesterday's receipts and the customers changed since the last run (for names) concurrently
     if loyverse_token:
-        receipts = fetch_receipts_headless(loyverse_token, start_date, end_date)
+        customers_since = db.get_customers_watermark()
+        result = ingest(
+            loyverse_token, start_date, end_date, endpoints=("customers",),
+            endpoint_params={"customers": {"updated_at_min": customers_since}} if customers_since else None,
+        )
+        for task, error in result.errors.items():
+            print(f"⚠️ Error fetching {task}: {error}")
+        save_ingest(db, result)
+        newest_customer = max((c.get("updated_at") or "" for c in result.data.get("customers", [])), default="")
+        if "customers" not in result.errors and newest_customer > (customers_since or ""):
+            db.set_customers_watermark(newest_customer)
+        receipts = result.data.get("receipts", [])
         if receipts:
-            db.save_receipts(receipts)
             db.update_sync_time("receipts", f"{len(receipts)} receipts")
-            print(f"✅ Fetched {len(receipts)} receipts for {report_date}")
+            print(f"✅ Fetched {len(receipts)} receipts for {report_date} in {result.total_seconds:.1f}s")
     else:
         print("⚠️ No LOYVERSE_TOKEN, using existing database data")
 
@@ -275,13 +271,8 @@ def main() -> None:
         return
 
     # Compute signed net and totals
-    # Convert dates from UTC to Bangkok timezone (handles both aware and naive datetimes)
-    df_dates = pd.to_datetime(df["date"])
-    if df_dates.dt.tz is None:
-        # If naive, assume UTC (Loyverse stores in UTC)
-        df_dates = df_dates.dt.tz_localize("UTC")
-    df["day"] = df_dates.dt.tz_convert("Asia/Bangkok").dt.date
-    df["day"] = pd.to_datetime(df["day"])  # for grouping in decline logic
+    # Bangkok business day is stored on each receipt at ingest
+    df["day"] = pd.to_datetime(df["business_day"])  # for grouping in decline logic
     df, total_sales = compute_signed_net(df)
     total_items = float(df["quantity"].sum()) if "quantity" in df.columns else 0.0
     transactions = int(df["bill_number"].nunique()) if "bill_number" in df.columns else 0
@@ -308,25 +299,16 @@ def main() -> None:
     # Customer decline alerts (top 20 by spend)
     alerts: List[Dict[str, str]] = []
     
-    # Build per-customer metrics from all available data (load wider window for alerts)
-    df_alert = db.get_receipts_dataframe()
-    if not df_alert.empty:
-        # Convert dates from UTC to Bangkok timezone (handles both aware and naive datetimes)
-        df_alert_dates = pd.to_datetime(df_alert["date"])
-        if df_alert_dates.dt.tz is None:
-            # If naive, assume UTC (Loyverse stores in UTC)
-            df_alert_dates = df_alert_dates.dt.tz_localize("UTC")
-        df_alert["day"] = df_alert_dates.dt.tz_convert("Asia/Bangkok")  # convert to Bangkok time
-        df_alert, _ = compute_signed_net(df_alert)
-        
+    # Build per-customer metrics from all available data (load wider window for alerts).
+    # Stream receipt-level rows so full history is processed in bounded memory.
+    customer_days = load_customer_daily_sales(db)
+    if not customer_days.empty:
         # Get top customers by total spend
-        top_spend = (
-            df_alert.groupby("customer_id").agg(total_spent=("signed_net" if "signed_net" in df_alert.columns else "line_total", "sum"))
-        )
+        top_spend = customer_days.groupby("customer_id").agg(total_spent=("signed_net", "sum"))
         top_ids = list(top_spend.sort_values("total_spent", ascending=False).head(20).index)
         
         for cid in top_ids:
-            cust_df = df_alert[df_alert["customer_id"] == cid].copy()
+            cust_df = customer_days[customer_days["customer_id"] == cid].copy()
             cust_df = cust_df.sort_values("day")
             
             # Daily report: compare same day of week
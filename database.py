@@ -1,13 +1,440 @@
 """
 Database module for persistent local storage of Loyverse data
 """
+import os
 import sqlite3
+import threading
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import hashlib
+import itertools
 import json
+import time
+import zlib
+from contextlib import contextmanager
+from decimal import Decimal, ROUND_HALF_UP
+
+from utils.sync_dates import bangkok_local_parts
+
+# Pragmas applied to every pooled connection. WAL lets dashboard reads run while
+# a sync is writing; mmap_size serves reads straight from the OS page cache.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -20000,  # ~20 MB page cache per connection
+    'mmap_size': 268435456,  # 256 MB memory-mapped read path
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,  # ms to wait on a writer lock before failing
+}
+
+# Idle connections kept per database file
+POOL_MAX_IDLE = 4
+
+# Statements slower than this (ms) get their query plan written to query_log
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '250'))
+
+# query_log rows kept
+QUERY_LOG_KEPT = 500
+
+# Tables whose row counts get_database_stats reports, kept in table_stats
+STATS_TABLES = (
+    'customers', 'receipts', 'line_items', 'payment_types',
+    'stores', 'employees', 'categories', 'items',
+)
+
+# Loyverse metadata tables and their key column; rows carry a content_hash
+METADATA_TABLES = {
+    'customers': 'customer_id',
+    'payment_types': 'payment_type_id',
+    'stores': 'store_id',
+    'employees': 'employee_id',
+    'categories': 'category_id',
+    'items': 'item_id',
+}
+
+# UUID columns that also carry an integer surrogate key from uuid_keys:
+# table -> {uuid column: entity}. The key column is the uuid column with _id -> _key.
+SURROGATE_KEY_COLUMNS = {
+    'receipts': {'store_id': 'store', 'customer_id': 'customer', 'employee_id': 'employee'},
+    'line_items': {'item_id': 'item', 'variant_id': 'variant'},
+    'payments': {'payment_type_id': 'payment_type'},
+    'items': {'item_id': 'item'},
+}
+
+# Bump when the get_receipts_dataframe columns change so old snapshots are rebuilt
+SNAPSHOT_FORMAT = 3
+
+# Change-log entries kept for incremental snapshot refresh
+DATA_CHANGES_KEPT = 1000
+
+# Raw API payloads are stored compressed in raw_payloads, zstd when available
+try:
+    import zstandard
+    RAW_PAYLOAD_CODEC = 'zstd'
+except ImportError:
+    zstandard = None
+    RAW_PAYLOAD_CODEC = 'zlib'
+
+# Maintenance tasks and how often the scheduled run repeats them (hours; 0 = every run)
+MAINTENANCE_INTERVALS = {
+    'optimize': 0,
+    'analyze': 24,
+    'vacuum': 24,
+    'integrity': 24 * 7,
+}
+
+# Run the scheduled maintenance after each receipts sync (set to 0 to disable)
+MAINTENANCE_AFTER_SYNC = os.getenv('MAINTENANCE_AFTER_SYNC', '1') != '0'
+
+# Tasks cheap enough to run inside a dashboard request after a sync; the
+# integrity check and the one-time full VACUUM are left to the worker/script
+IN_REQUEST_MAINTENANCE_TASKS = ('optimize', 'analyze', 'vacuum')
+
+# Maintenance log entries kept
+MAINTENANCE_LOG_KEPT = 200
+
+# Range sync runs whose shard checkpoints are kept in sync_runs
+SYNC_RUNS_KEPT = 50
+
+# Unfinished range sync runs started longer ago than this are not resumed (hours)
+SYNC_RESUME_MAX_HOURS = float(os.getenv('SYNC_RESUME_MAX_HOURS', '6'))
+
+# sync_metadata key holding the newest receipt updated_at seen by the incremental sync
+RECEIPTS_WATERMARK_KEY = 'receipts_updated_at'
+
+# sync_metadata key holding the newest customer updated_at fetched by the daily briefing
+CUSTOMERS_WATERMARK_KEY = 'customers_updated_at'
+
+# sync_metadata key recording that inline raw_data columns were moved to raw_payloads
+RAW_PAYLOADS_MIGRATED_KEY = 'raw_payloads_migrated'
+
+# Heavy long-history aggregations run in DuckDB over a receipt-grain Parquet snapshot when available
+try:
+    import duckdb
+    ANALYTICS_ENGINE = 'duckdb'
+except ImportError:
+    duckdb = None
+    ANALYTICS_ENGINE = 'sqlite'
+
+# Hot tables whose inline raw_data column moved to raw_payloads: table -> (entity, id column)
+RAW_PAYLOAD_TABLES = {
+    'receipts': ('receipt', 'receipt_id'),
+    'customers': ('customer', 'customer_id'),
+    'stores': ('store', 'store_id'),
+    'employees': ('employee', 'employee_id'),
+}
+
+
+def summarize_payments(payments):
+    """
+    Receipt-level payment summary row values: (payment_type_ids, payment_names,
+    is_split, payment_count, amounts_by_type JSON, total_paid). IDs and names
+    are joined with '+' in payment order, the same shape as bill_type, so the
+    Nth name belongs to the Nth ID. Payments without a payment_type_id are left
+    out of both lists and amounts_by_type (an empty segment would read as an
+    unknown payment type) but still count toward payment_count and total_paid.
+    """
+    if not payments:
+        return None, None, 0, 0, None, 0.0
+    typed = [p for p in payments if p.get('payment_type_id')]
+    type_ids = [str(p['payment_type_id']) for p in typed]
+    names = [str(p.get('name') or p.get('type') or 'Unknown') for p in typed]
+    amounts = {}
+    for payment in typed:
+        type_id = str(payment['payment_type_id'])
+        amounts[type_id] = amounts.get(type_id, 0.0) + float(payment.get('money_amount') or 0)
+    return (
+        '+'.join(type_ids) or None,
+        '+'.join(names) or None,
+        int(len(payments) > 1),
+        len(payments),
+        json.dumps(amounts),
+        sum(float(payment.get('money_amount') or 0) for payment in payments),
+    )
+
+
+def surrogate_column(uuid_column):
+    """Integer key column stored next to a UUID column (store_id -> store_key)"""
+    return uuid_column[:-len('_id')] + '_key'
+
+
+def to_satang(amount):
+    """Baht amount -> exact integer satang (half rounds away from zero); None stays None"""
+    if amount is None or amount == '':
+        return None
+    return int(Decimal(str(amount)).scaleb(2).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def signed_net_satang(total_satang, discount_satang, receipt_type):
+    """Receipt signed net in satang: total - discount, negated for refunds"""
+    net = (total_satang or 0) - (discount_satang or 0)
+    return -net if str(receipt_type or '').lower() == 'refund' else net
+
+
+def content_hash(obj):
+    """Stable digest of an API object, used to skip rewriting unchanged rows"""
+    encoded = json.dumps(obj, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+def compress_payload(obj):
+    """Serialize an API payload to JSON and compress it with RAW_PAYLOAD_CODEC"""
+    data = json.dumps(obj).encode('utf-8')
+    if RAW_PAYLOAD_CODEC == 'zstd':
+        return zstandard.ZstdCompressor(level=6).compress(data)
+    return zlib.compress(data, 6)
+
+
+def decompress_payload(codec, payload):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed payloads")
+        data = zstandard.ZstdDecompressor().decompress(payload)
+    else:
+        data = zlib.decompress(payload)
+    return json.loads(data.decode('utf-8'))
+
+
+def normalize_sql(sql):
+    """Collapse whitespace so the same statement aggregates under one key"""
+    return ' '.join(sql.split())
+
+
+class QueryStats:
+    """Process-wide per-statement latency and row counters for one pool"""
+
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS):
+        self.slow_query_ms = slow_query_ms
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, sql, seconds, rows, executions=1):
+        with self._lock:
+            entry = self._stats.setdefault(sql, [0, 0.0, 0.0, 0])
+            entry[0] += executions
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            entry[3] += rows
+
+    def snapshot(self, top=None):
+        """Statements ordered by total time spent"""
+        with self._lock:
+            items = list(self._stats.items())
+        rows = [
+            {
+                'sql': sql,
+                'calls': calls,
+                'total_ms': total * 1000,
+                'max_ms': worst * 1000,
+                'avg_ms': (total / calls * 1000) if calls else 0.0,
+                'rows': rows,
+            }
+            for sql, (calls, total, worst, rows) in items
+        ]
+        rows.sort(key=lambda row: row['total_ms'], reverse=True)
+        return rows[:top] if top else rows
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor that records latency and row counts per statement. Time spent in
+    fetch calls is added to the statement that produced the rows; once a
+    statement passes the slow threshold its query plan is queued on the
+    connection and written to query_log when the connection is released.
+    """
+    _sql = None
+    _params = None
+    _elapsed = 0.0
+    _logged = True
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._begin(sql, parameters, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._begin(sql, None, time.perf_counter() - start)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(time.perf_counter() - start, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(time.perf_counter() - start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(time.perf_counter() - start, len(rows))
+        return rows
+
+    def _stats(self):
+        pool = getattr(self.connection, 'pool', None)
+        return pool.query_stats if pool is not None else None
+
+    def _begin(self, sql, parameters, seconds):
+        stats = self._stats()
+        if stats is None:
+            return
+        self._sql = normalize_sql(sql)
+        self._params = parameters
+        self._elapsed = seconds
+        self._logged = False
+        # DML reports affected rows up front; SELECT rows are counted as they are fetched
+        stats.record(self._sql, seconds, max(self.rowcount, 0))
+        self._check_slow(stats)
+
+    def _fetched(self, seconds, rows):
+        stats = self._stats()
+        if stats is None or self._sql is None:
+            return
+        self._elapsed += seconds
+        stats.record(self._sql, seconds, rows, executions=0)
+        self._check_slow(stats)
+
+    def _check_slow(self, stats):
+        if self._logged or self._elapsed * 1000 < stats.slow_query_ms:
+            return
+        self._logged = True
+        self.connection.queue_slow_query(self._sql, self._params, self._elapsed)
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool"""
+    pool = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def queue_slow_query(self, sql, parameters, seconds):
+        """Capture the plan of a slow statement; it is logged on release"""
+        plan = None
+        if sql.split(' ', 1)[0].upper() in ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE'):
+            try:
+                explain = sqlite3.Cursor(self)
+                explain.execute(f"EXPLAIN QUERY PLAN {sql}", parameters or ())
+                plan = '\n'.join(row[-1] for row in explain.fetchall())
+            except sqlite3.Error:
+                pass
+        if not hasattr(self, '_slow_queries'):
+            self._slow_queries = []
+        params = None if parameters is None else json.dumps(list(parameters), default=str)
+        self._slow_queries.append((
+            datetime.now().isoformat(), sql, params, seconds * 1000, plan,
+        ))
+
+    def _write_slow_queries(self):
+        pending = getattr(self, '_slow_queries', None)
+        if not pending:
+            return
+        self._slow_queries = []
+        try:
+            writer = sqlite3.Cursor(self)
+            writer.executemany("""
+                INSERT INTO query_log (logged_at, sql, params, duration_ms, plan)
+                VALUES (?, ?, ?, ?, ?)
+            """, pending)
+            writer.execute(
+                "DELETE FROM query_log WHERE id <= (SELECT MAX(id) FROM query_log) - ?",
+                (QUERY_LOG_KEPT,),
+            )
+            self.commit()
+        except sqlite3.Error:
+            # Logging must never break the caller (e.g. the table does not exist yet)
+            if self.in_transaction:
+                self.rollback()
+
+    def close(self):
+        # Match sqlite3 close(): uncommitted work is discarded, never leaked to the next user
+        if self.in_transaction:
+            self.rollback()
+        self._write_slow_queries()
+        if self.pool is None or not self.pool.release(self):
+            super().close()
+
+    def dispose(self):
+        """Really close the underlying connection"""
+        super().close()
+
+
+class ConnectionPool:
+    """Process-wide pool of tuned connections to one SQLite file"""
+
+    def __init__(self, db_path, pragmas, max_idle=POOL_MAX_IDLE):
+        self.db_path = db_path
+        self.pragmas = pragmas
+        self.max_idle = max_idle
+        self.query_stats = QueryStats()
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        conn = sqlite3.connect(self.db_path, factory=PooledConnection, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        conn.pool = self
+        return conn
+
+    def release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return True
+        return False
+
+    def dispose(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.dispose()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+# get_database_stats results per database file: db_path -> ((stats version, last_updated), stats)
+_stats_cache = {}
+
+
+def get_pool(db_path, pragmas):
+    """Return the shared pool for a database file and pragma set"""
+    key = (db_path, tuple(sorted(pragmas.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(db_path, pragmas)
+            _pools[key] = pool
+        return pool
+
 
 class LoyverseDB:
-    def __init__(self, db_path=None):
+    def __init__(self, db_path=None, pragmas=None):
+        # Connection tuning; callers can override or add any SQLite pragma
+        self.pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
         # Use persistent disk path if available, otherwise local path
         if db_path is None:
             import os
@@ -31,19 +458,22 @@ class LoyverseDB:
         else:
             self.db_path = db_path
             print(f"📁 Using specified database: {self.db_path}")
+        self.last_ingest_stats = None
+        # {table: {'inserted', 'updated', 'unchanged'}} from the latest metadata saves
+        self.last_metadata_stats = {}
         self.init_database()
     
     def get_connection(self):
-        """Create a database connection"""
+        """Check out a pooled database connection (close() returns it to the pool)"""
         try:
-            return sqlite3.connect(self.db_path)
+            return get_pool(self.db_path, self.pragmas).acquire()
         except sqlite3.OperationalError as e:
             if "unable to open database file" in str(e):
                 # Try to create the directory and file
                 import os
                 try:
                     os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
-                    return sqlite3.connect(self.db_path)
+                    return get_pool(self.db_path, self.pragmas).acquire()
                 except Exception as create_error:
                     print(f"❌ Error creating database directory: {create_error}")
                     # If we're using persistent disk path, try fallback to local
@@ -53,7 +483,7 @@ class LoyverseDB:
                         try:
                             self.db_path = fallback_path
                             print(f"✅ Switched to fallback database: {self.db_path}")
-                            return sqlite3.connect(self.db_path)
+                            return get_pool(self.db_path, self.pragmas).acquire()
                         except Exception as fallback_error:
                             print(f"❌ Fallback database also failed: {fallback_error}")
                     # Last resort: in-memory database
@@ -62,6 +492,10 @@ class LoyverseDB:
             else:
                 raise e
     
+    def close_connections(self):
+        """Close this database file's idle pooled connections"""
+        get_pool(self.db_path, self.pragmas).dispose()
+    
     def init_database(self):
         """Initialize database tables"""
         try:
@@ -85,7 +519,8 @@ class LoyverseDB:
                 first_visit TEXT,
                 last_visit TEXT,
                 last_updated TEXT,
-                raw_data TEXT
+                raw_data TEXT,
+                content_hash TEXT
             )
         """)
         
@@ -108,10 +543,30 @@ class LoyverseDB:
                 dining_option TEXT,
                 location TEXT,
                 raw_data TEXT,
-                last_updated TEXT
+                last_updated TEXT,
+                event_ts TEXT,
+                business_day TEXT,
+                local_hour INTEGER,
+                local_weekday INTEGER
             )
         """)
         
+        # Stored Bangkok business-day columns (added after the first release)
+        self._ensure_columns(cursor, 'receipts', {
+            'event_ts': 'TEXT',
+            'business_day': 'TEXT',
+            'local_hour': 'INTEGER',
+            'local_weekday': 'INTEGER',
+            'content_hash': 'TEXT',
+        })
+        # Exact money in integer satang (1/100 baht); signed net is negated for refunds
+        self._ensure_columns(cursor, 'receipts', {
+            'total_money_satang': 'INTEGER',
+            'total_tax_satang': 'INTEGER',
+            'total_discount_satang': 'INTEGER',
+            'signed_net_satang': 'INTEGER',
+        })
+        
         # Line items table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS line_items (
@@ -129,10 +584,17 @@ class LoyverseDB:
             )
         """)
         
+        self._ensure_columns(cursor, 'line_items', {
+            'price_satang': 'INTEGER',
+            'total_money_satang': 'INTEGER',
+            'cost_satang': 'INTEGER',
+        })
+        
         # Payments table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS payments (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payment_key TEXT,
                 receipt_id TEXT,
                 payment_type_id TEXT,
                 payment_name TEXT,
@@ -142,6 +604,24 @@ class LoyverseDB:
                 FOREIGN KEY (receipt_id) REFERENCES receipts(receipt_id)
             )
         """)
+        # Payments are keyed '<receipt_id>:<ordinal>' so a resync upserts in place
+        self._ensure_columns(cursor, 'payments', {'payment_key': 'TEXT'})
+        self._backfill_payment_keys(cursor)
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_payments_key ON payments(payment_key)")
+        
+        # One row per receipt summarizing its payments, so readers join 1:1
+        # instead of multiplying rows per payment and collapsing them again
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS receipt_payment_summary (
+                receipt_id TEXT PRIMARY KEY,
+                payment_type_ids TEXT,
+                payment_names TEXT,
+                is_split INTEGER,
+                payment_count INTEGER,
+                amounts_by_type TEXT,
+                total_paid REAL
+            )
+        """)
         
         # Metadata table for tracking last sync
         cursor.execute("""
@@ -158,7 +638,8 @@ class LoyverseDB:
                 payment_type_id TEXT PRIMARY KEY,
                 name TEXT,
                 type TEXT,
-                last_updated TEXT
+                last_updated TEXT,
+                content_hash TEXT
             )
         """)
         
@@ -173,7 +654,8 @@ class LoyverseDB:
                 country TEXT,
                 phone TEXT,
                 last_updated TEXT,
-                raw_data TEXT
+                raw_data TEXT,
+                content_hash TEXT
             )
         """)
         
@@ -185,7 +667,8 @@ class LoyverseDB:
                 email TEXT,
                 phone TEXT,
                 last_updated TEXT,
-                raw_data TEXT
+                raw_data TEXT,
+                content_hash TEXT
             )
         """)
         
@@ -195,7 +678,8 @@ class LoyverseDB:
                 category_id TEXT PRIMARY KEY,
                 name TEXT,
                 color TEXT,
-                last_updated TEXT
+                last_updated TEXT,
+                content_hash TEXT
             )
         """)
         
@@ -210,10 +694,33 @@ class LoyverseDB:
                 price REAL,
                 cost REAL,
                 last_updated TEXT,
+                content_hash TEXT,
                 FOREIGN KEY (category_id) REFERENCES categories(category_id)
             )
         """)
         
+        # Metadata rows are only rewritten when their API payload hash changes
+        for table in METADATA_TABLES:
+            self._ensure_columns(cursor, table, {'content_hash': 'TEXT'})
+        
+        # Dictionary of UUIDs to compact integer keys; fact tables store the
+        # keys next to the UUIDs and joins compare integers
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS uuid_keys (
+                key INTEGER PRIMARY KEY,
+                entity TEXT NOT NULL,
+                uuid TEXT NOT NULL,
+                UNIQUE (entity, uuid)
+            )
+        """)
+        for table, uuid_columns in SURROGATE_KEY_COLUMNS.items():
+            self._ensure_columns(cursor, table, {
+                surrogate_column(column): 'INTEGER' for column in uuid_columns
+            })
+        self._backfill_surrogate_keys(cursor)
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_items_key ON items(item_key)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_line_items_item_key ON line_items(item_key)")
+        
         # Manual product categories table (user overrides)
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS manual_product_categories (
@@ -224,6 +731,131 @@ class LoyverseDB:
             )
         """)
         
+        # Daily sales summary (receipt grain rolled up per Bangkok day x store x
+        # location x payment type x customer), maintained by the save/delete paths
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS daily_sales_summary (
+                business_day TEXT NOT NULL,
+                store_id TEXT NOT NULL,
+                location TEXT NOT NULL,
+                payment_type_ids TEXT NOT NULL,
+                customer_id TEXT NOT NULL,
+                signed_net REAL,
+                gross_sales REAL,
+                refunds REAL,
+                discount REAL,
+                receipt_count INTEGER,
+                quantity REAL,
+                PRIMARY KEY (business_day, store_id, location, payment_type_ids, customer_id)
+            )
+        """)
+        
+        # Compressed raw API payloads, kept out of the hot tables' pages
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS raw_payloads (
+                entity TEXT NOT NULL,
+                entity_id TEXT NOT NULL,
+                codec TEXT NOT NULL,
+                payload BLOB,
+                PRIMARY KEY (entity, entity_id)
+            )
+        """)
+        
+        # Data versions: bumped by every write so caches (e.g. the receipts
+        # snapshot) know when they are stale
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS data_versions (
+                scope TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                last_updated TEXT
+            )
+        """)
+        cursor.execute("INSERT OR IGNORE INTO data_versions (scope, version, last_updated) VALUES ('receipts', 0, NULL)")
+        cursor.execute("INSERT OR IGNORE INTO data_versions (scope, version, last_updated) VALUES ('stats', 0, NULL)")
+        cursor.execute("INSERT OR IGNORE INTO data_versions (scope, version, last_updated) VALUES ('metadata', 0, NULL)")
+        
+        # Business days touched by each receipts version (NULL day = everything changed)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS data_changes (
+                version INTEGER NOT NULL,
+                business_day TEXT
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_data_changes_version ON data_changes(version)")
+        
+        # Row counts (and the receipts created_at range) maintained by the write
+        # paths so get_database_stats never scans whole tables
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS table_stats (
+                table_name TEXT PRIMARY KEY,
+                row_count INTEGER NOT NULL,
+                min_value TEXT,
+                max_value TEXT,
+                updated_at TEXT
+            )
+        """)
+        
+        # Statements that crossed SLOW_QUERY_MS, with their query plan
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS query_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                logged_at TEXT,
+                sql TEXT,
+                params TEXT,
+                duration_ms REAL,
+                plan TEXT
+            )
+        """)
+        
+        # ANALYZE / VACUUM / integrity runs with page counts before and after
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS maintenance_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at TEXT,
+                task TEXT,
+                duration_ms REAL,
+                pages_before INTEGER,
+                pages_after INTEGER,
+                freelist_before INTEGER,
+                freelist_after INTEGER,
+                result TEXT
+            )
+        """)
+        
+        # Range sync checkpoints: one row per shard with the last committed cursor
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sync_runs (
+                run_id INTEGER NOT NULL,
+                range_start TEXT NOT NULL,
+                range_end TEXT NOT NULL,
+                store_id TEXT NOT NULL DEFAULT '',
+                shard_start TEXT NOT NULL,
+                shard_end TEXT NOT NULL,
+                cursor TEXT,
+                pages_done INTEGER NOT NULL DEFAULT 0,
+                receipts_done INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'pending',
+                error TEXT,
+                started_at TEXT,
+                updated_at TEXT,
+                PRIMARY KEY (run_id, shard_start)
+            )
+        """)
+        
+        # Closed months moved out to per-month partition files (see archive_month)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS archive_partitions (
+                month TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                receipt_count INTEGER NOT NULL,
+                line_item_count INTEGER NOT NULL,
+                archived_at TEXT,
+                min_created_at TEXT,
+                max_created_at TEXT
+            )
+        """)
+        self._ensure_columns(cursor, 'archive_partitions', {'min_created_at': 'TEXT', 'max_created_at': 'TEXT'})
+        
         # Create indexes for better performance
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_receipts_date ON receipts(receipt_date)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_receipts_store ON receipts(store_id)")
@@ -233,11 +865,245 @@ class LoyverseDB:
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_line_items_item ON line_items(item_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_receipt ON payments(receipt_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_items_category ON items(category_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_receipts_business_day ON receipts(business_day, store_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_receipts_event_ts ON receipts(event_ts)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_receipts_local_time ON receipts(local_weekday, local_hour)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_receipts_store_number ON receipts(store_id, receipt_number)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_receipts_customer ON receipts(customer_id)")
+        
+        self._backfill_satang(cursor)
+        self._backfill_business_days(cursor)
+        self._backfill_payment_summary(cursor)
+        
+        # One-time build of the daily summary for databases that predate it
+        cursor.execute("SELECT 1 FROM daily_sales_summary LIMIT 1")
+        if cursor.fetchone() is None:
+            cursor.execute("SELECT 1 FROM receipts LIMIT 1")
+            if cursor.fetchone() is not None:
+                self._rebuild_daily_summary(cursor)
+                print("🔧 Built daily sales summary from existing receipts")
+        
+        # One-time count for databases that predate table_stats
+        cursor.execute("SELECT COUNT(*) FROM table_stats")
+        if cursor.fetchone()[0] < len(STATS_TABLES):
+            self._refresh_table_stats(cursor)
+        
+        # One-time move of inline raw_data; recorded so later inits skip the table scans
+        cursor.execute("SELECT 1 FROM sync_metadata WHERE key = ?", (RAW_PAYLOADS_MIGRATED_KEY,))
+        if cursor.fetchone() is None:
+            moved = self._migrate_raw_payloads(cursor)
+            cursor.execute("""
+                INSERT OR REPLACE INTO sync_metadata (key, value, last_updated)
+                VALUES (?, ?, ?)
+            """, (RAW_PAYLOADS_MIGRATED_KEY, str(moved), datetime.now().isoformat()))
+            if moved:
+                # The freed pages are returned to the OS by the maintenance vacuum
+                print(f"🔧 Moved {moved} raw payloads to raw_payloads; run scripts/db_maintenance.py to compact")
         
         conn.commit()
         conn.close()
         print(f"✅ Database tables initialized successfully for: {self.db_path}")
     
+    def _ensure_columns(self, cursor, table, columns):
+        """Add any missing columns to an existing table"""
+        cursor.execute(f"PRAGMA table_info({table})")
+        existing = {row[1] for row in cursor.fetchall()}
+        for name, col_type in columns.items():
+            if name not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {col_type}")
+                print(f"🔧 Added column {table}.{name}")
+    
+    def _backfill_business_days(self, cursor):
+        """One-time migration: fill Bangkok business-day columns for receipts saved before they existed"""
+        cursor.execute("""
+            SELECT receipt_id, COALESCE(receipt_date, created_at)
+            FROM receipts
+            WHERE business_day IS NULL AND COALESCE(receipt_date, created_at) IS NOT NULL
+        """)
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        updates = []
+        for receipt_id, event_ts in rows:
+            business_day, local_hour, local_weekday = bangkok_local_parts(event_ts)
+            updates.append((event_ts, business_day, local_hour, local_weekday, receipt_id))
+        cursor.executemany("""
+            UPDATE receipts
+            SET event_ts = ?, business_day = ?, local_hour = ?, local_weekday = ?
+            WHERE receipt_id = ?
+        """, updates)
+        print(f"🔧 Backfilled Bangkok business day for {len(updates)} receipts")
+    
+    def _surrogate_keys(self, cursor, entity, uuids, chunk_size=500):
+        """{uuid: integer key} for an entity, assigning keys to UUIDs seen for the first time"""
+        uuids = sorted({uuid for uuid in uuids if uuid})
+        if not uuids:
+            return {}
+        cursor.executemany(
+            "INSERT OR IGNORE INTO uuid_keys (entity, uuid) VALUES (?, ?)",
+            [(entity, uuid) for uuid in uuids],
+        )
+        keys = {}
+        for start in range(0, len(uuids), chunk_size):
+            chunk = uuids[start:start + chunk_size]
+            cursor.execute(
+                f"SELECT uuid, key FROM uuid_keys WHERE entity = ? AND uuid IN ({', '.join('?' * len(chunk))})",
+                [entity, *chunk],
+            )
+            keys.update(cursor.fetchall())
+        return keys
+    
+    def _backfill_surrogate_keys(self, cursor):
+        """One-time migration: assign integer keys to UUIDs already stored in fact tables"""
+        for table, uuid_columns in SURROGATE_KEY_COLUMNS.items():
+            for column, entity in uuid_columns.items():
+                key_column = surrogate_column(column)
+                cursor.execute(
+                    f"SELECT 1 FROM {table} WHERE {key_column} IS NULL AND {column} IS NOT NULL LIMIT 1"
+                )
+                if cursor.fetchone() is None:
+                    continue
+                cursor.execute(f"""
+                    INSERT OR IGNORE INTO uuid_keys (entity, uuid)
+                    SELECT DISTINCT ?, {column} FROM {table} WHERE {column} IS NOT NULL
+                """, (entity,))
+                cursor.execute(f"""
+                    UPDATE {table}
+                    SET {key_column} = (
+                        SELECT key FROM uuid_keys WHERE entity = ? AND uuid = {table}.{column}
+                    )
+                    WHERE {key_column} IS NULL AND {column} IS NOT NULL
+                """, (entity,))
+                print(f"🔧 Keyed {cursor.rowcount} {table}.{column} values")
+    
+    def _backfill_satang(self, cursor, batch_size=5000):
+        """
+        One-time migration: derive integer satang columns from the REAL money
+        columns with to_satang, the same Decimal half-up conversion as ingest
+        (SQL ROUND on binary floats can land one satang off for .xx5 amounts).
+        """
+        updated = 0
+        while True:
+            cursor.execute("""
+                SELECT rowid, total_money, total_tax, total_discount, receipt_type
+                FROM receipts WHERE signed_net_satang IS NULL LIMIT ?
+            """, (batch_size,))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            batch = []
+            for rowid, total, tax, discount, receipt_type in rows:
+                total_satang, discount_satang = to_satang(total), to_satang(discount)
+                batch.append((
+                    total_satang, to_satang(tax), discount_satang,
+                    signed_net_satang(total_satang, discount_satang, receipt_type), rowid,
+                ))
+            cursor.executemany("""
+                UPDATE receipts SET total_money_satang = ?, total_tax_satang = ?,
+                    total_discount_satang = ?, signed_net_satang = ?
+                WHERE rowid = ?
+            """, batch)
+            updated += len(batch)
+        if updated:
+            print(f"🔧 Stored satang amounts for {updated} receipts")
+        while True:
+            cursor.execute("""
+                SELECT rowid, price, total_money, cost FROM line_items
+                WHERE total_money_satang IS NULL AND total_money IS NOT NULL LIMIT ?
+            """, (batch_size,))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            cursor.executemany(
+                "UPDATE line_items SET price_satang = ?, total_money_satang = ?, cost_satang = ? WHERE rowid = ?",
+                [(to_satang(price), to_satang(total), to_satang(cost), rowid) for rowid, price, total, cost in rows],
+            )
+    
+    def _backfill_payment_keys(self, cursor):
+        """One-time migration: key existing payments by their order within each receipt"""
+        cursor.execute("SELECT 1 FROM payments WHERE payment_key IS NULL LIMIT 1")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute("""
+            UPDATE payments
+            SET payment_key = ordered.payment_key
+            FROM (
+                SELECT id, receipt_id || ':' || (ROW_NUMBER() OVER (PARTITION BY receipt_id ORDER BY id) - 1) AS payment_key
+                FROM payments
+            ) AS ordered
+            WHERE payments.id = ordered.id AND payments.payment_key IS NULL
+        """)
+        print(f"🔧 Keyed {cursor.rowcount} existing payments")
+    
+    def _backfill_payment_summary(self, cursor, batch_size=5000):
+        """One-time migration: build receipt_payment_summary from existing payments"""
+        cursor.execute("SELECT 1 FROM receipt_payment_summary LIMIT 1")
+        if cursor.fetchone() is not None:
+            return
+        cursor.execute("SELECT 1 FROM payments LIMIT 1")
+        if cursor.fetchone() is None:
+            return
+        
+        reader = cursor.connection.cursor()
+        reader.execute("""
+            SELECT receipt_id, payment_type_id, payment_name, payment_type, money_amount
+            FROM payments
+            ORDER BY receipt_id, id
+        """)
+        rows = []
+        built = 0
+        for receipt_id, group in itertools.groupby(reader, key=lambda row: row[0]):
+            payments = [
+                {'payment_type_id': type_id, 'name': name, 'type': ptype, 'money_amount': amount}
+                for _, type_id, name, ptype, amount in group
+            ]
+            rows.append((receipt_id, *summarize_payments(payments)))
+            if len(rows) >= batch_size:
+                self._write_payment_summary(cursor, rows)
+                built += len(rows)
+                rows = []
+        self._write_payment_summary(cursor, rows)
+        built += len(rows)
+        print(f"🔧 Built payment summary for {built} receipts")
+    
+    def _write_payment_summary(self, cursor, rows):
+        cursor.executemany("""
+            INSERT OR REPLACE INTO receipt_payment_summary (
+                receipt_id, payment_type_ids, payment_names, is_split,
+                payment_count, amounts_by_type, total_paid
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+    
+    def _migrate_raw_payloads(self, cursor, batch_size=1000):
+        """One-time migration: compress inline raw_data columns into raw_payloads"""
+        moved = 0
+        for table, (entity, id_column) in RAW_PAYLOAD_TABLES.items():
+            while True:
+                cursor.execute(
+                    f"SELECT {id_column}, raw_data FROM {table} WHERE raw_data IS NOT NULL LIMIT ?",
+                    (batch_size,),
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                payload_rows = []
+                for entity_id, raw_data in rows:
+                    try:
+                        payload = compress_payload(json.loads(raw_data))
+                    except ValueError:
+                        payload = compress_payload(raw_data)
+                    payload_rows.append((entity, entity_id, RAW_PAYLOAD_CODEC, payload))
+                cursor.executemany(
+                    "INSERT OR REPLACE INTO raw_payloads (entity, entity_id, codec, payload) VALUES (?, ?, ?, ?)",
+                    payload_rows,
+                )
+                cursor.executemany(
+                    f"UPDATE {table} SET raw_data = NULL WHERE {id_column} = ?",
+                    [(row[0],) for row in rows],
+                )
+                moved += len(rows)
+        return moved
+    
     def verify_tables_exist(self):
         """Verify that all required tables exist"""
         try:
@@ -266,21 +1132,66 @@ class LoyverseDB:
             print(f"❌ Error verifying tables: {e}")
             return False
     
+    # ===== METADATA UPSERTS =====
+    
+    def _upsert_metadata(self, cursor, table, columns, records, entity=None):
+        """
+        Write only new or changed metadata rows in one batch. records are
+        (api object, values in `columns` order with the key first); a row is
+        rewritten when the hash of its API object differs from the stored
+        content_hash. Returns and records {'inserted', 'updated', 'unchanged'}.
+        """
+        key_column = METADATA_TABLES[table]
+        latest = {}
+        for obj, values in records:
+            if values[0] is not None:
+                latest[values[0]] = (obj, values)  # last occurrence wins
+        
+        cursor.execute(f"SELECT {key_column}, content_hash FROM {table}")
+        stored = dict(cursor.fetchall())
+        
+        now = datetime.now().isoformat()
+        rows = []
+        payloads = []
+        inserted = updated = 0
+        for key, (obj, values) in latest.items():
+            digest = content_hash(obj)
+            if key not in stored:
+                inserted += 1
+            elif stored[key] != digest:
+                updated += 1
+            else:
+                continue
+            rows.append((*values, now, digest))
+            payloads.append((key, obj))
+        
+        if rows:
+            all_columns = [*columns, 'last_updated', 'content_hash']
+            assignments = ', '.join(f"{col} = excluded.{col}" for col in all_columns[1:])
+            cursor.executemany(f"""
+                INSERT INTO {table} ({', '.join(all_columns)})
+                VALUES ({', '.join('?' * len(all_columns))})
+                ON CONFLICT({key_column}) DO UPDATE SET {assignments}
+            """, rows)
+            if entity:
+                self._save_raw_payloads(cursor, entity, payloads)
+        
+        result = {'inserted': inserted, 'updated': updated, 'unchanged': len(latest) - len(rows)}
+        self.last_metadata_stats[table] = result
+        return result
+    
     # ===== CUSTOMER METHODS =====
     
     def save_customers(self, customers):
-        """Save or update customers in database"""
+        """Save new or changed customers; returns the number received"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        for customer in customers:
-            cursor.execute("""
-                INSERT OR REPLACE INTO customers (
-                    customer_id, name, customer_code, email, phone,
-                    total_visits, total_spent, first_visit, last_visit,
-                    last_updated, raw_data
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
+        result = self._upsert_metadata(cursor, 'customers', [
+            'customer_id', 'name', 'customer_code', 'email', 'phone',
+            'total_visits', 'total_spent', 'first_visit', 'last_visit',
+        ], [
+            (customer, (
                 customer.get('id'),
                 customer.get('name'),
                 customer.get('customer_code'),
@@ -290,9 +1201,13 @@ class LoyverseDB:
                 customer.get('total_spent'),
                 customer.get('first_visit'),
                 customer.get('last_visit'),
-                datetime.now().isoformat(),
-                json.dumps(customer)
             ))
+            for customer in customers
+        ], entity='customer')
+        
+        if result['inserted'] or result['updated']:
+            self._adjust_table_stats(cursor, {'customers': result['inserted']})
+            self._bump_data_version(cursor, scope='metadata')
         
         conn.commit()
         conn.close()
@@ -335,22 +1250,134 @@ class LoyverseDB:
     # ===== RECEIPT METHODS =====
     
     def save_receipts(self, receipts):
-        """Save or update receipts with line items and payments"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
+        """
+        Save or update receipts with line items and payments.
+
+        Rows are built into column batches first and written with executemany
+        inside a single transaction, so a resync of thousands of receipts costs a
+        handful of statements instead of one round trip per row. Receipts whose
+        content hash matches the stored one are skipped entirely; for changed
+        receipts, line items and payments are upserted by deterministic keys
+        and only stale children are deleted. Throughput is kept on
+        ``self.last_ingest_stats`` and printed after each call.
+        """
+        started = time.perf_counter()
+
+        # Last occurrence wins, matching the old per-row INSERT OR REPLACE loop
+        by_id = {}
         for receipt in receipts:
             receipt_id = receipt.get('id') or receipt.get('receipt_number')
+            by_id.pop(receipt_id, None)
+            by_id[receipt_id] = receipt
+
+        # Receipts for an archived month are written into its partition file
+        partitions = self.get_archive_partitions()
+        archived = dict(zip(partitions['month'], partitions['path']))
+        batches = {}
+        for receipt_id, receipt in by_id.items():
+            month = (bangkok_local_parts(receipt.get('receipt_date') or receipt.get('created_at'))[0] or '')[:7]
+            batches.setdefault(month if month in archived else None, {})[receipt_id] = receipt
+
+        totals = {'receipts': 0, 'unchanged': 0, 'line_items': 0, 'payments': 0}
+        for month, batch in sorted(batches.items(), key=lambda item: item[0] or ''):
+            if month:
+                counts = self._save_archived_receipts(month, archived[month], batch)
+            else:
+                conn = self.get_connection()
+                counts = self._write_receipts(conn.cursor(), batch)
+                conn.commit()
+                conn.close()
+            for key in totals:
+                totals[key] += counts[key]
+
+        elapsed = time.perf_counter() - started
+        total_rows = totals['receipts'] + totals['line_items'] + totals['payments']
+        self.last_ingest_stats = {
+            **totals,
+            'seconds': elapsed,
+            'rows_per_sec': total_rows / elapsed if elapsed > 0 else float(total_rows),
+        }
+        print(
+            f"💾 Saved {totals['receipts']} receipts ({totals['unchanged']} unchanged), "
+            f"{totals['line_items']} line items, {totals['payments']} payments in {elapsed:.2f}s "
+            f"({self.last_ingest_stats['rows_per_sec']:,.0f} rows/sec)"
+        )
+        return len(receipts)
+
+    def _save_archived_receipts(self, month, path, by_id):
+        """
+        Write receipts of an archived month into its partition file, in one
+        transaction: their stored copies move into the hot tables, go through
+        the normal write, and move back out; the month's touched summary days
+        are then recomputed from the partition. Hot-table stats end unchanged.
+        """
+        schema = self.ARCHIVE_SCHEMA
+        conn = self.get_connection()
+        try:
+            self._attach_archive(conn, path)
+            cursor = conn.cursor()
+            self._load_temp_receipt_ids(cursor, list(by_id))
+            self._copy_target_receipts(cursor, schema, 'main')
+            moved_in = self._delete_target_receipt_rows(cursor, schema)
+            self._adjust_table_stats(cursor, {'receipts': moved_in['receipts'], 'line_items': moved_in['line_items']})
             
-            # Save receipt
-            cursor.execute("""
-                INSERT OR REPLACE INTO receipts (
-                    receipt_id, receipt_number, receipt_date, created_at, updated_at,
-                    store_id, customer_id, employee_id, total_money, total_tax,
-                    total_discount, receipt_type, source, dining_option, location, 
-                    raw_data, last_updated
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
+            counts = self._write_receipts(cursor, by_id)
+            
+            self._load_temp_receipt_ids(cursor, list(by_id))
+            self._copy_target_receipts(cursor, 'main', schema)
+            moved_out = self._delete_target_receipt_rows(cursor)
+            self._adjust_table_stats(cursor, {'receipts': -moved_out['receipts'], 'line_items': -moved_out['line_items']})
+            self._refresh_daily_summary(
+                cursor, [day for day in counts['business_days'] if day and day.startswith(month)], schema
+            )
+            self._update_partition_stats(cursor, month, path)
+            conn.commit()
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._detach_archive(conn)
+            conn.close()
+        return counts
+
+    def _write_receipts(self, cursor, by_id):
+        """
+        Write {receipt_id: receipt} into the hot tables inside the caller's
+        transaction (see save_receipts); returns row counts and touched days.
+        """
+        stored = self._stored_receipt_state(cursor, list(by_id))
+        changed = {}
+        for receipt_id, receipt in by_id.items():
+            digest = content_hash(receipt)
+            previous = stored.get(receipt_id)
+            if previous is None or previous[0] != digest:
+                changed[receipt_id] = (receipt, digest)
+
+        # Integer surrogate keys for the UUIDs on changed receipts and their children
+        changed_receipts = [receipt for receipt, _ in changed.values()]
+        changed_lines = [line for receipt in changed_receipts for line in receipt.get('line_items', [])]
+        store_keys = self._surrogate_keys(cursor, 'store', [r.get('store_id') for r in changed_receipts])
+        customer_keys = self._surrogate_keys(cursor, 'customer', [r.get('customer_id') for r in changed_receipts])
+        employee_keys = self._surrogate_keys(cursor, 'employee', [r.get('employee_id') for r in changed_receipts])
+        item_keys = self._surrogate_keys(cursor, 'item', [line.get('item_id') for line in changed_lines])
+        variant_keys = self._surrogate_keys(cursor, 'variant', [line.get('variant_id') for line in changed_lines])
+        payment_type_keys = self._surrogate_keys(cursor, 'payment_type', [
+            payment.get('payment_type_id') for r in changed_receipts for payment in r.get('payments', [])
+        ])
+
+        now = datetime.now().isoformat()
+        receipt_rows = []
+        line_item_rows = []
+        payment_rows = []
+        payment_summary_rows = []
+        # Days to re-summarize also include where replaced receipts used to sit
+        touched_days = {stored[receipt_id][1] for receipt_id in changed if receipt_id in stored}
+        for receipt_id, (receipt, digest) in changed.items():
+            event_ts = receipt.get('receipt_date') or receipt.get('created_at')
+            business_day, local_hour, local_weekday = bangkok_local_parts(event_ts)
+            touched_days.add(business_day)
+            total_satang = to_satang(receipt.get('total_money'))
+            discount_satang = to_satang(receipt.get('total_discount'))
+            receipt_rows.append((
                 receipt_id,
                 receipt.get('receipt_number'),
                 receipt.get('receipt_date'),
@@ -366,23 +1393,23 @@ class LoyverseDB:
                 receipt.get('source'),
                 receipt.get('dining_option'),
                 receipt.get('dining_option'),  # Use dining_option as location
-                json.dumps(receipt),
-                datetime.now().isoformat()
+                now,
+                event_ts,
+                business_day,
+                local_hour,
+                local_weekday,
+                digest,
+                store_keys.get(receipt.get('store_id')),
+                customer_keys.get(receipt.get('customer_id')),
+                employee_keys.get(receipt.get('employee_id')),
+                total_satang,
+                to_satang(receipt.get('total_tax')),
+                discount_satang,
+                signed_net_satang(total_satang, discount_satang, receipt.get('receipt_type'))
             ))
-            
-            # Delete old line items and payments for this receipt
-            cursor.execute("DELETE FROM line_items WHERE receipt_id = ?", (receipt_id,))
-            cursor.execute("DELETE FROM payments WHERE receipt_id = ?", (receipt_id,))
-            
-            # Save line items
-            for line_item in receipt.get('line_items', []):
-                cursor.execute("""
-                    INSERT INTO line_items (
-                        line_item_id, receipt_id, item_id, variant_id, item_name,
-                        sku, quantity, price, total_money, cost
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    line_item.get('id'),
+            for ordinal, line_item in enumerate(receipt.get('line_items', [])):
+                line_item_rows.append((
+                    line_item.get('id') or f"{receipt_id}#{ordinal}",
                     receipt_id,
                     line_item.get('item_id'),
                     line_item.get('variant_id'),
@@ -391,137 +1418,478 @@ class LoyverseDB:
                     line_item.get('quantity'),
                     line_item.get('price'),
                     line_item.get('total_money'),
-                    line_item.get('cost')
+                    line_item.get('cost'),
+                    item_keys.get(line_item.get('item_id')),
+                    variant_keys.get(line_item.get('variant_id')),
+                    to_satang(line_item.get('price')),
+                    to_satang(line_item.get('total_money')),
+                    to_satang(line_item.get('cost'))
                 ))
-            
-            # Save payments
-            for payment in receipt.get('payments', []):
-                cursor.execute("""
-                    INSERT INTO payments (
-                        receipt_id, payment_type_id, payment_name,
-                        payment_type, money_amount, paid_at
-                    ) VALUES (?, ?, ?, ?, ?, ?)
-                """, (
+            payment_summary_rows.append((receipt_id, *summarize_payments(receipt.get('payments', []))))
+            for ordinal, payment in enumerate(receipt.get('payments', [])):
+                payment_rows.append((
+                    f"{receipt_id}:{ordinal}",
                     receipt_id,
                     payment.get('payment_type_id'),
                     payment.get('name'),
                     payment.get('type'),
                     payment.get('money_amount'),
-                    payment.get('paid_at')
+                    payment.get('paid_at'),
+                    payment_type_keys.get(payment.get('payment_type_id'))
                 ))
-        
-        conn.commit()
-        conn.close()
-        return len(receipts)
+
+        if changed:
+            cursor.executemany("""
+                INSERT INTO receipts (
+                    receipt_id, receipt_number, receipt_date, created_at, updated_at,
+                    store_id, customer_id, employee_id, total_money, total_tax,
+                    total_discount, receipt_type, source, dining_option, location, 
+                    last_updated, event_ts, business_day, local_hour, local_weekday,
+                    content_hash, store_key, customer_key, employee_key,
+                    total_money_satang, total_tax_satang, total_discount_satang, signed_net_satang
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(receipt_id) DO UPDATE SET
+                    receipt_number = excluded.receipt_number,
+                    receipt_date = excluded.receipt_date,
+                    created_at = excluded.created_at,
+                    updated_at = excluded.updated_at,
+                    store_id = excluded.store_id,
+                    customer_id = excluded.customer_id,
+                    employee_id = excluded.employee_id,
+                    total_money = excluded.total_money,
+                    total_tax = excluded.total_tax,
+                    total_discount = excluded.total_discount,
+                    receipt_type = excluded.receipt_type,
+                    source = excluded.source,
+                    dining_option = excluded.dining_option,
+                    location = excluded.location,
+                    last_updated = excluded.last_updated,
+                    event_ts = excluded.event_ts,
+                    business_day = excluded.business_day,
+                    local_hour = excluded.local_hour,
+                    local_weekday = excluded.local_weekday,
+                    content_hash = excluded.content_hash,
+                    store_key = excluded.store_key,
+                    customer_key = excluded.customer_key,
+                    employee_key = excluded.employee_key,
+                    total_money_satang = excluded.total_money_satang,
+                    total_tax_satang = excluded.total_tax_satang,
+                    total_discount_satang = excluded.total_discount_satang,
+                    signed_net_satang = excluded.signed_net_satang
+            """, receipt_rows)
+            self._save_raw_payloads(cursor, 'receipt', [(rid, pair[0]) for rid, pair in changed.items()])
+
+            self._load_temp_receipt_ids(cursor, list(changed))
+            line_items_before = self._count_target_rows(cursor, 'line_items')
+            self._sync_child_rows(cursor, 'line_items', 'line_item_id', [
+                'line_item_id', 'receipt_id', 'item_id', 'variant_id', 'item_name',
+                'sku', 'quantity', 'price', 'total_money', 'cost', 'item_key', 'variant_key',
+                'price_satang', 'total_money_satang', 'cost_satang',
+            ], line_item_rows)
+            self._sync_child_rows(cursor, 'payments', 'payment_key', [
+                'payment_key', 'receipt_id', 'payment_type_id', 'payment_name',
+                'payment_type', 'money_amount', 'paid_at', 'payment_type_key',
+            ], payment_rows)
+            self._write_payment_summary(cursor, payment_summary_rows)
+
+            self._refresh_daily_summary(cursor, touched_days)
+            self._bump_data_version(cursor, touched_days)
+
+            self._adjust_table_stats(cursor, {
+                'receipts': sum(1 for receipt_id in changed if receipt_id not in stored),
+                'line_items': self._count_target_rows(cursor, 'line_items') - line_items_before,
+            })
+        
+        return {
+            'receipts': len(receipt_rows),
+            'unchanged': len(by_id) - len(changed),
+            'line_items': len(line_item_rows),
+            'payments': len(payment_rows),
+            'business_days': sorted(day for day in touched_days if day) if changed else [],
+        }
+    
+    def _stored_receipt_state(self, cursor, receipt_ids):
+        """{receipt_id: (content_hash, business_day)} for receipts already stored"""
+        self._load_temp_receipt_ids(cursor, receipt_ids)
+        cursor.execute("""
+            SELECT r.receipt_id, r.content_hash, r.business_day
+            FROM receipts r
+            JOIN temp.target_receipt_ids t ON r.receipt_id = t.receipt_id
+        """)
+        return {receipt_id: (digest, day) for receipt_id, digest, day in cursor.fetchall()}
+    
+    def _count_target_rows(self, cursor, table):
+        """Rows of a child table belonging to the receipts in temp.target_receipt_ids"""
+        cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE receipt_id IN (SELECT receipt_id FROM temp.target_receipt_ids)")
+        return cursor.fetchone()[0]
     
-    def remove_problematic_receipts(self, receipt_numbers=None, min_abs_total=None):
+    def _sync_child_rows(self, cursor, table, key_column, columns, rows):
         """
-        Remove receipts only when explicitly requested by caller.
-        This method no longer uses hardcoded receipt numbers or thresholds.
+        Upsert child rows of the receipts in temp.target_receipt_ids by their
+        deterministic key, leaving identical rows untouched, then delete the
+        children those receipts no longer have.
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        removed_count = 0
-
-        if receipt_numbers:
-            for receipt_number in receipt_numbers:
-                cursor.execute("SELECT receipt_id FROM receipts WHERE receipt_number = ?", (receipt_number,))
-                result = cursor.fetchone()
-                if result:
-                    receipt_id = result[0]
-                    cursor.execute("DELETE FROM line_items WHERE receipt_id = ?", (receipt_id,))
-                    cursor.execute("DELETE FROM payments WHERE receipt_id = ?", (receipt_id,))
-                    cursor.execute("DELETE FROM receipts WHERE receipt_id = ?", (receipt_id,))
-                    removed_count += 1
-                    print(f"🗑️ Removed receipt: {receipt_number}")
-
-        if min_abs_total is not None:
-            cursor.execute(
-                "SELECT receipt_id FROM receipts WHERE ABS(total_money) >= ?",
-                (float(min_abs_total),),
-            )
-            receipt_ids = [row[0] for row in cursor.fetchall()]
-            if receipt_ids:
-                for rid in receipt_ids:
-                    cursor.execute("DELETE FROM line_items WHERE receipt_id = ?", (rid,))
-                    cursor.execute("DELETE FROM payments WHERE receipt_id = ?", (rid,))
-                    cursor.execute("DELETE FROM receipts WHERE receipt_id = ?", (rid,))
-                removed_count += len(receipt_ids)
-                print(f"🗑️ Removed {len(receipt_ids)} receipts with ABS(total_money) >= {min_abs_total}")
-        
-        conn.commit()
-        conn.close()
+        data_columns = columns[1:]
+        assignments = ', '.join(f"{col} = excluded.{col}" for col in data_columns)
+        current = ', '.join(f"{table}.{col}" for col in data_columns)
+        incoming = ', '.join(f"excluded.{col}" for col in data_columns)
+        cursor.executemany(f"""
+            INSERT INTO {table} ({', '.join(columns)})
+            VALUES ({', '.join('?' * len(columns))})
+            ON CONFLICT({key_column}) DO UPDATE SET {assignments}
+            WHERE ({current}) IS NOT ({incoming})
+        """, rows)
+        
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS keep_child_keys (child_key TEXT PRIMARY KEY)")
+        cursor.execute("DELETE FROM temp.keep_child_keys")
+        cursor.executemany(
+            "INSERT OR IGNORE INTO temp.keep_child_keys (child_key) VALUES (?)",
+            [(row[0],) for row in rows],
+        )
+        cursor.execute(f"""
+            DELETE FROM {table}
+            WHERE receipt_id IN (SELECT receipt_id FROM temp.target_receipt_ids)
+              AND ({key_column} IS NULL
+                   OR {key_column} NOT IN (SELECT child_key FROM temp.keep_child_keys))
+        """)
+    
+    # Receipt child tables cleared by a batch delete: table -> extra condition
+    RECEIPT_CHILD_TABLES = {
+        'line_items': "",
+        'payments': "",
+        'receipt_payment_summary': "",
+        'raw_payloads': "entity = 'receipt' AND ",
+    }
+    
+    def _delete_target_receipt_rows(self, cursor, schema='main'):
+        """Delete the receipts in temp.target_receipt_ids and their children; returns row counts per table"""
+        counts = {}
+        for table, condition in self.RECEIPT_CHILD_TABLES.items():
+            id_column = 'entity_id' if table == 'raw_payloads' else 'receipt_id'
+            cursor.execute(f"""
+                DELETE FROM {schema}.{table}
+                WHERE {condition}{id_column} IN (SELECT receipt_id FROM temp.target_receipt_ids)
+            """)
+            counts[table] = cursor.rowcount
+        cursor.execute(f"DELETE FROM {schema}.receipts WHERE receipt_id IN (SELECT receipt_id FROM temp.target_receipt_ids)")
+        counts['receipts'] = cursor.rowcount
+        return counts
+    
+    def _delete_receipts(self, conn, receipt_ids):
+        """
+        Delete receipts and their children from the hot database, then from
+        any archive partition holding the rest, committing each in turn.
         
-        if not receipt_numbers and min_abs_total is None:
-            print("ℹ️ No removal criteria provided; no receipts removed.")
-        print(f"✅ Total receipts removed: {removed_count}")
-        return removed_count
+        The IDs go into temp.target_receipt_ids and each table is cleared with
+        one statement against it. Keeps the daily summary, data version, table
+        stats and partition counts in step. Returns the removed receipt IDs,
+        their business days and per-table row counts.
+        """
+        remaining = set(receipt_ids)
+        removed = {'receipt_ids': [], 'business_days': [], 'rows': {}}
+        if conn.in_transaction:
+            conn.commit()
+        partitions = [
+            (month, path) for month, path in self._archive_partitions(conn) if os.path.exists(path)
+        ]
+        for month, path in [(None, None)] + partitions:
+            if not remaining:
+                break
+            with self._receipt_source(conn, path) as schema:
+                cursor = conn.cursor()
+                self._load_temp_receipt_ids(cursor, remaining)
+                cursor.execute(f"""
+                    SELECT r.receipt_id, r.business_day
+                    FROM {schema}.receipts r
+                    JOIN temp.target_receipt_ids t ON r.receipt_id = t.receipt_id
+                """)
+                rows = cursor.fetchall()
+                if rows:
+                    days = sorted({day for _, day in rows if day})
+                    counts = self._delete_target_receipt_rows(cursor, schema)
+                    self._refresh_daily_summary(cursor, days, schema)
+                    self._bump_data_version(cursor, days)
+                    if path is None:
+                        self._adjust_table_stats(cursor, {
+                            'receipts': -counts['receipts'], 'line_items': -counts['line_items'],
+                        })
+                    else:
+                        self._update_partition_stats(cursor, month, path)
+                    remaining.difference_update(receipt_id for receipt_id, _ in rows)
+                    removed['receipt_ids'].extend(receipt_id for receipt_id, _ in rows)
+                    removed['business_days'].extend(days)
+                    for table, count in counts.items():
+                        removed['rows'][table] = removed['rows'].get(table, 0) + count
+                conn.commit()
+                cursor.close()
+        removed['receipt_ids'].sort()
+        removed['business_days'] = sorted(set(removed['business_days']))
+        return removed
     
-    def get_receipts_dataframe(self, start_date=None, end_date=None, store_id=None):
-        """Get receipts as DataFrame for dashboard with location from categories"""
-        conn = self.get_connection()
+    def delete_receipts(self, receipt_ids):
+        """
+        Delete receipts by ID with their line items, payments, payment summary
+        and raw payloads, wherever they are stored. Unknown IDs are ignored.
         
-        # Optimized query with better indexing hints
-        query = """
+        Returns {'receipt_ids': [...], 'business_days': [...], 'rows': {table: count}}
+        describing exactly what was removed.
+        """
+        conn = self.get_connection()
+        try:
+            return self._delete_receipts(conn, {str(rid) for rid in receipt_ids if rid})
+        finally:
+            conn.close()
+    
+    def find_duplicate_receipts(self, start_date=None, end_date=None, keys=('created_at', 'total_money')):
+        """
+        Receipt IDs that repeat an earlier receipt on the given key columns,
+        optionally within a business-day range. The smallest receipt_id of each
+        group is kept; the rest are returned for delete_receipts().
+        """
+        allowed = ('created_at', 'receipt_date', 'total_money', 'receipt_number', 'store_id', 'business_day')
+        if not keys or any(key not in allowed for key in keys):
+            raise ValueError(f"keys must be drawn from {allowed}")
+        columns = ', '.join(('receipt_id',) + tuple(keys))
+        filters, params = "", []
+        if start_date:
+            filters += " AND business_day >= ?"
+            params.append(str(start_date))
+        if end_date:
+            filters += " AND business_day <= ?"
+            params.append(str(end_date))
+        
+        conn = self.get_connection()
+        try:
+            # Archived receipts in range are gathered first, so groups span partitions
+            conn.execute("DROP TABLE IF EXISTS temp.duplicate_candidates")
+            conn.execute(f"CREATE TEMP TABLE duplicate_candidates AS SELECT {columns} FROM main.receipts WHERE 0")
+            for path in self._receipt_sources(conn, start_date, end_date)[:-1]:
+                with self._receipt_source(conn, path) as schema:
+                    conn.execute(f"""
+                        INSERT INTO temp.duplicate_candidates
+                        SELECT {columns} FROM {schema}.receipts WHERE 1=1 {filters}
+                    """, params)
+                    conn.commit()
+            rows = conn.execute(f"""
+                SELECT receipt_id FROM (
+                    SELECT receipt_id,
+                           ROW_NUMBER() OVER (PARTITION BY {', '.join(keys)} ORDER BY receipt_id) AS position
+                    FROM (
+                        SELECT {columns} FROM main.receipts WHERE 1=1 {filters}
+                        UNION ALL
+                        SELECT {columns} FROM temp.duplicate_candidates
+                    )
+                )
+                WHERE position > 1
+                ORDER BY receipt_id
+            """, params).fetchall()
+            conn.execute("DROP TABLE temp.duplicate_candidates")
+        finally:
+            conn.close()
+        return [row[0] for row in rows]
+    
+    def remove_problematic_receipts(self, receipt_numbers=None, min_abs_total=None, store_id=None):
+        """
+        Remove receipts only when explicitly requested by caller.
+        This method no longer uses hardcoded receipt numbers or thresholds.
+        Receipt numbers repeat across stores, so each number removes only its
+        first stored receipt, or that store's receipt when store_id is given.
+        """
+        if not receipt_numbers and min_abs_total is None:
+            print("ℹ️ No removal criteria provided; no receipts removed.")
+            print("✅ Total receipts removed: 0")
+            return 0
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        receipt_ids = []
+        if receipt_numbers:
+            store_filter = "AND store_id = ?" if store_id else ""
+            params = [store_id] if store_id else []
+            cursor.execute(f"""
+                SELECT (SELECT receipt_id FROM receipts
+                        WHERE receipt_number = numbers.value {store_filter}
+                        ORDER BY rowid LIMIT 1)
+                FROM json_each(?) AS numbers
+            """, params + [json.dumps([str(number) for number in receipt_numbers])])
+            receipt_ids.extend(row[0] for row in cursor.fetchall() if row[0] is not None)
+        if min_abs_total is not None:
+            cursor.execute("SELECT receipt_id FROM receipts WHERE ABS(total_money) >= ?", (float(min_abs_total),))
+            receipt_ids.extend(row[0] for row in cursor.fetchall())
+        cursor.close()
+        try:
+            removed = self._delete_receipts(conn, list(dict.fromkeys(receipt_ids)))
+        finally:
+            conn.close()
+        
+        removed_count = len(removed['receipt_ids'])
+        print(f"✅ Total receipts removed: {removed_count}")
+        return removed_count
+    
+    # Output column -> SQL expression for the dashboard receipts frame, in
+    # get_receipts_dataframe column order. The table alias decides which joins
+    # a projection needs (r receipts, li line_items, i items, c categories,
+    # ps receipt_payment_summary).
+    RECEIPT_FRAME_COLUMNS = {
+        'date': "COALESCE(r.receipt_date, r.created_at)",
+        'business_day': "r.business_day",
+        'local_hour': "r.local_hour",
+        'local_weekday': "r.local_weekday",
+        'store_id': "r.store_id",
+        'customer_id': "r.customer_id",
+        'bill_number': "r.receipt_number",
+        'dining_option': "r.dining_option",
+        'employee_id': "r.employee_id",
+        'receipt_type': "r.receipt_type",
+        'item_id': "li.item_id",
+        'sku': "li.sku",
+        'item': "li.item_name",
+        'quantity': "li.quantity",
+        'price': "li.price",
+        'line_total': "li.total_money",
+        'receipt_total': "r.total_money",
+        'receipt_discount': "r.total_discount",
+        'receipt_tax': "r.total_tax",
+        'signed_net_satang': "r.signed_net_satang",
+        'category_id': "i.category_id",
+        'location': "c.name",
+        'bill_type': "ps.payment_type_ids",
+    }
+    
+    def _receipts_query(self, conn, columns=None, start_date=None, end_date=None, store_id=None,
+                        location=None, business_days=None, ordered=False, schema='main'):
+        """
+        Build the receipts frame query for a column projection; returns (query, params).
+        schema names an attached archive partition to read receipt tables from.
+        """
+        prefix = '' if schema == 'main' else f"{schema}."
+        columns = list(columns) if columns else list(self.RECEIPT_FRAME_COLUMNS)
+        unknown = [col for col in columns if col not in self.RECEIPT_FRAME_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown receipt columns: {unknown}")
+        expressions = [self.RECEIPT_FRAME_COLUMNS[col] for col in columns]
+        aliases = {expr.split('.')[0].split('(')[-1] for expr in expressions}
+        
+        needs_category = 'c' in aliases or location is not None
+        needs_item = 'i' in aliases or needs_category
+        needs_line = 'li' in aliases or needs_item
+        needs_payment = 'ps' in aliases
+        
+        select_list = ",\n                ".join(f"{expr} as {col}" for expr, col in zip(expressions, columns))
+        query = f"""
             SELECT 
-                COALESCE(r.receipt_date, r.created_at) as date,
-                r.store_id,
-                r.customer_id,
-                r.receipt_number as bill_number,
-                r.dining_option,
-                r.employee_id,
-                r.receipt_type,
-                li.item_id,
-                li.sku,
-                li.item_name as item,
-                li.quantity,
-                li.price,
-                li.total_money as line_total,
-                r.total_money as receipt_total,
-                r.total_discount as receipt_discount,
-                r.total_tax as receipt_tax,
-                i.category_id,
-                c.name as location,
-                GROUP_CONCAT(p.payment_type_id, '+') as bill_type
-            FROM receipts r
-            LEFT JOIN line_items li ON r.receipt_id = li.receipt_id
-            LEFT JOIN payments p ON r.receipt_id = p.receipt_id
-            LEFT JOIN items i ON li.item_id = i.item_id
-            LEFT JOIN categories c ON i.category_id = c.category_id
-            WHERE 1=1
-            -- include refunds; we will handle sign in app layer
+                {select_list}
+            FROM {prefix}receipts r
         """
+        if needs_line:
+            query += f" LEFT JOIN {prefix}line_items li ON r.receipt_id = li.receipt_id"
+        if needs_payment:
+            query += f" LEFT JOIN {prefix}receipt_payment_summary ps ON r.receipt_id = ps.receipt_id"
+        if needs_item:
+            query += " LEFT JOIN items i ON li.item_key = i.item_key"
+        if needs_category:
+            query += " LEFT JOIN categories c ON i.category_id = c.category_id"
+        # include refunds; we will handle sign in app layer
+        query += " WHERE 1=1"
         
         params = []
         
+        # Dates are Bangkok business days; the stored column keeps this an index range scan
         if start_date:
-            query += " AND DATE(COALESCE(r.receipt_date, r.created_at)) >= ?"
-            params.append(start_date)
+            query += " AND r.business_day >= ?"
+            params.append(str(start_date))
         
         if end_date:
-            query += " AND DATE(COALESCE(r.receipt_date, r.created_at)) <= ?"
-            params.append(end_date)
+            query += " AND r.business_day <= ?"
+            params.append(str(end_date))
         
         if store_id:
             query += " AND r.store_id = ?"
             params.append(store_id)
         
-        query += " GROUP BY r.receipt_id, li.line_item_id"
+        if location is not None:
+            query += " AND c.name = ?"
+            params.append(location)
         
-        df = pd.read_sql_query(query, conn, params=params)
-        conn.close()
+        if business_days is not None:
+            self._load_temp_days(conn.cursor(), business_days)
+            query += " AND r.business_day IN (SELECT business_day FROM temp.target_days)"
         
-        return df
+        row_key = "r.receipt_id, li.line_item_id" if needs_line else "r.receipt_id"
+        if ordered:
+            query += f" ORDER BY r.business_day, {row_key}"
+        return query, params
     
-    def get_receipt_count(self):
-        """Get total number of receipts in database"""
+    def get_receipts_dataframe(self, start_date=None, end_date=None, store_id=None, business_days=None):
+        """
+        Get receipts as DataFrame for dashboard with location from categories.
+        business_days optionally limits the result to an explicit set of Bangkok days.
+        """
+        frames = []
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM receipts")
-        count = cursor.fetchone()[0]
-        conn.close()
-        return count
+        try:
+            for path in self._receipt_sources(conn, start_date, end_date, business_days):
+                with self._receipt_source(conn, path) as schema:
+                    query, params = self._receipts_query(
+                        conn, start_date=start_date, end_date=end_date, store_id=store_id,
+                        business_days=business_days, schema=schema,
+                    )
+                    frames.append(pd.read_sql_query(query, conn, params=params))
+        finally:
+            conn.close()
+        
+        frames = [frame for frame in frames[:-1] if not frame.empty] + frames[-1:]
+        return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    
+    def iter_receipts(self, columns=None, start_date=None, end_date=None, store_id=None,
+                      location=None, chunk_size=50000, as_arrow=False):
+        """
+        Stream the receipts frame in fixed-size chunks with bounded memory.
+        
+        Only the requested columns are selected and only the joins they need are
+        made, so a projection without line-item columns is one row per receipt.
+        Date, store and location filters run in SQL. Rows are ordered by business
+        day and receipt. Yields DataFrames, or pyarrow Tables when as_arrow=True.
+        Archived months in the range are streamed first, oldest first.
+        
+        Each source's cursor is closed and its archive detached as soon as the
+        source is done or the consumer stops early, before the connection goes
+        back to the pool.
+        """
+        if as_arrow:
+            import pyarrow as pa
+        conn = self.get_connection()
+        try:
+            names, yielded = [], False
+            for path in self._receipt_sources(conn, start_date, end_date):
+                with self._receipt_source(conn, path) as schema:
+                    query, params = self._receipts_query(
+                        conn, columns=columns, start_date=start_date, end_date=end_date,
+                        store_id=store_id, location=location, ordered=True, schema=schema,
+                    )
+                    cursor = conn.execute(query, params)
+                    try:
+                        names = [description[0] for description in cursor.description]
+                        while True:
+                            rows = cursor.fetchmany(chunk_size)
+                            if not rows:
+                                break
+                            chunk = pd.DataFrame.from_records(rows, columns=names, coerce_float=True)
+                            yield pa.Table.from_pandas(chunk, preserve_index=False) if as_arrow else chunk
+                            yielded = True
+                    finally:
+                        cursor.close()
+            if not yielded:
+                # Nothing matched: one empty chunk with the projected columns
+                chunk = pd.DataFrame(columns=names)
+                yield pa.Table.from_pandas(chunk, preserve_index=False) if as_arrow else chunk
+        finally:
+            conn.close()
+    
+    def get_receipt_count(self):
+        """Get total number of receipts in database, archived months included (same source as get_database_stats)"""
+        return self.get_database_stats()['receipts']
     
     def get_date_range(self):
         """Get the date range of receipts in database"""
@@ -536,6 +1904,981 @@ class LoyverseDB:
         conn.close()
         return result
     
+    # ===== MAINTENANCE =====
+    
+    def _page_counts(self, conn):
+        return (
+            conn.execute("PRAGMA page_count").fetchone()[0],
+            conn.execute("PRAGMA freelist_count").fetchone()[0],
+        )
+    
+    def _run_maintenance_task(self, conn, task, full_vacuum=True):
+        """
+        Run one task on an idle connection; returns its result text. With
+        full_vacuum=False a vacuum that would need a full VACUUM is skipped.
+        """
+        if task == 'optimize':
+            conn.execute("PRAGMA optimize")
+            return "ok"
+        if task == 'analyze':
+            conn.execute("ANALYZE")
+            # Recount table_stats, which writes otherwise only adjust by deltas
+            self._refresh_table_stats(conn.cursor())
+            conn.commit()
+            return "ok"
+        if task == 'vacuum':
+            # auto_vacuum can only be switched on by a full VACUUM; after that
+            # freed pages are returned with cheap incremental vacuums
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                if not full_vacuum:
+                    return "skipped: needs one full VACUUM (scripts/db_maintenance.py)"
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+                return "full vacuum, auto_vacuum=incremental"
+            conn.execute("PRAGMA incremental_vacuum").fetchall()
+            return "incremental"
+        if task == 'integrity':
+            problems = [row[0] for row in conn.execute("PRAGMA integrity_check").fetchall()]
+            return "ok" if problems == ["ok"] else "; ".join(problems[:20])
+        raise ValueError(f"Unknown maintenance task {task!r}; expected one of {list(MAINTENANCE_INTERVALS)}")
+    
+    def run_maintenance(self, tasks=('optimize', 'analyze', 'vacuum', 'integrity'), full_vacuum=True):
+        """
+        Run maintenance tasks in order and record each one in maintenance_log
+        with its duration and page/freelist counts before and after. Returns
+        the log rows as dicts. full_vacuum=False never rewrites the whole file.
+        """
+        unknown = [task for task in tasks if task not in MAINTENANCE_INTERVALS]
+        if unknown:
+            raise ValueError(f"Unknown maintenance tasks {unknown}; expected any of {list(MAINTENANCE_INTERVALS)}")
+        if self.db_path == ":memory:":
+            return []
+        
+        results = []
+        conn = self.get_connection()
+        try:
+            for task in tasks:
+                if conn.in_transaction:
+                    conn.commit()
+                pages_before, freelist_before = self._page_counts(conn)
+                started_at = datetime.now().isoformat()
+                start = time.perf_counter()
+                try:
+                    result = self._run_maintenance_task(conn, task, full_vacuum)
+                except sqlite3.OperationalError as e:
+                    result = f"failed: {e}"
+                duration_ms = (time.perf_counter() - start) * 1000
+                pages_after, freelist_after = self._page_counts(conn)
+                entry = {
+                    'started_at': started_at,
+                    'task': task,
+                    'duration_ms': duration_ms,
+                    'pages_before': pages_before,
+                    'pages_after': pages_after,
+                    'freelist_before': freelist_before,
+                    'freelist_after': freelist_after,
+                    'result': result,
+                }
+                conn.execute(f"""
+                    INSERT INTO maintenance_log ({', '.join(entry)})
+                    VALUES ({', '.join('?' * len(entry))})
+                """, list(entry.values()))
+                conn.execute(
+                    "DELETE FROM maintenance_log WHERE id <= (SELECT MAX(id) FROM maintenance_log) - ?",
+                    (MAINTENANCE_LOG_KEPT,),
+                )
+                conn.commit()
+                results.append(entry)
+                print(f"🧹 {task}: {result} in {duration_ms:.0f} ms ({pages_before:,} → {pages_after:,} pages)")
+        finally:
+            conn.close()
+        return results
+    
+    def due_maintenance_tasks(self, now=None):
+        """Tasks whose MAINTENANCE_INTERVALS have elapsed since their last successful run"""
+        now = now or datetime.now()
+        conn = self.get_connection()
+        last_runs = dict(conn.execute("""
+            SELECT task, MAX(started_at) FROM maintenance_log
+            WHERE result NOT LIKE 'failed%' AND result NOT LIKE 'skipped%'
+            GROUP BY task
+        """).fetchall())
+        conn.close()
+        due = []
+        for task, hours in MAINTENANCE_INTERVALS.items():
+            last = last_runs.get(task)
+            if last is None or (now - datetime.fromisoformat(last)).total_seconds() >= hours * 3600:
+                due.append(task)
+        return due
+    
+    def run_scheduled_maintenance(self, now=None, tasks=None, full_vacuum=True):
+        """
+        Run only the due maintenance tasks (the post-sync hook), optionally
+        limited to tasks; the dashboard passes IN_REQUEST_MAINTENANCE_TASKS
+        and full_vacuum=False so a sync never waits on a whole-file rewrite.
+        """
+        due = self.due_maintenance_tasks(now)
+        if tasks is not None:
+            due = [task for task in due if task in tasks]
+        return self.run_maintenance(due, full_vacuum)
+    
+    def get_maintenance_log(self, limit=50):
+        """Most recent maintenance runs, newest first"""
+        conn = self.get_connection()
+        df = pd.read_sql_query(
+            """
+            SELECT started_at, task, duration_ms, pages_before, pages_after,
+                   freelist_before, freelist_after, result
+            FROM maintenance_log
+            ORDER BY id DESC
+            LIMIT ?
+            """,
+            conn,
+            params=[limit],
+        )
+        conn.close()
+        return df
+    
+    # ===== SYNC RUNS =====
+    
+    def open_sync_run(self, range_start, range_end, store_id, shards, fresh=False, now=None):
+        """
+        Checkpoints for a range sync. The newest unfinished run over the same
+        range, store and shards started within SYNC_RESUME_MAX_HOURS is resumed,
+        unless fresh; otherwise a new run is recorded with one pending row per
+        (shard_start, shard_end). Returns (run_id, state) where state maps
+        shard_start -> {'status', 'cursor', 'pages_done'}.
+        
+        Receipts created after a run started can fall in any shard whose
+        window ends later, so a resumed run restarts those shards from their
+        first page instead of trusting their status or cursor.
+        """
+        store_id = store_id or ''
+        shards = list(shards)
+        now = now or datetime.now()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            # Take the write lock before reading, so a concurrent sync (dashboard
+            # and worker) can neither pick the same new run_id nor the same run
+            if conn.in_transaction:
+                conn.commit()
+            cursor.execute("BEGIN IMMEDIATE")
+            run_id = None
+            if not fresh:
+                cursor.execute("""
+                    SELECT MAX(run_id) FROM sync_runs
+                    WHERE range_start = ? AND range_end = ? AND store_id = ? AND status != 'done'
+                      AND started_at >= ?
+                """, (range_start, range_end, store_id,
+                      (now - timedelta(hours=SYNC_RESUME_MAX_HOURS)).isoformat()))
+                run_id = cursor.fetchone()[0]
+            if run_id is not None:
+                cursor.execute("SELECT shard_start, started_at FROM sync_runs WHERE run_id = ?", (run_id,))
+                rows = cursor.fetchall()
+                if {row[0] for row in rows} != {start for start, _ in shards}:
+                    run_id = None
+                else:
+                    # started_at is local time; shard bounds are the API's UTC strings
+                    started_utc = datetime.fromisoformat(min(row[1] for row in rows)).astimezone(timezone.utc)
+                    cursor.execute("""
+                        UPDATE sync_runs SET status = 'pending', cursor = NULL, error = NULL, updated_at = ?
+                        WHERE run_id = ? AND shard_end > ? AND status != 'pending'
+                    """, (now.isoformat(), run_id, started_utc.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"))
+            if run_id is None:
+                run_id = cursor.execute("SELECT COALESCE(MAX(run_id), 0) + 1 FROM sync_runs").fetchone()[0]
+                cursor.executemany("""
+                    INSERT INTO sync_runs (run_id, range_start, range_end, store_id, shard_start, shard_end,
+                                           status, started_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, 'pending', ?, ?)
+                """, [
+                    (run_id, range_start, range_end, store_id, start, end, now.isoformat(), now.isoformat())
+                    for start, end in shards
+                ])
+                cursor.execute("DELETE FROM sync_runs WHERE run_id <= ?", (run_id - SYNC_RUNS_KEPT,))
+            cursor.execute(
+                "SELECT shard_start, status, cursor, pages_done FROM sync_runs WHERE run_id = ?", (run_id,)
+            )
+            state = {
+                shard_start: {'status': status, 'cursor': cursor_value, 'pages_done': pages_done}
+                for shard_start, status, cursor_value, pages_done in cursor.fetchall()
+            }
+            conn.commit()
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.close()
+        return run_id, state
+    
+    def checkpoint_sync_shard(self, run_id, shard_start, cursor=None, receipts=0, status='running', error=None):
+        """
+        Record one committed page of a shard: the cursor to continue from
+        (None once the shard is done) and the running page/receipt counts.
+        With receipts=None only the status and error are updated.
+        """
+        conn = self.get_connection()
+        if receipts is None:
+            conn.execute(
+                "UPDATE sync_runs SET status = ?, error = ?, updated_at = ? WHERE run_id = ? AND shard_start = ?",
+                (status, error, datetime.now().isoformat(), run_id, shard_start),
+            )
+        else:
+            conn.execute("""
+                UPDATE sync_runs
+                SET cursor = ?, pages_done = pages_done + 1, receipts_done = receipts_done + ?,
+                    status = ?, error = ?, updated_at = ?
+                WHERE run_id = ? AND shard_start = ?
+            """, (cursor, receipts, status, error, datetime.now().isoformat(), run_id, shard_start))
+        conn.commit()
+        conn.close()
+    
+    def get_sync_runs(self, limit=20):
+        """Recent range sync runs, newest first, with shard progress"""
+        conn = self.get_connection()
+        df = pd.read_sql_query(
+            """
+            SELECT run_id, range_start, range_end, store_id,
+                   COUNT(*) AS shards,
+                   SUM(status = 'done') AS shards_done,
+                   SUM(pages_done) AS pages_done,
+                   SUM(receipts_done) AS receipts_done,
+                   CASE
+                       WHEN SUM(status = 'done') = COUNT(*) THEN 'done'
+                       WHEN SUM(status = 'failed') > 0 THEN 'failed'
+                       ELSE 'incomplete'
+                   END AS status,
+                   MIN(started_at) AS started_at,
+                   MAX(updated_at) AS updated_at,
+                   MAX(error) AS error
+            FROM sync_runs
+            GROUP BY run_id
+            ORDER BY run_id DESC
+            LIMIT ?
+            """,
+            conn,
+            params=[limit],
+        )
+        conn.close()
+        return df
+    
+    # ===== ARCHIVE PARTITIONS =====
+    
+    # Closed months move out of the hot database into one SQLite file per month.
+    # Read paths ATTACH only the months a date range needs, one at a time.
+    ARCHIVE_SCHEMA = 'archive_part'
+    
+    # Receipt tables copied into a partition: table -> (id column, extra condition)
+    ARCHIVE_TABLES = {
+        'receipts': ('receipt_id', ""),
+        'line_items': ('receipt_id', ""),
+        'payments': ('receipt_id', ""),
+        'receipt_payment_summary': ('receipt_id', ""),
+        'raw_payloads': ('entity_id', "entity = 'receipt' AND "),
+    }
+    
+    ARCHIVE_INDEXES = (
+        "CREATE INDEX IF NOT EXISTS {schema}.idx_receipts_business_day ON receipts(business_day, store_id)",
+        "CREATE INDEX IF NOT EXISTS {schema}.idx_line_items_receipt ON line_items(receipt_id)",
+        "CREATE INDEX IF NOT EXISTS {schema}.idx_payments_receipt ON payments(receipt_id)",
+    )
+    
+    def archive_path(self, month):
+        """Partition file for a 'YYYY-MM' month, kept next to the database file"""
+        return f"{os.path.splitext(self.db_path)[0]}.archive-{month}.db"
+    
+    def _archive_partitions(self, conn, start_date=None, end_date=None, business_days=None):
+        """(month, path) of archived months overlapping a business-day range or day set"""
+        query = "SELECT month, path FROM archive_partitions WHERE 1=1"
+        params = []
+        if start_date:
+            query += " AND month >= ?"
+            params.append(str(start_date)[:7])
+        if end_date:
+            query += " AND month <= ?"
+            params.append(str(end_date)[:7])
+        rows = conn.execute(query + " ORDER BY month", params).fetchall()
+        if business_days is not None:
+            months = {str(day)[:7] for day in business_days if day}
+            rows = [row for row in rows if row[0] in months]
+        return rows
+    
+    def _attach_archive(self, conn, path):
+        """
+        ATTACH a partition file as ARCHIVE_SCHEMA, creating missing tables and
+        columns. SQLite cannot attach inside a transaction, and committing the
+        caller's half-done work here would break its atomicity, so attach first.
+        """
+        if conn.in_transaction:
+            raise RuntimeError("Attach archive partitions before opening a write transaction")
+        schema = self.ARCHIVE_SCHEMA
+        if any(row[1] == schema for row in conn.execute("PRAGMA database_list").fetchall()):
+            conn.execute(f"DETACH DATABASE {schema}")
+        conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+        
+        cursor = conn.cursor()
+        for table in self.ARCHIVE_TABLES:
+            cursor.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,))
+            create_sql = cursor.fetchone()[0]
+            cursor.execute(create_sql.replace(f"CREATE TABLE {table}", f"CREATE TABLE IF NOT EXISTS {schema}.{table}", 1))
+            # Columns added to the hot schema after the month was archived
+            cursor.execute(f"PRAGMA {schema}.table_info({table})")
+            existing = {row[1] for row in cursor.fetchall()}
+            for column, col_type in self._table_columns(cursor, table):
+                if column not in existing:
+                    cursor.execute(f"ALTER TABLE {schema}.{table} ADD COLUMN {column} {col_type}")
+        for statement in self.ARCHIVE_INDEXES:
+            cursor.execute(statement.format(schema=schema))
+        conn.commit()
+    
+    def _detach_archive(self, conn):
+        """DETACH ARCHIVE_SCHEMA; the caller commits or rolls back its work first"""
+        conn.execute(f"DETACH DATABASE {self.ARCHIVE_SCHEMA}")
+    
+    def _table_columns(self, cursor, table, schema='main'):
+        cursor.execute(f"PRAGMA {schema}.table_info({table})")
+        return [(row[1], row[2]) for row in cursor.fetchall()]
+    
+    def _receipt_sources(self, conn, start_date=None, end_date=None, business_days=None):
+        """
+        Sources a range needs, for _receipt_source: the partition file of every
+        overlapping archived month, then None for the hot 'main' database.
+        """
+        paths = []
+        for month, path in self._archive_partitions(conn, start_date, end_date, business_days):
+            if not os.path.exists(path):
+                print(f"⚠️ Archive partition {month} is missing: {path}")
+                continue
+            paths.append(path)
+        return paths + [None]
+    
+    @contextmanager
+    def _receipt_source(self, conn, path):
+        """
+        Schema to read receipt tables from for one _receipt_sources entry. An
+        archive is attached for the with block only, so it is detached before
+        the caller moves on or returns the connection, even on an early exit.
+        """
+        if path is None:
+            yield 'main'
+            return
+        self._attach_archive(conn, path)
+        try:
+            yield self.ARCHIVE_SCHEMA
+        finally:
+            self._detach_archive(conn)
+    
+    def _update_partition_stats(self, cursor, month, path):
+        """Record the row counts and created_at range of the attached partition for a month"""
+        schema = self.ARCHIVE_SCHEMA
+        cursor.execute(f"""
+            INSERT OR REPLACE INTO archive_partitions (
+                month, path, receipt_count, line_item_count, min_created_at, max_created_at, archived_at
+            ) VALUES (
+                ?, ?,
+                (SELECT COUNT(*) FROM {schema}.receipts),
+                (SELECT COUNT(*) FROM {schema}.line_items),
+                (SELECT MIN(created_at) FROM {schema}.receipts),
+                (SELECT MAX(created_at) FROM {schema}.receipts),
+                COALESCE((SELECT archived_at FROM archive_partitions WHERE month = ?), ?)
+            )
+        """, (month, path, month, datetime.now().isoformat()))
+    
+    def _copy_target_receipts(self, cursor, source, target):
+        """Copy the receipts in temp.target_receipt_ids and their children between schemas"""
+        for table, (id_column, condition) in self.ARCHIVE_TABLES.items():
+            columns = ", ".join(column for column, _ in self._table_columns(cursor, table))
+            cursor.execute(f"""
+                INSERT OR REPLACE INTO {target}.{table} ({columns})
+                SELECT {columns} FROM {source}.{table}
+                WHERE {condition}{id_column} IN (SELECT receipt_id FROM temp.target_receipt_ids)
+            """)
+    
+    def archive_month(self, month):
+        """
+        Move one 'YYYY-MM' month of receipts, line items, payments, payment
+        summaries and raw payloads into its partition file. The daily sales
+        summary keeps the month's rows, so summaries are unaffected. Returns
+        {'month', 'path', 'rows': {table: count}} for the rows moved.
+        """
+        if self.db_path == ":memory:":
+            raise ValueError("Archive partitions need a database file")
+        path = self.archive_path(month)
+        schema = self.ARCHIVE_SCHEMA
+        conn = self.get_connection()
+        try:
+            self._attach_archive(conn, path)
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT receipt_id FROM receipts WHERE business_day >= ? AND business_day <= ?",
+                (f"{month}-01", f"{month}-31"),
+            )
+            self._load_temp_receipt_ids(cursor, [row[0] for row in cursor.fetchall()])
+            self._copy_target_receipts(cursor, 'main', schema)
+            counts = self._delete_target_receipt_rows(cursor)
+            
+            self._update_partition_stats(cursor, month, path)
+            self._adjust_table_stats(cursor, {'receipts': -counts['receipts'], 'line_items': -counts['line_items']})
+            conn.commit()
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._detach_archive(conn)
+            conn.close()
+        print(f"📦 Archived {month}: {counts['receipts']} receipts, {counts['line_items']} line items → {path}")
+        return {'month': month, 'path': path, 'rows': counts}
+    
+    def archive_months(self, keep_months=3, today=None):
+        """
+        Archive every month older than the newest keep_months months (the
+        current month included), so the hot database holds recent weeks only.
+        Returns one archive_month() result per month moved.
+        """
+        if keep_months < 1:
+            raise ValueError("keep_months must keep at least the current month")
+        today = today or datetime.now().date()
+        month_index = today.year * 12 + today.month - 1 - (keep_months - 1)
+        cutoff = f"{month_index // 12:04d}-{month_index % 12 + 1:02d}-01"
+        
+        conn = self.get_connection()
+        months = [row[0] for row in conn.execute("""
+            SELECT DISTINCT SUBSTR(business_day, 1, 7) FROM receipts
+            WHERE business_day IS NOT NULL AND business_day < ?
+            ORDER BY 1
+        """, (cutoff,)).fetchall()]
+        conn.close()
+        return [self.archive_month(month) for month in months]
+    
+    def restore_month(self, month):
+        """Move an archived month back into the hot database and delete its partition file"""
+        conn = self.get_connection()
+        row = conn.execute("SELECT path FROM archive_partitions WHERE month = ?", (month,)).fetchone()
+        if row is None:
+            conn.close()
+            return {'month': month, 'path': None, 'rows': {}}
+        path = row[0]
+        schema = self.ARCHIVE_SCHEMA
+        counts = {}
+        try:
+            if os.path.exists(path):
+                self._attach_archive(conn, path)
+                cursor = conn.cursor()
+                cursor.execute(f"SELECT receipt_id FROM {schema}.receipts")
+                self._load_temp_receipt_ids(cursor, [r[0] for r in cursor.fetchall()])
+                self._copy_target_receipts(cursor, schema, 'main')
+                counts = self._delete_target_receipt_rows(cursor, schema)
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM archive_partitions WHERE month = ?", (month,))
+            self._adjust_table_stats(cursor, {
+                'receipts': counts.get('receipts', 0), 'line_items': counts.get('line_items', 0),
+            })
+            conn.commit()
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            if any(r[1] == schema for r in conn.execute("PRAGMA database_list").fetchall()):
+                self._detach_archive(conn)
+            conn.close()
+        if os.path.exists(path):
+            os.remove(path)
+        print(f"📤 Restored {month}: {counts.get('receipts', 0)} receipts from {path}")
+        return {'month': month, 'path': path, 'rows': counts}
+    
+    def get_archive_partitions(self):
+        """Archived months with their files and row counts"""
+        conn = self.get_connection()
+        df = pd.read_sql_query(
+            "SELECT month, path, receipt_count, line_item_count, archived_at FROM archive_partitions ORDER BY month",
+            conn,
+        )
+        conn.close()
+        return df
+    
+    # ===== RAW PAYLOADS =====
+    
+    def _save_raw_payloads(self, cursor, entity, items):
+        """Compress and upsert (entity_id, payload) pairs into raw_payloads"""
+        cursor.executemany(
+            "INSERT OR REPLACE INTO raw_payloads (entity, entity_id, codec, payload) VALUES (?, ?, ?, ?)",
+            [
+                (entity, entity_id, RAW_PAYLOAD_CODEC, compress_payload(payload))
+                for entity_id, payload in items
+                if entity_id is not None
+            ],
+        )
+    
+    def get_raw_payload(self, entity, entity_id):
+        """Original API payload for an entity ('receipt', 'customer', 'store', 'employee'), or None"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT codec, payload FROM raw_payloads WHERE entity = ? AND entity_id = ?",
+            (entity, entity_id),
+        )
+        row = cursor.fetchone()
+        conn.close()
+        return decompress_payload(*row) if row else None
+    
+    def get_raw_receipt(self, receipt_id):
+        """Original Loyverse receipt JSON for drill-downs and audits, or None"""
+        return self.get_raw_payload('receipt', receipt_id)
+    
+    # ===== DATA VERSION & RECEIPTS SNAPSHOT =====
+    
+    def _bump_data_version(self, cursor, business_days=None, scope='receipts'):
+        """
+        Advance a data version inside the caller's transaction. For receipts the
+        touched business days are logged; None means the whole history changed.
+        """
+        cursor.execute(
+            "UPDATE data_versions SET version = version + 1, last_updated = ? WHERE scope = ?",
+            (datetime.now().isoformat(), scope),
+        )
+        if scope != 'receipts':
+            return
+        version = self._read_data_version(cursor)
+        if business_days is None:
+            cursor.execute("INSERT INTO data_changes (version, business_day) VALUES (?, NULL)", (version,))
+        else:
+            cursor.executemany(
+                "INSERT INTO data_changes (version, business_day) VALUES (?, ?)",
+                [(version, day) for day in sorted(day for day in business_days if day)] or [(version, '')],
+            )
+        cursor.execute("DELETE FROM data_changes WHERE version <= ?", (version - DATA_CHANGES_KEPT,))
+    
+    def _read_data_version(self, cursor, scope='receipts'):
+        cursor.execute("SELECT version FROM data_versions WHERE scope = ?", (scope,))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    
+    def get_data_version(self, scope='receipts'):
+        """Current data version; changes whenever the scope's data is written"""
+        conn = self.get_connection()
+        version = self._read_data_version(conn.cursor(), scope)
+        conn.close()
+        return version
+    
+    def _changed_days_since(self, since_version, current_version):
+        """Business days changed after since_version, or None if a full reload is needed"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT version, business_day FROM data_changes WHERE version > ? AND version <= ?",
+            (since_version, current_version),
+        )
+        rows = cursor.fetchall()
+        conn.close()
+        if len({version for version, _ in rows}) != current_version - since_version:
+            return None  # change log was pruned past the snapshot
+        if any(day is None for _, day in rows):
+            return None
+        return {day for _, day in rows if day}
+    
+    @property
+    def snapshot_path(self):
+        """Columnar snapshot of the full receipts frame, kept next to the database file"""
+        return f"{os.path.splitext(self.db_path)[0]}.receipts.parquet"
+    
+    def _read_snapshot(self):
+        """Memory-map the receipts snapshot; returns (df, version) or (None, None)"""
+        import pyarrow.parquet as pq
+        if not os.path.exists(self.snapshot_path):
+            return None, None
+        try:
+            table = pq.read_table(self.snapshot_path, memory_map=True)
+            metadata = table.schema.metadata or {}
+            if int(metadata.get(b'snapshot_format', b'0')) != SNAPSHOT_FORMAT:
+                return None, None
+            return table.to_pandas(), int(metadata[b'data_version'])
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable receipts snapshot {self.snapshot_path}: {e}")
+            return None, None
+    
+    def _write_snapshot(self, df, version):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            b'data_version': str(version).encode(),
+            b'snapshot_format': str(SNAPSHOT_FORMAT).encode(),
+        })
+        tmp_path = f"{self.snapshot_path}.tmp"
+        try:
+            pq.write_table(table, tmp_path)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            print(f"⚠️ Could not write receipts snapshot {self.snapshot_path}: {e}")
+    
+    def load_receipts_snapshot(self):
+        """
+        Full-history get_receipts_dataframe() served from a Parquet snapshot.
+        
+        The snapshot is used as-is when its data version matches the database;
+        otherwise only the business days changed since then are re-queried and
+        patched in. Falls back to the SQL join if pyarrow is unavailable.
+        """
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return self.get_receipts_dataframe()
+        if self.db_path == ":memory:":
+            return self.get_receipts_dataframe()
+        
+        # Read the version before the data so a concurrent write is re-patched next time
+        current_version = self.get_data_version()
+        snapshot_df, snapshot_version = self._read_snapshot()
+        if snapshot_df is not None and snapshot_version == current_version:
+            return snapshot_df
+        
+        df = None
+        if snapshot_df is not None and snapshot_version < current_version:
+            changed_days = self._changed_days_since(snapshot_version, current_version)
+            if changed_days is not None:
+                df = snapshot_df[~snapshot_df['business_day'].isin(changed_days)]
+                if changed_days:
+                    fresh = self.get_receipts_dataframe(business_days=changed_days)
+                    if not fresh.empty:
+                        df = pd.concat([df, fresh], ignore_index=True)
+                df = df.reset_index(drop=True)
+        if df is None:
+            df = self.get_receipts_dataframe()
+        
+        self._write_snapshot(df, current_version)
+        return df
+    
+    # ===== ANALYTICS ENGINE =====
+    
+    # Grouped aggregations written in the dialect DuckDB and SQLite share. Each
+    # runs over {source}, a receipt-grain relation with the columns below, and
+    # {filters}, the business-day / store conditions. Money is summed in satang.
+    ANALYTICS_SOURCE_COLUMNS = (
+        "store_id", "bill_number", "business_day", "local_hour", "local_weekday",
+        "customer_id", "receipt_type", "signed_net_satang",
+    )
+    
+    ANALYTICS_QUERIES = {
+        'hourly_peaks': """
+            SELECT local_weekday, local_hour,
+                   COUNT(*) AS receipts,
+                   COUNT(DISTINCT business_day) AS days,
+                   COUNT(DISTINCT customer_id) AS customers,
+                   SUM(signed_net_satang) / 100.0 AS signed_net
+            FROM {source}
+            WHERE local_hour IS NOT NULL {filters}
+            GROUP BY local_weekday, local_hour
+            ORDER BY local_weekday, local_hour
+        """,
+        'customer_lifetime': """
+            SELECT customer_id,
+                   MIN(business_day) AS first_day,
+                   MAX(business_day) AS last_day,
+                   COUNT(*) AS receipts,
+                   COUNT(DISTINCT business_day) AS active_days,
+                   COUNT(CASE WHEN LOWER(COALESCE(receipt_type, '')) = 'refund' THEN 1 END) AS refunds,
+                   SUM(signed_net_satang) / 100.0 AS signed_net
+            FROM {source}
+            WHERE customer_id IS NOT NULL AND customer_id <> '' {filters}
+            GROUP BY customer_id
+            ORDER BY signed_net DESC, customer_id
+        """,
+        'monthly_trend': """
+            SELECT CAST(SUBSTR(business_day, 1, 4) AS INTEGER) AS year,
+                   CAST(SUBSTR(business_day, 6, 2) AS INTEGER) AS month,
+                   COUNT(*) AS receipts,
+                   COUNT(DISTINCT business_day) AS days,
+                   SUM(signed_net_satang) / 100.0 AS signed_net
+            FROM {source}
+            WHERE business_day IS NOT NULL {filters}
+            GROUP BY 1, 2
+            ORDER BY 1, 2
+        """,
+    }
+    
+    # Arrow types of the analytics snapshot columns, in ANALYTICS_SOURCE_COLUMNS order
+    ANALYTICS_SNAPSHOT_TYPES = (
+        "string", "string", "string", "int64", "int64", "string", "string", "int64",
+    )
+    
+    @property
+    def analytics_snapshot_path(self):
+        """Receipt-grain Parquet file the DuckDB engine reads, kept next to the database file"""
+        return f"{os.path.splitext(self.db_path)[0]}.analytics.parquet"
+    
+    def _write_analytics_snapshot(self, version):
+        """
+        Stream the receipt-grain analytics columns (archived months included)
+        into the analytics snapshot chunk by chunk, so full history is never
+        held in memory at once.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = pa.schema(
+            [pa.field(col, pa.type_for_alias(type_name)) for col, type_name in zip(self.ANALYTICS_SOURCE_COLUMNS, self.ANALYTICS_SNAPSHOT_TYPES)],
+            metadata={b'data_version': str(version).encode(), b'snapshot_format': str(SNAPSHOT_FORMAT).encode()},
+        )
+        path = self.analytics_snapshot_path
+        tmp_path = f"{path}.tmp"
+        try:
+            with pq.ParquetWriter(tmp_path, schema) as writer:
+                for chunk in self.iter_receipts(columns=self.ANALYTICS_SOURCE_COLUMNS, as_arrow=True):
+                    writer.write_table(chunk.select(list(self.ANALYTICS_SOURCE_COLUMNS)).cast(schema))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Could not write analytics snapshot {path}: {e}")
+            return False
+        return True
+    
+    def _analytics_snapshot_is_current(self, version):
+        """True when the analytics snapshot matches the receipts data version (schema read only)"""
+        import pyarrow.parquet as pq
+        if not os.path.exists(self.analytics_snapshot_path):
+            return False
+        try:
+            metadata = pq.read_schema(self.analytics_snapshot_path).metadata or {}
+        except Exception:
+            return False
+        return (
+            int(metadata.get(b'snapshot_format', b'0')) == SNAPSHOT_FORMAT
+            and int(metadata.get(b'data_version', b'-1')) == version
+        )
+    
+    def _duckdb_analytics_source(self):
+        """read_parquet over a current analytics snapshot; None when DuckDB cannot be used"""
+        if duckdb is None or self.db_path == ":memory:":
+            return None
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return None
+        # Read the version before the data so a concurrent write is exported next time
+        version = self.get_data_version()
+        if not self._analytics_snapshot_is_current(version) and not self._write_analytics_snapshot(version):
+            return None
+        path = self.analytics_snapshot_path.replace("'", "''")
+        return f"read_parquet('{path}')"
+    
+    def _sqlite_analytics_source(self, conn, start_date=None, end_date=None):
+        """
+        Hot receipts plus the archived months start..end needs. Archived rows
+        are copied into temp.analytics_archive through _receipt_sources, since
+        only one partition is attached at a time.
+        """
+        columns = list(self.ANALYTICS_SOURCE_COLUMNS)
+        cursor = conn.cursor()
+        cursor.execute("DROP TABLE IF EXISTS temp.analytics_archive")
+        cursor.execute(f"CREATE TEMP TABLE analytics_archive ({', '.join(columns)})")
+        for path in self._receipt_sources(conn, start_date, end_date)[:-1]:
+            with self._receipt_source(conn, path) as schema:
+                query, params = self._receipts_query(conn, columns=columns, start_date=start_date,
+                                                     end_date=end_date, schema=schema)
+                cursor.execute(f"INSERT INTO temp.analytics_archive {query}", params)
+                conn.commit()
+        hot_query, _ = self._receipts_query(conn, columns=columns)
+        return f"({hot_query} UNION ALL SELECT {', '.join(columns)} FROM temp.analytics_archive)"
+    
+    def analytics_query(self, name, start_date=None, end_date=None, store_id=None, engine=None):
+        """
+        Run a named long-history aggregation and return the grouped DataFrame.
+        
+        With engine='duckdb' (the default when duckdb is installed) the query
+        runs vectorized over a receipt-grain Parquet snapshot, re-exported in
+        streamed chunks when stale, so full history never passes through
+        pandas. engine='sqlite', or a missing duckdb/pyarrow, runs the same SQL
+        against the receipts table and the archived months the range covers.
+        monthly_trend also gets prev_year_signed_net and yoy_change columns.
+        """
+        if name not in self.ANALYTICS_QUERIES:
+            raise ValueError(f"Unknown analytics query {name!r}; expected one of {sorted(self.ANALYTICS_QUERIES)}")
+        engine = engine or ANALYTICS_ENGINE
+        if engine not in ('duckdb', 'sqlite'):
+            raise ValueError(f"Unknown analytics engine {engine!r}")
+        
+        filters, params = "", []
+        if start_date:
+            filters += " AND business_day >= ?"
+            params.append(str(start_date))
+        if end_date:
+            filters += " AND business_day <= ?"
+            params.append(str(end_date))
+        if store_id:
+            filters += " AND store_id = ?"
+            params.append(store_id)
+        
+        source = self._duckdb_analytics_source() if engine == 'duckdb' else None
+        if source is not None:
+            con = duckdb.connect()
+            try:
+                df = con.execute(self.ANALYTICS_QUERIES[name].format(source=source, filters=filters), params).df()
+            finally:
+                con.close()
+        else:
+            conn = self.get_connection()
+            try:
+                source = self._sqlite_analytics_source(conn, start_date, end_date)
+                query = self.ANALYTICS_QUERIES[name].format(source=source, filters=filters)
+                df = pd.read_sql_query(query, conn, params=params)
+                conn.execute("DROP TABLE IF EXISTS temp.analytics_archive")
+            finally:
+                conn.close()
+        
+        if name == 'monthly_trend':
+            previous = df[['year', 'month', 'signed_net']].assign(year=df['year'] + 1)
+            df = df.merge(
+                previous.rename(columns={'signed_net': 'prev_year_signed_net'}), on=['year', 'month'], how='left'
+            )
+            base = df['prev_year_signed_net'].abs()
+            df['yoy_change'] = (df['signed_net'] - df['prev_year_signed_net']) / base.where(base != 0)
+        return df
+    
+    # ===== DAILY SALES SUMMARY =====
+    
+    # Receipt-grain measures match the dashboard contract: signed net is
+    # total_money - total_discount, negated for refunds. Sums run over integer
+    # satang and are converted to baht once per group. A receipt's location is
+    # the category of its first categorized line by line_item_id, the line order
+    # of the receipts frame, so it matches the dashboard's per-receipt "first";
+    # its payment key is its payment type ids joined with '+' in payment order
+    # (the same shape as bill_type).
+    DAILY_SUMMARY_SELECT = """
+        SELECT
+            business_day,
+            COALESCE(store_id, ''),
+            COALESCE(location, ''),
+            COALESCE(payment_type_ids, ''),
+            COALESCE(customer_id, ''),
+            SUM(signed_net) / 100.0,
+            SUM(CASE WHEN is_refund THEN 0 ELSE total_money END) / 100.0,
+            SUM(CASE WHEN is_refund THEN total_money ELSE 0 END) / 100.0,
+            SUM(total_discount) / 100.0,
+            COUNT(*),
+            SUM(quantity)
+        FROM (
+            SELECT
+                r.business_day,
+                r.store_id,
+                r.customer_id,
+                LOWER(COALESCE(r.receipt_type, '')) = 'refund' AS is_refund,
+                COALESCE(r.total_money_satang, 0) AS total_money,
+                COALESCE(r.total_discount_satang, 0) AS total_discount,
+                COALESCE(r.signed_net_satang, 0) AS signed_net,
+                (
+                    SELECT c.name
+                    FROM {schema}.line_items li
+                    JOIN items i ON li.item_key = i.item_key
+                    JOIN categories c ON i.category_id = c.category_id
+                    WHERE li.receipt_id = r.receipt_id AND c.name IS NOT NULL
+                    ORDER BY li.line_item_id
+                    LIMIT 1
+                ) AS location,
+                ps.payment_type_ids,
+                (
+                    SELECT COALESCE(SUM(li.quantity), 0) FROM {schema}.line_items li WHERE li.receipt_id = r.receipt_id
+                ) AS quantity
+            FROM {schema}.receipts r
+            LEFT JOIN {schema}.receipt_payment_summary ps ON r.receipt_id = ps.receipt_id
+            WHERE r.business_day IS NOT NULL {day_filter}
+        )
+        GROUP BY 1, 2, 3, 4, 5
+    """
+    
+    DAILY_SUMMARY_INSERT = """
+        INSERT INTO daily_sales_summary (
+            business_day, store_id, location, payment_type_ids, customer_id,
+            signed_net, gross_sales, refunds, discount, receipt_count, quantity
+        )
+    """
+    
+    def _load_temp_receipt_ids(self, cursor, receipt_ids):
+        """Fill the connection's temp.target_receipt_ids table with receipt IDs"""
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS target_receipt_ids (receipt_id TEXT PRIMARY KEY)")
+        cursor.execute("DELETE FROM temp.target_receipt_ids")
+        cursor.executemany(
+            "INSERT OR IGNORE INTO temp.target_receipt_ids (receipt_id) VALUES (?)",
+            [(receipt_id,) for receipt_id in receipt_ids],
+        )
+    
+    def _load_temp_days(self, cursor, business_days):
+        """Fill the connection's temp.target_days table with business days"""
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS target_days (business_day TEXT PRIMARY KEY)")
+        cursor.execute("DELETE FROM temp.target_days")
+        cursor.executemany(
+            "INSERT OR IGNORE INTO temp.target_days (business_day) VALUES (?)",
+            [(day,) for day in business_days],
+        )
+    
+    def _refresh_daily_summary(self, cursor, business_days, schema='main'):
+        """
+        Recompute summary rows for only the given business days, from the
+        receipts in schema (an attached archive partition for archived days)
+        """
+        days = sorted(day for day in business_days if day)
+        if not days:
+            return
+        self._load_temp_days(cursor, days)
+        cursor.execute("""
+            DELETE FROM daily_sales_summary
+            WHERE business_day IN (SELECT business_day FROM temp.target_days)
+        """)
+        cursor.execute(self.DAILY_SUMMARY_INSERT + self.DAILY_SUMMARY_SELECT.format(
+            schema=schema, day_filter="AND r.business_day IN (SELECT business_day FROM temp.target_days)"
+        ))
+    
+    def _rebuild_daily_summary(self, cursor):
+        # Archived months keep the summary rows computed before they moved out
+        hot_days = "SUBSTR({}business_day, 1, 7) NOT IN (SELECT month FROM archive_partitions)"
+        cursor.execute(f"DELETE FROM daily_sales_summary WHERE {hot_days.format('')}")
+        cursor.execute(self.DAILY_SUMMARY_INSERT + self.DAILY_SUMMARY_SELECT.format(
+            schema='main', day_filter=f"AND {hot_days.format('r.')}"
+        ))
+    
+    def rebuild_daily_summary(self):
+        """Rebuild the whole daily sales summary (e.g. after locations were re-mapped)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        self._rebuild_daily_summary(cursor)
+        conn.commit()
+        conn.close()
+    
+    def get_daily_summary(self, start_date=None, end_date=None, store_id=None, group_by=("business_day",)):
+        """
+        Read pre-aggregated sales for a Bangkok business-day range.
+        
+        group_by picks the dimensions to keep (any of business_day, store_id,
+        location, payment_type_ids, customer_id); measures are summed over the rest.
+        Empty strings in dimension columns mean "none" (walk-in, no payment, ...).
+        """
+        dimensions = ["business_day", "store_id", "location", "payment_type_ids", "customer_id"]
+        group_cols = [col for col in group_by if col in dimensions]
+        if len(group_cols) != len(group_by):
+            raise ValueError(f"group_by must be drawn from {dimensions}")
+        
+        select_cols = ", ".join(group_cols + [
+            "SUM(signed_net) AS signed_net",
+            "SUM(gross_sales) AS gross_sales",
+            "SUM(refunds) AS refunds",
+            "SUM(discount) AS discount",
+            "SUM(receipt_count) AS receipt_count",
+            "SUM(quantity) AS quantity",
+        ])
+        query = f"SELECT {select_cols} FROM daily_sales_summary WHERE 1=1"
+        params = []
+        if start_date:
+            query += " AND business_day >= ?"
+            params.append(str(start_date))
+        if end_date:
+            query += " AND business_day <= ?"
+            params.append(str(end_date))
+        if store_id:
+            query += " AND store_id = ?"
+            params.append(store_id)
+        if group_cols:
+            query += f" GROUP BY {', '.join(group_cols)} ORDER BY {', '.join(group_cols)}"
+        
+        conn = self.get_connection()
+        df = pd.read_sql_query(query, conn, params=params)
+        conn.close()
+        return df
+    
     # ===== SYNC METADATA =====
     
     def update_sync_time(self, key, value=None):
@@ -547,6 +2890,8 @@ class LoyverseDB:
             INSERT OR REPLACE INTO sync_metadata (key, value, last_updated)
             VALUES (?, ?, ?)
         """, (key, value or "", datetime.now().isoformat()))
+        # Last sync times are part of get_database_stats
+        self._bump_data_version(cursor, scope='stats')
         
         conn.commit()
         conn.close()
@@ -559,25 +2904,54 @@ class LoyverseDB:
         result = cursor.fetchone()
         conn.close()
         return result[0] if result else None
-    
+
+    def get_receipts_watermark(self, fallback=True):
+        """
+        Newest receipt updated_at seen by the incremental sync (stored with
+        update_sync_time under RECEIPTS_WATERMARK_KEY); before the first
+        incremental run, the newest updated_at among stored receipts unless
+        fallback is False.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT value FROM sync_metadata WHERE key = ?", (RECEIPTS_WATERMARK_KEY,))
+        result = cursor.fetchone()
+        if fallback and (not result or not result[0]):
+            cursor.execute("SELECT MAX(updated_at) FROM receipts WHERE updated_at IS NOT NULL")
+            result = cursor.fetchone()
+        conn.close()
+        return result[0] if result else None
+
+    def set_receipts_watermark(self, updated_at):
+        """Advance the incremental sync watermark to a receipt updated_at"""
+        self.update_sync_time(RECEIPTS_WATERMARK_KEY, updated_at)
+
+    def get_customers_watermark(self):
+        """Newest customer updated_at fetched incrementally, or None before the first full fetch"""
+        conn = self.get_connection()
+        result = conn.execute("SELECT value FROM sync_metadata WHERE key = ?", (CUSTOMERS_WATERMARK_KEY,)).fetchone()
+        conn.close()
+        return result[0] if result and result[0] else None
+
+    def set_customers_watermark(self, updated_at):
+        """Advance the customers watermark to a customer updated_at"""
+        self.update_sync_time(CUSTOMERS_WATERMARK_KEY, updated_at)
+
     # ===== PAYMENT TYPES METHODS =====
     
     def save_payment_types(self, payment_types):
-        """Save or update payment types in database"""
+        """Save new or changed payment types; returns the number received"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        for pt in payment_types:
-            cursor.execute("""
-                INSERT OR REPLACE INTO payment_types (
-                    payment_type_id, name, type, last_updated
-                ) VALUES (?, ?, ?, ?)
-            """, (
-                pt.get('id'),
-                pt.get('name'),
-                pt.get('type'),
-                datetime.now().isoformat()
-            ))
+        result = self._upsert_metadata(cursor, 'payment_types', ['payment_type_id', 'name', 'type'], [
+            (pt, (pt.get('id'), pt.get('name'), pt.get('type')))
+            for pt in payment_types
+        ])
+        
+        if result['inserted'] or result['updated']:
+            self._adjust_table_stats(cursor, {'payment_types': result['inserted']})
+            self._bump_data_version(cursor, scope='metadata')
         
         conn.commit()
         conn.close()
@@ -609,10 +2983,11 @@ class LoyverseDB:
     # ===== STORES METHODS =====
     
     def save_stores(self, stores):
-        """Save or update stores in database"""
+        """Save new or changed stores; returns the number received"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
+        records = []
         for store in stores:
             address = store.get('address', {})
             
@@ -633,12 +3008,7 @@ class LoyverseDB:
                 city = None
                 country = None
             
-            cursor.execute("""
-                INSERT OR REPLACE INTO stores (
-                    store_id, name, address_line1, address_line2, city, 
-                    country, phone, last_updated, raw_data
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
+            records.append((store, (
                 store.get('id'),
                 store.get('name'),
                 address_line1,
@@ -646,9 +3016,15 @@ class LoyverseDB:
                 city,
                 country,
                 store.get('phone'),
-                datetime.now().isoformat(),
-                json.dumps(store)
-            ))
+            )))
+        
+        result = self._upsert_metadata(cursor, 'stores', [
+            'store_id', 'name', 'address_line1', 'address_line2', 'city', 'country', 'phone',
+        ], records, entity='store')
+        
+        if result['inserted'] or result['updated']:
+            self._adjust_table_stats(cursor, {'stores': result['inserted']})
+            self._bump_data_version(cursor, scope='metadata')
         
         conn.commit()
         conn.close()
@@ -680,23 +3056,18 @@ class LoyverseDB:
     # ===== EMPLOYEES METHODS =====
     
     def save_employees(self, employees):
-        """Save or update employees in database"""
+        """Save new or changed employees; returns the number received"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        for emp in employees:
-            cursor.execute("""
-                INSERT OR REPLACE INTO employees (
-                    employee_id, name, email, phone, last_updated, raw_data
-                ) VALUES (?, ?, ?, ?, ?, ?)
-            """, (
-                emp.get('id'),
-                emp.get('name'),
-                emp.get('email'),
-                emp.get('phone'),
-                datetime.now().isoformat(),
-                json.dumps(emp)
-            ))
+        result = self._upsert_metadata(cursor, 'employees', ['employee_id', 'name', 'email', 'phone'], [
+            (emp, (emp.get('id'), emp.get('name'), emp.get('email'), emp.get('phone')))
+            for emp in employees
+        ], entity='employee')
+        
+        if result['inserted'] or result['updated']:
+            self._adjust_table_stats(cursor, {'employees': result['inserted']})
+            self._bump_data_version(cursor, scope='metadata')
         
         conn.commit()
         conn.close()
@@ -728,21 +3099,22 @@ class LoyverseDB:
     # ===== CATEGORIES METHODS =====
     
     def save_categories(self, categories):
-        """Save or update categories (locations) in database"""
+        """Save new or changed categories (locations); returns the number received"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        for cat in categories:
-            cursor.execute("""
-                INSERT OR REPLACE INTO categories (
-                    category_id, name, color, last_updated
-                ) VALUES (?, ?, ?, ?)
-            """, (
-                cat.get('id'),
-                cat.get('name'),
-                cat.get('color'),
-                datetime.now().isoformat()
-            ))
+        result = self._upsert_metadata(cursor, 'categories', ['category_id', 'name', 'color'], [
+            (cat, (cat.get('id'), cat.get('name'), cat.get('color')))
+            for cat in categories
+        ])
+        
+        if result['inserted'] or result['updated']:
+            # Summary and snapshot locations come from items -> categories
+            self._rebuild_daily_summary(cursor)
+            self._bump_data_version(cursor)
+            
+            self._adjust_table_stats(cursor, {'categories': result['inserted']})
+            self._bump_data_version(cursor, scope='metadata')
         
         conn.commit()
         conn.close()
@@ -774,21 +3146,18 @@ class LoyverseDB:
     # ===== ITEMS METHODS =====
     
     def save_items(self, items):
-        """Save or update items in database"""
+        """Save new or changed items; returns the number received"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
+        item_keys = self._surrogate_keys(cursor, 'item', [item.get('id') for item in items])
+        records = []
         for item in items:
             # Get first variant for basic info
             variants = item.get('variants', [])
             variant = variants[0] if variants else {}
             
-            cursor.execute("""
-                INSERT OR REPLACE INTO items (
-                    item_id, variant_id, name, sku, category_id, 
-                    price, cost, last_updated
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
+            records.append((item, (
                 item.get('id'),
                 variant.get('variant_id'),
                 item.get('item_name') or item.get('name'),
@@ -796,8 +3165,20 @@ class LoyverseDB:
                 item.get('category_id'),
                 variant.get('price'),
                 variant.get('cost'),
-                datetime.now().isoformat()
-            ))
+                item_keys.get(item.get('id')),
+            )))
+        
+        result = self._upsert_metadata(cursor, 'items', [
+            'item_id', 'variant_id', 'name', 'sku', 'category_id', 'price', 'cost', 'item_key',
+        ], records)
+        
+        if result['inserted'] or result['updated']:
+            # Summary and snapshot locations come from items -> categories
+            self._rebuild_daily_summary(cursor)
+            self._bump_data_version(cursor)
+            
+            self._adjust_table_stats(cursor, {'items': result['inserted']})
+            self._bump_data_version(cursor, scope='metadata')
         
         conn.commit()
         conn.close()
@@ -892,58 +3273,159 @@ class LoyverseDB:
         conn.close()
         return count
     
+    # ===== QUERY PROFILING =====
+    
+    def get_query_stats(self, top=20):
+        """Per-statement call counts, latency and rows for this process, slowest total first"""
+        return get_pool(self.db_path, self.pragmas).query_stats.snapshot(top)
+    
+    def reset_query_stats(self):
+        get_pool(self.db_path, self.pragmas).query_stats.reset()
+    
+    def set_slow_query_threshold(self, ms):
+        """Log the plan of statements slower than ms (0 logs everything)"""
+        get_pool(self.db_path, self.pragmas).query_stats.slow_query_ms = ms
+    
+    def get_slow_queries(self, limit=50):
+        """Most recent slow statements with their captured query plans"""
+        conn = self.get_connection()
+        df = pd.read_sql_query(
+            "SELECT logged_at, duration_ms, sql, params, plan FROM query_log ORDER BY id DESC LIMIT ?",
+            conn,
+            params=[limit],
+        )
+        conn.close()
+        return df
+    
+    def explain_query(self, sql, params=()):
+        """EXPLAIN QUERY PLAN detail lines for a statement"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        plan = [row[-1] for row in cursor.fetchall()]
+        conn.close()
+        return plan
+    
+    def get_indexes(self):
+        """{table: [index column tuples]} for every user index and primary key"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+        indexes = {}
+        for (table,) in cursor.fetchall():
+            cursor.execute(f"PRAGMA index_list({table})")
+            index_names = [row[1] for row in cursor.fetchall()]
+            columns = []
+            for index_name in index_names:
+                cursor.execute(f"PRAGMA index_info({index_name})")
+                columns.append(tuple(row[2] for row in cursor.fetchall()))
+            cursor.execute(f"PRAGMA table_info({table})")
+            pk = tuple(row[1] for row in sorted(cursor.fetchall(), key=lambda r: r[5]) if row[5])
+            if pk:
+                columns.append(pk)
+            indexes[table] = columns
+        conn.close()
+        return indexes
+    
     # ===== UTILITY METHODS =====
     
+    def _refresh_table_stats(self, cursor, tables=STATS_TABLES):
+        """Recount tables inside the caller's write transaction and invalidate cached stats"""
+        now = datetime.now().isoformat()
+        for table in tables:
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            row_count = cursor.fetchone()[0]
+            min_value = max_value = None
+            if table == 'receipts':
+                cursor.execute("SELECT MIN(created_at), MAX(created_at) FROM receipts WHERE created_at IS NOT NULL")
+                min_value, max_value = cursor.fetchone()
+            cursor.execute("""
+                INSERT OR REPLACE INTO table_stats (table_name, row_count, min_value, max_value, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (table, row_count, min_value, max_value, now))
+        self._bump_data_version(cursor, scope='stats')
+    
+    def _adjust_table_stats(self, cursor, deltas):
+        """
+        Apply row-count deltas from a write inside the caller's transaction
+        and invalidate cached stats. The receipts date range is re-read with
+        two MIN/MAX lookups on idx_receipts_created instead of a table scan.
+        Full recounts happen at init and in the 'analyze' maintenance task.
+        """
+        now = datetime.now().isoformat()
+        missing = []
+        for table, delta in deltas.items():
+            cursor.execute("""
+                UPDATE table_stats SET row_count = MAX(row_count + ?, 0), updated_at = ?
+                WHERE table_name = ?
+            """, (delta, now, table))
+            if not cursor.rowcount:
+                missing.append(table)
+        if 'receipts' in deltas and 'receipts' not in missing:
+            cursor.execute("""
+                UPDATE table_stats SET
+                    min_value = (SELECT MIN(created_at) FROM receipts),
+                    max_value = (SELECT MAX(created_at) FROM receipts)
+                WHERE table_name = 'receipts'
+            """)
+        if missing:
+            self._refresh_table_stats(cursor, missing)
+        else:
+            self._bump_data_version(cursor, scope='stats')
+    
+    def refresh_database_stats(self):
+        """Recount every stats table (for writers that bypass LoyverseDB)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        self._refresh_table_stats(cursor)
+        conn.commit()
+        conn.close()
+    
     def get_database_stats(self):
-        """Get database statistics"""
+        """
+        Get database statistics. Counts come from table_stats and the result is
+        cached per database file until the stats version changes, so a rerun
+        pays one primary-key lookup.
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        stats = {}
-        
-        # Customer count
-        cursor.execute("SELECT COUNT(*) FROM customers")
-        stats['customers'] = cursor.fetchone()[0]
-        
-        # Receipt count
-        cursor.execute("SELECT COUNT(*) FROM receipts")
-        stats['receipts'] = cursor.fetchone()[0]
-        
-        # Line item count
-        cursor.execute("SELECT COUNT(*) FROM line_items")
-        stats['line_items'] = cursor.fetchone()[0]
-        
-        # Payment types count
-        cursor.execute("SELECT COUNT(*) FROM payment_types")
-        stats['payment_types'] = cursor.fetchone()[0]
+        # last_updated guards against a recreated file restarting at the same version
+        cursor.execute("SELECT version, last_updated FROM data_versions WHERE scope = 'stats'")
+        version = cursor.fetchone()
+        cached = _stats_cache.get(self.db_path)
+        if cached is not None and cached[0] == version:
+            conn.close()
+            return dict(cached[1])
         
-        # Stores count
-        cursor.execute("SELECT COUNT(*) FROM stores")
-        stats['stores'] = cursor.fetchone()[0]
+        cursor.execute("SELECT table_name, row_count, min_value, max_value FROM table_stats")
+        rows = {row[0]: row[1:] for row in cursor.fetchall()}
         
-        # Employees count
-        cursor.execute("SELECT COUNT(*) FROM employees")
-        stats['employees'] = cursor.fetchone()[0]
+        stats = {table: rows[table][0] if table in rows else 0 for table in STATS_TABLES}
         
-        # Categories count (locations!)
-        cursor.execute("SELECT COUNT(*) FROM categories")
-        stats['categories'] = cursor.fetchone()[0]
-        
-        # Items count
-        cursor.execute("SELECT COUNT(*) FROM items")
-        stats['items'] = cursor.fetchone()[0]
+        # Archived months count too, as in get_receipt_count
+        cursor.execute("""
+            SELECT COALESCE(SUM(receipt_count), 0), COALESCE(SUM(line_item_count), 0),
+                   MIN(min_created_at), MAX(max_created_at)
+            FROM archive_partitions
+        """)
+        archived_receipts, archived_lines, archived_min, archived_max = cursor.fetchone()
+        stats['receipts'] += archived_receipts
+        stats['line_items'] += archived_lines
         
         # Date range
-        cursor.execute("SELECT MIN(created_at), MAX(created_at) FROM receipts")
-        date_range = cursor.fetchone()
-        stats['date_range'] = date_range
+        receipts = rows.get('receipts') or (None, None, None)
+        starts = [value for value in (receipts[1], archived_min) if value]
+        ends = [value for value in (receipts[2], archived_max) if value]
+        stats['date_range'] = (min(starts) if starts else None, max(ends) if ends else None)
         
         # Last sync times
         cursor.execute("SELECT key, last_updated FROM sync_metadata")
         stats['last_syncs'] = dict(cursor.fetchall())
         
         conn.close()
-        return stats
+        _stats_cache[self.db_path] = (version, stats)
+        return dict(stats)
     
     def clear_all_data(self):
         """Clear all data from database (keep structure)"""
@@ -954,8 +3436,23 @@ class LoyverseDB:
         cursor.execute("DELETE FROM receipts")
         cursor.execute("DELETE FROM line_items")
         cursor.execute("DELETE FROM payments")
-        cursor.execute("DELETE FROM sync_metadata")
+        cursor.execute("DELETE FROM receipt_payment_summary")
+        cursor.execute("DELETE FROM daily_sales_summary")
+        cursor.execute("DELETE FROM raw_payloads WHERE entity IN ('customer', 'receipt')")
+        # The raw payload migration marker describes the schema, not the data
+        cursor.execute("DELETE FROM sync_metadata WHERE key != ?", (RAW_PAYLOADS_MIGRATED_KEY,))
+        cursor.execute("DELETE FROM sync_runs")
+        cursor.execute("SELECT path FROM archive_partitions")
+        archive_paths = [row[0] for row in cursor.fetchall()]
+        cursor.execute("DELETE FROM archive_partitions")
+        self._bump_data_version(cursor)
+        
+        self._refresh_table_stats(cursor, ('customers', 'receipts', 'line_items'))
+        self._bump_data_version(cursor, scope='metadata')
         
         conn.commit()
         conn.close()
+        for path in archive_paths:
+            if os.path.exists(path):
+                os.remove(path)
 
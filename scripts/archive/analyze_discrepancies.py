@@ -3,22 +3,27 @@
 Deep analysis of sales calculation discrepancies between CSV, API, and Dashboard.
 """
 import os
-import requests
+import sys
+from pathlib import Path
+
 import pandas as pd
 from datetime import datetime, date
 import pytz
 from dotenv import load_dotenv
 import json
 
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from utils.loyverse_client import LoyverseAPIError, get_client
+
 load_dotenv()
 
 LOYVERSE_TOKEN = os.getenv("LOYVERSE_TOKEN", "d18826e6c76345888204b310aaca1351")
-BASE_URL = "https://api.loyverse.com/v1.0/receipts"
 
 def fetch_sample_receipts(token: str, start_date: date, end_date: date, limit=10):
     """Fetch a small sample of receipts to analyze structure."""
-    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-    
     tz = pytz.timezone("Asia/Bangkok")
     start_dt_utc = tz.localize(datetime.combine(start_date, datetime.min.time())).astimezone(pytz.UTC)
     end_dt_utc = tz.localize(datetime.combine(end_date, datetime.max.time())).astimezone(pytz.UTC)
@@ -29,11 +34,10 @@ def fetch_sample_receipts(token: str, start_date: date, end_date: date, limit=10
         "limit": limit,
     }
     
-    res = requests.get(BASE_URL, headers=headers, params=params, timeout=60)
-    if res.status_code == 200:
-        data = res.json()
-        return data.get("receipts", [])
-    return []
+    try:
+        return get_client(token).get("receipts", params).get("receipts", [])
+    except LoyverseAPIError:
+        return []
 
 def analyze_receipt_structure(receipts):
     """Analyze the structure of API receipts to understand field names."""
@@ -172,7 +176,6 @@ def main():
     
     # Fetch full December data
     print("\n🌐 Fetching full December 1-3 data...")
-    headers = {"Authorization": f"Bearer {LOYVERSE_TOKEN}", "Accept": "application/json"}
     tz = pytz.timezone("Asia/Bangkok")
     start_dt_utc = tz.localize(datetime.combine(date(2025, 12, 1), datetime.min.time())).astimezone(pytz.UTC)
     end_dt_utc = tz.localize(datetime.combine(date(2025, 12, 3), datetime.max.time())).astimezone(pytz.UTC)
@@ -180,23 +183,14 @@ def main():
     params = {
         "created_at_min": start_dt_utc.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
         "created_at_max": end_dt_utc.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
-        "limit": 250,
     }
     
     all_receipts = []
-    cursor = None
-    while True:
-        if cursor:
-            params["cursor"] = cursor
-        res = requests.get(BASE_URL, headers=headers, params=params, timeout=60)
-        if res.status_code != 200:
-            break
-        data = res.json()
-        receipts = data.get("receipts", [])
-        all_receipts.extend(receipts)
-        cursor = data.get("cursor")
-        if not cursor:
-            break
+    try:
+        for receipts, _ in get_client(LOYVERSE_TOKEN).iter_pages("receipts", "receipts", params):
+            all_receipts.extend(receipts)
+    except LoyverseAPIError:
+        pass
     
     print(f"✅ Fetched {len(all_receipts)} receipts")
     
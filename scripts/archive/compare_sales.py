@@ -3,23 +3,28 @@
 Script to fetch current month's sales from Loyverse API and compare with exported CSV data.
 """
 import os
-import requests
+import sys
+from pathlib import Path
+
 import pandas as pd
 from datetime import datetime, date
 import pytz
 from dotenv import load_dotenv
 
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from utils.loyverse_client import LoyverseAPIError, get_client
+
 # Load environment variables
 load_dotenv()
 
 # API Configuration
 LOYVERSE_TOKEN = os.getenv("LOYVERSE_TOKEN", "d18826e6c76345888204b310aaca1351")
-BASE_URL = "https://api.loyverse.com/v1.0/receipts"
 
 def fetch_receipts_from_api(token: str, start_date: date, end_date: date):
     """Fetch receipts from Loyverse API for a date range (Bangkok -> UTC)."""
-    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-    
     # Convert Bangkok local date range to UTC timestamps expected by API
     tz = pytz.timezone("Asia/Bangkok")
     start_dt_utc = tz.localize(datetime.combine(start_date, datetime.min.time())).astimezone(pytz.UTC)
@@ -28,41 +33,23 @@ def fetch_receipts_from_api(token: str, start_date: date, end_date: date):
     params = {
         "created_at_min": start_dt_utc.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
         "created_at_max": end_dt_utc.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
-        "limit": 250,
     }
     
     all_receipts = []
-    cursor = None
     page_count = 0
     
     print(f"Fetching receipts from {start_date} to {end_date} (Bangkok time)...")
     print(f"API range (UTC): {start_dt_utc.strftime('%Y-%m-%d %H:%M:%S')} to {end_dt_utc.strftime('%Y-%m-%d %H:%M:%S')}")
     
-    while True:
-        page_count += 1
-        if cursor:
-            params["cursor"] = cursor
-        
-        try:
-            res = requests.get(BASE_URL, headers=headers, params=params, timeout=60)
-            
-            if res.status_code != 200:
-                print(f"❌ Error {res.status_code}: {res.text}")
-                break
-            
-            data = res.json()
-            receipts = data.get("receipts", [])
+    try:
+        for receipts, _ in get_client(token).iter_pages("receipts", "receipts", params):
+            page_count += 1
             all_receipts.extend(receipts)
-            cursor = data.get("cursor")
-            
             print(f"  Page {page_count}: {len(receipts)} receipts (Total: {len(all_receipts)})")
-            
-            if not cursor:
-                break
-                
-        except Exception as e:
-            print(f"❌ Exception: {str(e)}")
-            break
+    except LoyverseAPIError as e:
+        print(f"❌ Error {e.status_code}: {e.body}")
+    except Exception as e:
+        print(f"❌ Exception: {str(e)}")
     
     print(f"✅ Fetched {len(all_receipts)} receipts total\n")
     return all_receipts
@@ -3,22 +3,26 @@
 Investigate where extra receipts are coming from - compare API vs CSV date boundaries
 """
 import os
-import time
-import requests
+import sys
+from pathlib import Path
+
 import pandas as pd
 from datetime import datetime, date, timedelta
 import pytz
 from dotenv import load_dotenv
 
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from utils.loyverse_client import LoyverseAPIError, get_client
+
 load_dotenv()
 
 LOYVERSE_TOKEN = os.getenv("LOYVERSE_TOKEN", "d18826e6c76345888204b310aaca1351")
-BASE_URL = "https://api.loyverse.com/v1.0/receipts"
 
 def fetch_receipts_detailed(token: str, start_date: date, end_date: date):
     """Fetch receipts with detailed date analysis."""
-    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-    
     # Convert Bangkok local date range to UTC timestamps
     tz_bkk = pytz.timezone("Asia/Bangkok")
     start_dt_utc = tz_bkk.localize(datetime.combine(start_date, datetime.min.time())).astimezone(pytz.UTC)
@@ -27,7 +31,6 @@ def fetch_receipts_detailed(token: str, start_date: date, end_date: date):
     params = {
         "created_at_min": start_dt_utc.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
         "created_at_max": end_dt_utc.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
-        "limit": 100,
     }
     
     print(f"📅 Date Range Analysis:")
@@ -37,24 +40,11 @@ def fetch_receipts_detailed(token: str, start_date: date, end_date: date):
     print()
     
     all_receipts = []
-    cursor = None
-    
-    while True:
-        if cursor:
-            params["cursor"] = cursor
-        
-        res = requests.get(BASE_URL, headers=headers, params=params, timeout=60)
-        if res.status_code != 200:
-            print(f"❌ Error {res.status_code}: {res.text}")
-            break
-        
-        data = res.json()
-        receipts = data.get("receipts", [])
-        all_receipts.extend(receipts)
-        cursor = data.get("cursor")
-        if not cursor:
-            break
-        time.sleep(0.1) # Be nice to the API
+    try:
+        for receipts, _ in get_client(token).iter_pages("receipts", "receipts", params, limit=100):
+            all_receipts.extend(receipts)
+    except LoyverseAPIError as e:
+        print(f"❌ Error {e.status_code}: {e.body}")
     
     return all_receipts, start_dt_utc, end_dt_utc
 
@@ -1,15 +1,21 @@
-import pandas as pd
-import requests
 import os
+import sys
+from pathlib import Path
+
+import pandas as pd
 from datetime import datetime, timedelta
 import pytz
 from dotenv import load_dotenv
-import time
+
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from utils.loyverse_client import get_client
 
 # Load environment variables
 load_dotenv()
 LOYVERSE_TOKEN = os.getenv("LOYVERSE_TOKEN")
-BASE_URL = "https://api.loyverse.com/v1.0/receipts"
 
 if not LOYVERSE_TOKEN:
     print("❌ Error: LOYVERSE_TOKEN not found in .env")
@@ -43,46 +49,16 @@ def fetch_receipts_for_day(date_obj):
     start_utc = start_dt.astimezone(pytz.UTC).strftime('%Y-%m-%dT%H:%M:%S.000Z')
     end_utc = end_dt.astimezone(pytz.UTC).strftime('%Y-%m-%dT%H:%M:%S.000Z')
     
-    headers = {"Authorization": f"Bearer {LOYVERSE_TOKEN}"}
+    # The shared client retries with backoff and honors 429 Retry-After
     day_receipts = []
-    cursor = None
-    
-    # Retry logic
-    for attempt in range(3):
-        try:
-            while True:
-                params = {
-                    "created_at_min": start_utc,
-                    "created_at_max": end_utc,
-                    "limit": 250,
-                    "cursor": cursor
-                }
-                
-                resp = requests.get(BASE_URL, headers=headers, params=params, timeout=10)
-                if resp.status_code != 200:
-                    print(f"   ⚠️ Error fetching {date_obj}: {resp.status_code}")
-                    time.sleep(1)
-                    break # Try next attempt
-                    
-                data = resp.json()
-                receipts = data.get('receipts', [])
-                day_receipts.extend(receipts)
-                
-                cursor = data.get('cursor')
-                if not cursor:
-                    return day_receipts # Success
-                
-                time.sleep(0.1)
-            
-            # If we exit while loop without returning, it means we broke due to error
-            # so we continue to next attempt
-            
-        except Exception as e:
-            print(f"   ⚠️ Exception fetching {date_obj}: {e}")
-            time.sleep(1)
-    
-    print(f"❌ Failed to fetch complete data for {date_obj}")
-    return day_receipts # Return what we have
+    params = {"created_at_min": start_utc, "created_at_max": end_utc}
+    try:
+        for receipts, _ in get_client(LOYVERSE_TOKEN).iter_pages("receipts", "receipts", params):
+            day_receipts.extend(receipts)
+    except Exception as e:
+        print(f"   ⚠️ Error fetching {date_obj}: {e}")
+        print(f"❌ Failed to fetch complete data for {date_obj}")
+    return day_receipts
 
 def fetch_november_receipts():
     """Fetch all receipts for November 2025 day by day."""
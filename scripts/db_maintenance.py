@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Database maintenance: refresh planner statistics (ANALYZE / PRAGMA optimize),
+return free pages to the filesystem (incremental vacuum) and run an integrity
+check. Every task is recorded in the maintenance_log table shown in Settings.
+
+Usage:
+    python3 scripts/db_maintenance.py [--db loyverse_data.db] [--tasks optimize analyze vacuum integrity]
+    python3 scripts/db_maintenance.py --scheduled   # only tasks whose interval has elapsed
+    python3 scripts/db_maintenance.py --log 20      # show recent runs
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from database import LoyverseDB, MAINTENANCE_INTERVALS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run SQLite maintenance tasks")
+    parser.add_argument("--db", default=os.getenv("DATABASE_PATH", "loyverse_data.db"), help="SQLite database path")
+    parser.add_argument("--tasks", nargs="+", choices=list(MAINTENANCE_INTERVALS), default=list(MAINTENANCE_INTERVALS),
+                        help="Tasks to run, in order")
+    parser.add_argument("--scheduled", action="store_true", help="Run only the tasks that are due")
+    parser.add_argument("--log", type=int, metavar="N", help="Show the last N maintenance runs and exit")
+    args = parser.parse_args()
+
+    db = LoyverseDB(args.db)
+    if args.log:
+        log = db.get_maintenance_log(args.log)
+        print(log.to_string(index=False) if not log.empty else "No maintenance runs recorded yet")
+    else:
+        results = db.run_scheduled_maintenance() if args.scheduled else db.run_maintenance(args.tasks)
+        if not results:
+            print("✅ No maintenance tasks due")
+        failed = [
+            entry for entry in results
+            if entry["result"].startswith("failed") or (entry["task"] == "integrity" and entry["result"] != "ok")
+        ]
+        if failed:
+            for entry in failed:
+                print(f"❌ {entry['task']}: {entry['result']}")
+            db.close_connections()
+            sys.exit(1)
+    db.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,62 @@
-import sqlite3
-import pandas as pd
-
-def delete_duplicates():
-    db_path = 'loyverse_data.db'
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
+#!/usr/bin/env python3
+"""
+Delete duplicate receipts: receipts that repeat an earlier one on the key
+columns (created_at + total_money by default). The smallest receipt_id of each
+group is kept.
+
+Usage:
+    python3 scripts/delete_duplicates_db.py [--db loyverse_data.db] [--start 2025-11-11] [--end 2025-11-13]
+                                            [--keys created_at total_money] [--dry-run]
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from database import LoyverseDB
+
+
+def delete_duplicates(db, start_date=None, end_date=None, keys=("created_at", "total_money"), dry_run=False):
     print("🔍 Finding duplicates to delete...")
-    
-    # Logic: Find groups of (created_at, total_money) with count > 1
-    # Keep the one with the lowest receipt_id (or highest? doesn't matter much, let's keep one)
-    # Actually, let's keep the one with the 'smallest' receipt_id string just to be deterministic
-    
-    query = """
-    SELECT 
-        receipt_id,
-        created_at,
-        total_money
-    FROM receipts
-    WHERE receipt_date >= '2025-11-11' AND receipt_date <= '2025-11-13'
-    """
-    
-    df = pd.read_sql_query(query, conn)
-    
-    # Identify duplicates
-    # We want to keep the FIRST occurrence and mark others for deletion
-    # Sorting by receipt_id ensures determinism
-    df = df.sort_values('receipt_id')
-    
-    # duplicated() returns True for all duplicates except the first occurrence
-    duplicates = df[df.duplicated(['created_at', 'total_money'], keep='first')]
-    
-    if duplicates.empty:
+    ids_to_delete = db.find_duplicate_receipts(start_date, end_date, keys)
+
+    if not ids_to_delete:
         print("✅ No duplicates found to delete.")
-        conn.close()
-        return
-
-    print(f"⚠️ Found {len(duplicates)} duplicates to delete.")
-    
-    ids_to_delete = duplicates['receipt_id'].tolist()
-    
-    # Delete from database
-    # 1. Delete line items
-    print("🗑️ Deleting line items...")
-    placeholders = ','.join(['?'] * len(ids_to_delete))
-    cursor.execute(f"DELETE FROM line_items WHERE receipt_id IN ({placeholders})", ids_to_delete)
-    
-    # 2. Delete payments
-    print("🗑️ Deleting payments...")
-    cursor.execute(f"DELETE FROM payments WHERE receipt_id IN ({placeholders})", ids_to_delete)
-    
-    # 3. Delete receipts
-    print("🗑️ Deleting receipts...")
-    cursor.execute(f"DELETE FROM receipts WHERE receipt_id IN ({placeholders})", ids_to_delete)
-    
-    conn.commit()
-    conn.close()
-    
-    print(f"✅ Successfully deleted {len(ids_to_delete)} duplicate receipts.")
+        return None
+
+    print(f"⚠️ Found {len(ids_to_delete)} duplicates to delete.")
+    if dry_run:
+        for receipt_id in ids_to_delete:
+            print(f"   {receipt_id}")
+        return None
+
+    start = time.perf_counter()
+    removed = db.delete_receipts(ids_to_delete)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    for table, count in removed["rows"].items():
+        print(f"🗑️ {table}: {count} rows")
+    print(f"✅ Successfully deleted {len(removed['receipt_ids'])} duplicate receipts in {elapsed_ms:.1f} ms.")
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete duplicate receipts")
+    parser.add_argument("--db", default=os.getenv("DATABASE_PATH", "loyverse_data.db"), help="SQLite database path")
+    parser.add_argument("--start", help="First business day (YYYY-MM-DD)")
+    parser.add_argument("--end", help="Last business day (YYYY-MM-DD)")
+    parser.add_argument("--keys", nargs="+", default=["created_at", "total_money"], help="Columns that identify a duplicate")
+    parser.add_argument("--dry-run", action="store_true", help="List duplicates without deleting")
+    args = parser.parse_args()
+
+    db = LoyverseDB(args.db)
+    delete_duplicates(db, args.start, args.end, tuple(args.keys), args.dry_run)
+    db.close_connections()
+
 
 if __name__ == "__main__":
-    delete_duplicates()
+    main()
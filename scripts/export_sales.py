@@ -1,88 +1,51 @@
 #!/usr/bin/env python3
 import os
+import sys
 import argparse
-import requests
+from pathlib import Path
+
 import pandas as pd
-from datetime import datetime, timedelta
-import pytz
+from datetime import datetime
 from dotenv import load_dotenv
-import time
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from utils.loyverse_client import get_client
+from utils.receipt_fetcher import FETCH_WORKERS, fetch_receipts_sharded
 
 # Load environment variables
 load_dotenv()
 LOYVERSE_TOKEN = os.getenv("LOYVERSE_TOKEN")
-BASE_URL = "https://api.loyverse.com/v1.0/receipts"
 
 if not LOYVERSE_TOKEN:
     print("❌ Error: LOYVERSE_TOKEN not found in .env")
     exit(1)
 
-def fetch_receipts_for_day(date_obj):
-    """Fetch receipts for a specific date (Bangkok time)."""
-    tz = pytz.timezone('Asia/Bangkok')
-    start_dt = tz.localize(datetime.combine(date_obj, datetime.min.time()))
-    end_dt = tz.localize(datetime.combine(date_obj, datetime.max.time()))
-    
-    start_utc = start_dt.astimezone(pytz.UTC).strftime('%Y-%m-%dT%H:%M:%S.000Z')
-    end_utc = end_dt.astimezone(pytz.UTC).strftime('%Y-%m-%dT%H:%M:%S.000Z')
-    
-    headers = {"Authorization": f"Bearer {LOYVERSE_TOKEN}"}
-    day_receipts = []
-    cursor = None
-    
-    for attempt in range(3):
-        try:
-            while True:
-                params = {
-                    "created_at_min": start_utc,
-                    "created_at_max": end_utc,
-                    "limit": 250,
-                    "cursor": cursor
-                }
-                
-                resp = requests.get(BASE_URL, headers=headers, params=params, timeout=10)
-                if resp.status_code != 200:
-                    print(f"   ⚠️ Error fetching {date_obj}: {resp.status_code}")
-                    time.sleep(1)
-                    break 
-                    
-                data = resp.json()
-                receipts = data.get('receipts', [])
-                day_receipts.extend(receipts)
-                
-                cursor = data.get('cursor')
-                if not cursor:
-                    return day_receipts
-                
-                time.sleep(0.1)
-            
-        except Exception as e:
-            print(f"   ⚠️ Exception fetching {date_obj}: {e}")
-            time.sleep(1)
-    
-    print(f"❌ Failed to fetch complete data for {date_obj}")
-    return day_receipts
+def fetch_receipts(start_date, end_date, workers=FETCH_WORKERS):
+    """Fetch receipts for a date range, one Bangkok day per shard in parallel."""
+    print(f"📅 Fetching receipts from {start_date} to {end_date} ({workers} workers)...")
 
-def fetch_receipts(start_date, end_date):
-    """Fetch receipts for a date range."""
-    print(f"📅 Fetching receipts from {start_date} to {end_date}...")
-    
-    all_receipts = []
-    current_date = start_date
-    while current_date <= end_date:
-        print(f"   Fetching {current_date}...", end='\r')
-        day_receipts = fetch_receipts_for_day(current_date)
-        all_receipts.extend(day_receipts)
-        current_date += timedelta(days=1)
-        
-    print(f"\n✅ Total receipts fetched: {len(all_receipts)}")
-    return all_receipts
+    def on_shard_done(shard, done, total):
+        print(f"   Fetched {done}/{total} days ({shard['shard']}: {shard['receipts']} receipts, {shard['seconds']:.1f}s)", end='\r')
+
+    result = fetch_receipts_sharded(
+        get_client(LOYVERSE_TOKEN), start_date, end_date, window="day",
+        max_workers=workers, on_shard_done=on_shard_done,
+    )
+    for shard in result.errors:
+        print(f"\n❌ Failed to fetch complete data for {shard['shard']}: {shard['error']}")
+
+    print(f"\n✅ Total receipts fetched: {len(result.receipts)} in {result.seconds:.1f}s")
+    return result.receipts
 
 def main():
     parser = argparse.ArgumentParser(description="Export Sales Data from Loyverse")
     parser.add_argument("--start", type=str, required=True, help="Start Date (YYYY-MM-DD)")
     parser.add_argument("--end", type=str, required=True, help="End Date (YYYY-MM-DD)")
     parser.add_argument("--output", type=str, default="sales_export.csv", help="Output CSV filename")
+    parser.add_argument("--workers", type=int, default=FETCH_WORKERS, help="Days fetched in parallel")
     
     args = parser.parse_args()
     
@@ -94,7 +57,7 @@ def main():
         return
 
     # 1. Fetch
-    receipts = fetch_receipts(start_date, end_date)
+    receipts = fetch_receipts(start_date, end_date, args.workers)
     
     # 2. Deduplicate
     unique_receipts = []
@@ -4,13 +4,20 @@ Robust Import Tool (Idempotent)
 Use this tool to import receipts safely. It checks for duplicates before creating.
 """
 import os
-import time
-import requests
+import sys
+from pathlib import Path
+
 import pandas as pd
 from datetime import datetime
 import pytz
 from dotenv import load_dotenv
 
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from utils.loyverse_client import get_client
+
 load_dotenv()
 
 LOYVERSE_TOKEN = os.getenv("LOYVERSE_TOKEN")
@@ -19,16 +26,11 @@ if not LOYVERSE_TOKEN:
     exit(1)
 
 print("✅ Loaded LOYVERSE_TOKEN from environment.")
-BASE_URL = "https://api.loyverse.com/v1.0/receipts"
 
 class LoyverseImporter:
     def __init__(self, token):
         self.token = token
-        self.headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        }
+        self.client = get_client(token)
 
     def check_exists(self, created_at, total_money, receipt_number=None):
         """
@@ -43,20 +45,19 @@ class LoyverseImporter:
         }
         
         try:
-            res = requests.get(BASE_URL, headers=self.headers, params=params, timeout=10)
-            if res.status_code == 200:
-                candidates = res.json().get('receipts', [])
-                for r in candidates:
-                    # 1. Check receipt number if provided (Strongest check)
-                    if receipt_number and r.get('receipt_number') == receipt_number:
-                        return r.get('id') or "EXISTING_NO_ID"
+            # An API error after retries counts as a failed check, never as "not found"
+            candidates = self.client.get("receipts", params).get('receipts', [])
+            for r in candidates:
+                # 1. Check receipt number if provided (Strongest check)
+                if receipt_number and r.get('receipt_number') == receipt_number:
+                    return r.get('id') or "EXISTING_NO_ID"
+                
+                # 2. Check total money (Secondary check)
+                # Note: Float comparison needs epsilon, but API returns string or float
+                api_total = float(r.get('total_money', 0))
+                if abs(api_total - float(total_money)) < 0.01:
+                    return r.get('id') or "EXISTING_NO_ID"
                     
-                    # 2. Check total money (Secondary check)
-                    # Note: Float comparison needs epsilon, but API returns string or float
-                    api_total = float(r.get('total_money', 0))
-                    if abs(api_total - float(total_money)) < 0.01:
-                        return r.get('id') or "EXISTING_NO_ID"
-                        
             return None
         except Exception as e:
             print(f"⚠️ Check failed: {e}")
@@ -89,7 +90,7 @@ class LoyverseImporter:
 
         # 2. Create
         try:
-            res = requests.post(BASE_URL, headers=self.headers, json=receipt_data, timeout=10)
+            res = self.client.post("receipts", receipt_data)
             if res.status_code == 201:
                 new_id = res.json().get('id')
                 print(f"✅ Created: {created_at} - {total_money} (ID: {new_id})")
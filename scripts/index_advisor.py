@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Index advisor: run the app's known queries against the current database,
+report their timing and query plans, and propose indexes for any query that
+still scans a table or sorts through a temp B-tree.
+
+Usage:
+    python3 scripts/index_advisor.py [--db loyverse_data.db] [--days 30] [--slow 20]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from database import LoyverseDB
+
+# Known hot queries: where they run, the SQL, and the index that would serve them
+# as (table, columns[, alias used in the query]). Params are built from a
+# (start_day, end_day) business-day window.
+QUERY_CATALOGUE = [
+    {
+        "name": "receipts frame (date range)",
+        "source": "database.get_receipts_dataframe",
+        "sql": None,  # built by LoyverseDB._receipts_query, see _receipts_frame_entry
+        "candidates": [("receipts", ("business_day", "store_id"), "r")],
+    },
+    {
+        "name": "sync dedup guardrail",
+        "source": "app.py sync / _guardrail_import",
+        "sql": """
+            SELECT receipt_id, receipt_number, store_id, created_at, receipt_date, total_money
+            FROM receipts
+            WHERE business_day >= ? AND business_day <= ?
+        """,
+        "params": lambda start, end: [start, end],
+        "candidates": [("receipts", ("business_day", "store_id"))],
+    },
+    {
+        "name": "duplicate receipt numbers",
+        "source": "app.py post-sync guardrail",
+        "sql": """
+            SELECT store_id, receipt_number, COUNT(*) AS c
+            FROM receipts
+            WHERE receipt_number IS NOT NULL
+            GROUP BY store_id, receipt_number
+            HAVING c > 1
+        """,
+        "params": lambda start, end: [],
+        "candidates": [("receipts", ("store_id", "receipt_number"))],
+    },
+    {
+        "name": "receipt by number",
+        "source": "database.remove_problematic_receipts",
+        "sql": "SELECT receipt_id FROM receipts WHERE receipt_number IN (SELECT value FROM json_each(?))",
+        "params": lambda start, end: ['["1-0001"]'],
+        "candidates": [("receipts", ("receipt_number",))],
+    },
+    {
+        "name": "receipt-level import view",
+        "source": "app.py _get_receipt_level_df",
+        "sql": """
+            SELECT receipt_id, receipt_number, created_at, receipt_date, business_day, store_id,
+                   receipt_type, total_money, total_discount, source, dining_option
+            FROM receipts
+            WHERE business_day >= ? AND business_day <= ?
+        """,
+        "params": lambda start, end: [start, end],
+        "candidates": [("receipts", ("business_day", "store_id"))],
+    },
+    {
+        "name": "settings snapshot",
+        "source": "app.py Settings tab",
+        "sql": "SELECT receipt_id, created_at FROM receipts ORDER BY event_ts DESC LIMIT 20",
+        "params": lambda start, end: [],
+        "candidates": [("receipts", ("event_ts",))],
+    },
+    {
+        "name": "customer history",
+        "source": "scripts/sync_delivery_metadata.py, daily_briefing.py",
+        "sql": """
+            SELECT r.customer_id, COUNT(DISTINCT r.receipt_id)
+            FROM receipts r
+            JOIN line_items li ON r.receipt_id = li.receipt_id
+            WHERE r.customer_id = ?
+            GROUP BY r.customer_id
+        """,
+        "params": lambda start, end: ["cust_1"],
+        "candidates": [("receipts", ("customer_id",), "r"), ("line_items", ("receipt_id",), "li")],
+    },
+    {
+        "name": "recon payments",
+        "source": "app.py _get_receipt_level_df",
+        "sql": """
+            SELECT receipt_id, MIN(COALESCE(payment_name, payment_type, 'Unknown')) AS payment_name
+            FROM payments
+            GROUP BY receipt_id
+        """,
+        "params": lambda start, end: [],
+        "candidates": [("payments", ("receipt_id",))],
+    },
+    {
+        "name": "daily summary",
+        "source": "database.get_daily_summary",
+        "sql": """
+            SELECT business_day, SUM(signed_net), SUM(receipt_count)
+            FROM daily_sales_summary
+            WHERE business_day >= ? AND business_day <= ?
+            GROUP BY business_day
+        """,
+        "params": lambda start, end: [start, end],
+        "candidates": [("daily_sales_summary", ("business_day",))],
+    },
+]
+
+
+def _receipts_frame_entry(db):
+    """The receipts frame SQL comes from the live query builder, not a copy"""
+    conn = db.get_connection()
+    sql, params = db._receipts_query(
+        conn, list(db.RECEIPT_FRAME_COLUMNS), start_date="{start}", end_date="{end}"
+    )
+    conn.close()
+    return sql, lambda start, end: [start if p == "{start}" else end if p == "{end}" else p for p in params]
+
+
+def _covered(columns, existing):
+    """True when an existing index starts with the candidate columns"""
+    return any(index[: len(columns)] == tuple(columns) for index in existing)
+
+
+def _needs_index(plan, name):
+    """True when the plan scans the table (by name or alias) or sorts in a temp B-tree"""
+    for line in plan:
+        if line.startswith(f"SCAN {name}") and "INDEX" not in line:
+            return True
+        if "USE TEMP B-TREE" in line:
+            return True
+    return False
+
+
+def advise(db, start_day, end_day):
+    """
+    Run every catalogue query once and return one result dict per query with
+    its timing, plan and the CREATE INDEX statements it is missing.
+    """
+    indexes = db.get_indexes()
+    results = []
+    for entry in QUERY_CATALOGUE:
+        sql, params = entry["sql"], entry.get("params")
+        if sql is None:
+            sql, params = _receipts_frame_entry(db)
+        args = params(start_day, end_day)
+
+        plan = db.explain_query(sql, args)
+        conn = db.get_connection()
+        start = time.perf_counter()
+        rows = len(conn.execute(sql, args).fetchall())
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        conn.close()
+
+        proposals = []
+        for table, columns, *alias in entry["candidates"]:
+            if _covered(columns, indexes.get(table, [])):
+                continue
+            if _needs_index(plan, alias[0] if alias else table):
+                proposals.append(
+                    f"CREATE INDEX IF NOT EXISTS idx_{table}_{'_'.join(columns)} ON {table}({', '.join(columns)})"
+                )
+        results.append({
+            "name": entry["name"],
+            "source": entry["source"],
+            "ms": elapsed_ms,
+            "rows": rows,
+            "plan": plan,
+            "proposals": proposals,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile known queries and propose missing indexes")
+    parser.add_argument("--db", default=os.getenv("DATABASE_PATH", "loyverse_data.db"), help="SQLite database path")
+    parser.add_argument("--days", type=int, default=30, help="Business-day window for ranged queries")
+    parser.add_argument("--slow", type=int, default=20, help="Recent slow-query log entries to show")
+    args = parser.parse_args()
+
+    db = LoyverseDB(args.db)
+    end_day = date.today()
+    start_day = end_day - timedelta(days=args.days - 1)
+
+    print(f"🔍 Profiling {len(QUERY_CATALOGUE)} queries on {args.db} ({start_day} → {end_day})\n")
+    proposals = []
+    for result in advise(db, start_day.isoformat(), end_day.isoformat()):
+        print(f"• {result['name']} [{result['source']}]: {result['ms']:.1f} ms, {result['rows']} rows")
+        for line in result["plan"]:
+            print(f"      {line}")
+        proposals.extend(p for p in result["proposals"] if p not in proposals)
+
+    if proposals:
+        print("\n💡 Proposed indexes:")
+        for statement in proposals:
+            print(f"   {statement};")
+    else:
+        print("\n✅ Every catalogued query is served by an index")
+
+    slow = db.get_slow_queries(args.slow)
+    if not slow.empty:
+        print("\n🐢 Recent slow statements (query_log):")
+        for row in slow.itertuples():
+            print(f"   {row.logged_at}  {row.duration_ms:.1f} ms  {row.sql[:120]}")
+            if row.plan:
+                for line in row.plan.splitlines():
+                    print(f"      {line}")
+
+    db.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Background sync worker: refreshes metadata through the async ingestion
+pipeline and receipts incrementally (created or changed since the stored
+updated_at watermark), or a fixed number of recent Bangkok days with --days.
+A --days range is checkpointed in sync_runs and an interrupted one resumes;
+--fresh starts it over instead.
+
+Usage:
+    python3 scripts/sync_worker.py --once                 # one refresh, then exit
+    python3 scripts/sync_worker.py --interval 5           # incremental, every 5 minutes
+    python3 scripts/sync_worker.py --interval 15 --days 2 # re-fetch the last 2 days
+    python3 scripts/sync_worker.py --once --days 90 --fresh
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from database import LoyverseDB, MAINTENANCE_AFTER_SYNC
+from utils.async_ingest import METADATA_ENDPOINTS, ingest, save_ingest
+from utils.loyverse_client import get_client
+from utils.receipt_sync import ReceiptGuardrail, stream_receipts_to_db, sync_updated_receipts
+from utils.sync_dates import BANGKOK
+
+
+def sync_receipts(db, token, days=None, fresh=False):
+    """Receipts phase of run_once: a checkpointed range sync with days, else incremental"""
+    if days:
+        end_date = datetime.now(BANGKOK).date()
+        start_date = end_date - timedelta(days=days - 1)
+        guardrail = ReceiptGuardrail(db, start_date.isoformat(), end_date.isoformat())
+        report = stream_receipts_to_db(db, get_client(token), start_date, end_date, guardrail, fresh=fresh)
+        report["label"] = f"{start_date}..{end_date}"
+        print(f"   sync run #{report['run_id']}: {report['shards_skipped']} of {report['shards_total']} "
+              f"shards already done, {report['receipts_found']} receipts fetched")
+    else:
+        report = sync_updated_receipts(db, get_client(token))
+        report["label"] = "incremental"
+        print(f"   receipts updated since {report['since']}: {report['receipts_found']} "
+              f"(watermark {report['watermark']})")
+    return report
+
+
+def run_once(db, token, days=None, metadata=True, fresh=False):
+    """
+    One refresh: the metadata ingest runs on a worker thread while receipts
+    stream into the database, so the run takes about as long as the slower
+    of the two phases.
+    """
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        metadata_fetch = pool.submit(ingest, token, endpoints=METADATA_ENDPOINTS if metadata else ())
+        report = sync_receipts(db, token, days, fresh)
+        result = metadata_fetch.result()
+    saved = save_ingest(db, result)
+    saved["receipts"] = report["saved_count"]
+    result.seconds["receipts"] = report["fetch_seconds"]
+    result.total_seconds = round(time.perf_counter() - started, 3)
+    if report.get("error"):
+        result.errors["receipts"] = report["error"]
+    if saved.get("receipts"):
+        db.update_sync_time("receipts", f"{saved['receipts']} receipts (worker)")
+    if MAINTENANCE_AFTER_SYNC:
+        db.run_scheduled_maintenance()
+
+    slowest = max(result.seconds.items(), key=lambda item: item[1], default=("-", 0))
+    print(f"✅ {report['label']}: saved {saved} in {result.total_seconds:.1f}s "
+          f"(slowest {slowest[0]} {slowest[1]:.1f}s)")
+    for task, error in result.errors.items():
+        print(f"⚠️ {task}: {error}")
+    return result
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Periodically sync Loyverse metadata and recent receipts")
+    parser.add_argument("--db", default=os.getenv("DATABASE_PATH", "loyverse_data.db"), help="SQLite database path")
+    parser.add_argument("--days", type=int, help="Re-fetch this many Bangkok days ending today instead of syncing incrementally")
+    parser.add_argument("--interval", type=float, default=15, help="Minutes between runs")
+    parser.add_argument("--once", action="store_true", help="Run a single refresh and exit")
+    parser.add_argument("--no-metadata", action="store_true", help="Refresh receipts only")
+    parser.add_argument("--fresh", action="store_true", help="With --days, start a new sync run instead of resuming")
+    args = parser.parse_args()
+
+    token = os.getenv("LOYVERSE_TOKEN")
+    if not token:
+        print("❌ Error: LOYVERSE_TOKEN not found in .env or environment variables.")
+        sys.exit(1)
+
+    db = LoyverseDB(args.db)
+    db.init_database()
+    try:
+        while True:
+            try:
+                run_once(db, token, args.days, metadata=not args.no_metadata, fresh=args.fresh)
+            except Exception as e:
+                print(f"❌ Sync failed: {e}")
+                if args.once:
+                    sys.exit(1)
+            if args.once:
+                break
+            time.sleep(args.interval * 60)
+    finally:
+        db.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -82,6 +82,7 @@ def test_database():
         conn = db.get_connection()
         print(f"  ✅ Database connection successful")
         conn.close()
+        db.close_connections()
         
         # Clean up test database
         if os.path.exists("test_loyverse.db"):
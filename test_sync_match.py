@@ -11,7 +11,7 @@ from datetime import date, datetime
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 import pytz
-from utils.sync_dates import get_receipts_api_utc_range, utc_to_bangkok_date
+from utils.sync_dates import bangkok_local_parts, get_receipts_api_utc_range, utc_to_bangkok_date
 
 BANGKOK = pytz.timezone("Asia/Bangkok")
 UTC = pytz.UTC
@@ -116,6 +116,14 @@ def test_bangkok_leap_day_to_utc_range():
     assert created_max == "2024-02-29T16:59:59.000Z", f"got {created_max}"
 
 
+def test_bangkok_local_parts_for_stored_columns():
+    """Stored business_day/hour/weekday use Bangkok local time, not the UTC date."""
+    assert bangkok_local_parts("2026-01-31T17:00:00.000Z") == ("2026-02-01", 0, 6)
+    assert bangkok_local_parts("2026-02-01T16:59:59.000Z") == ("2026-02-01", 23, 6)
+    assert bangkok_local_parts(None) == (None, None, None)
+    assert bangkok_local_parts("not-a-date") == (None, None, None)
+
+
 def run_all():
     """Run all sync/match tests."""
     tests = [
@@ -128,6 +136,7 @@ def run_all():
         test_utc_to_bangkok_date_handles_naive_datetime_as_utc,
         test_utc_to_bangkok_date_handles_non_utc_offset_datetime,
         test_bangkok_leap_day_to_utc_range,
+        test_bangkok_local_parts_for_stored_columns,
     ]
     failed = []
     for t in tests:
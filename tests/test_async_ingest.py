@@ -0,0 +1,103 @@
+import asyncio
+import time
+import unittest
+from datetime import date
+from unittest import mock
+
+import httpx
+
+from utils.async_ingest import AsyncLoyverseClient, ingest_async, save_ingest
+
+
+def make_transport(routes, delay=0.0, calls=None):
+    """MockTransport answering path -> list of responses (status, json, headers), consumed in order"""
+    async def handler(request):
+        if calls is not None:
+            calls.append((request.url.path, dict(request.url.params)))
+        await asyncio.sleep(delay)
+        endpoint = request.url.path.rsplit("/", 1)[-1]
+        queue = routes[endpoint]
+        status, payload, headers = queue.pop(0) if len(queue) > 1 else queue[0]
+        return httpx.Response(status, json=payload, headers=headers or {})
+    return httpx.MockTransport(handler)
+
+
+class AsyncIngestTests(unittest.TestCase):
+    def _run(self, routes, delay=0.0, calls=None, max_rps=0, **kwargs):
+        async def run():
+            client = AsyncLoyverseClient("token", transport=make_transport(routes, delay, calls), backoff=0,
+                                         max_rps=max_rps)
+            async with client:
+                return await ingest_async("token", client=client, **kwargs)
+        return asyncio.run(run())
+
+    def test_endpoints_and_shards_run_concurrently(self):
+        routes = {
+            "customers": [(200, {"customers": [{"id": "c1"}]}, None)],
+            "stores": [(200, {"stores": [{"id": "s1"}]}, None)],
+            "receipts": [(200, {"receipts": [{"receipt_number": "1-1", "store_id": "s1"}]}, None)],
+        }
+        started = time.perf_counter()
+        result = self._run(routes, delay=0.2, endpoints=("customers", "stores"),
+                           start=date(2025, 11, 1), end=date(2025, 11, 3))
+        elapsed = time.perf_counter() - started
+
+        # Five requests of 0.2s each finish in roughly the time of one
+        self.assertLess(elapsed, 0.6)
+        self.assertEqual(result.data["customers"], [{"id": "c1"}])
+        self.assertEqual(result.data["stores"], [{"id": "s1"}])
+        self.assertEqual(len(result.data["receipts"]), 1)
+        self.assertEqual(result.receipt_duplicates, 2)
+        self.assertEqual(result.errors, {})
+        self.assertEqual(result.stats["receipts"]["requests"], 3)
+
+    def test_retries_rate_limits_and_reports_failures(self):
+        calls = []
+        routes = {
+            "customers": [(429, {}, {"Retry-After": "0"}), (200, {"customers": [{"id": "c1"}], "cursor": "p2"}, None),
+                          (200, {"customers": [{"id": "c2"}]}, None)],
+            "items": [(404, {"error": "missing"}, None)],
+        }
+        result = self._run(routes, calls=calls, endpoints=("customers", "items"))
+
+        self.assertEqual(result.data["customers"], [{"id": "c1"}, {"id": "c2"}])
+        self.assertEqual(result.data["items"], [])
+        self.assertIn("404", result.errors["items"])
+        self.assertEqual([params.get("cursor") for path, params in calls if path.endswith("customers")],
+                         [None, None, "p2"])
+        self.assertEqual(result.stats["customers"]["retries"], 1)
+
+    def test_requests_share_the_rate_limit_and_endpoint_filters(self):
+        calls = []
+        routes = {
+            "customers": [(200, {"customers": [{"id": "c1"}]}, None)],
+            "receipts": [(200, {"receipts": []}, None)],
+        }
+        started = time.perf_counter()
+        self._run(routes, calls=calls, max_rps=10, endpoints=("customers",),
+                  start=date(2025, 11, 1), end=date(2025, 11, 3),
+                  endpoint_params={"customers": {"updated_at_min": "2025-11-01T00:00:00.000Z"}})
+        elapsed = time.perf_counter() - started
+
+        # Four requests at 10/s need at least three 0.1s gaps
+        self.assertEqual(len(calls), 4)
+        self.assertGreaterEqual(elapsed, 0.3)
+        customers = [params for path, params in calls if path.endswith("customers")]
+        self.assertEqual(customers[0]["updated_at_min"], "2025-11-01T00:00:00.000Z")
+
+    def test_save_ingest_uses_db_save_methods(self):
+        routes = {"customers": [(200, {"customers": [{"id": "c1"}]}, None)]}
+        result = self._run(routes, endpoints=("customers",))
+        db = mock.Mock()
+
+        self.assertEqual(save_ingest(db, result), {"customers": 1})
+        db.save_customers.assert_called_once_with([{"id": "c1"}])
+        db.save_receipts.assert_not_called()
+
+    def test_unknown_endpoint_is_rejected(self):
+        with self.assertRaises(ValueError):
+            asyncio.run(ingest_async("token", endpoints=("receipt",)))
+
+
+if __name__ == "__main__":
+    unittest.main()
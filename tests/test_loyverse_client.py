@@ -0,0 +1,86 @@
+import json
+import unittest
+from unittest import mock
+
+import requests
+
+from utils.loyverse_client import LoyverseAPIError, LoyverseClient
+
+
+def make_response(status_code, payload=None, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = b"" if payload is None else json.dumps(payload).encode()
+    response.headers.update(headers or {})
+    return response
+
+
+class FakeSession(requests.Session):
+    """Session that replays canned responses and records the requests made"""
+
+    def __init__(self, responses):
+        super().__init__()
+        self.responses = list(responses)
+        self.calls = []
+
+    def request(self, method, url, params=None, json=None, timeout=None):
+        self.calls.append((method, url, dict(params or {})))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class LoyverseClientTests(unittest.TestCase):
+    def _client(self, responses, **kwargs):
+        self.session = FakeSession(responses)
+        return LoyverseClient("token", session=self.session, **kwargs)
+
+    def test_paginator_follows_cursor_on_one_session(self):
+        client = self._client([
+            make_response(200, {"receipts": [{"id": "r1"}], "cursor": "c1"}),
+            make_response(200, {"receipts": [{"id": "r2"}]}),
+        ])
+
+        pages = list(client.iter_pages("receipts", "receipts", {"store_id": "s1"}))
+
+        self.assertEqual(pages, [([{"id": "r1"}], "c1"), ([{"id": "r2"}], None)])
+        self.assertEqual([call[2].get("cursor") for call in self.session.calls], [None, "c1"])
+        self.assertEqual(self.session.calls[0][2], {"store_id": "s1", "limit": 250})
+        self.assertEqual(self.session.headers["Authorization"], "Bearer token")
+        stats = client.get_stats()["receipts"]
+        self.assertEqual((stats["requests"], stats["retries"], stats["errors"]), (2, 0, 0))
+
+    @mock.patch("utils.loyverse_client.time.sleep")
+    def test_retries_honor_retry_after_and_backoff(self, sleep):
+        client = self._client([
+            make_response(429, {}, {"Retry-After": "3"}),
+            requests.ConnectionError("reset"),
+            make_response(503, {}),
+            make_response(200, {"stores": [{"id": "s1"}]}),
+        ], backoff=1)
+
+        self.assertEqual(client.fetch_all("stores"), [{"id": "s1"}])
+
+        delays = [call.args[0] for call in sleep.call_args_list]
+        self.assertEqual(delays[0], 3.0)
+        self.assertTrue(1.0 <= delays[1] <= 2.0)
+        self.assertTrue(2.0 <= delays[2] <= 4.0)
+        stats = client.get_stats()["stores"]
+        self.assertEqual((stats["requests"], stats["retries"], stats["errors"]), (4, 3, 3))
+
+    @mock.patch("utils.loyverse_client.time.sleep")
+    def test_errors_surface_after_retries_and_posts_are_not_retried(self, sleep):
+        client = self._client([make_response(500, {}), make_response(500, {"error": "down"})], max_retries=1)
+        with self.assertRaises(LoyverseAPIError) as ctx:
+            client.get("customers")
+        self.assertEqual(ctx.exception.status_code, 500)
+
+        client = self._client([make_response(502, {})])
+        self.assertEqual(client.post("receipts", {"total_money": 1}).status_code, 502)
+        self.assertEqual(len(self.session.calls), 1)
+        sleep.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
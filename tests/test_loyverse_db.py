@@ -0,0 +1,835 @@
+import json
+import sqlite3
+import tempfile
+import unittest
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+import database
+from database import IN_REQUEST_MAINTENANCE_TASKS, LoyverseDB
+
+
+def make_receipt(receipt_id, receipt_number, created_at, total=100.0, receipt_type="SALE", payments=None, lines=None):
+    return {
+        "id": receipt_id,
+        "receipt_number": receipt_number,
+        "receipt_date": created_at,
+        "created_at": created_at,
+        "updated_at": created_at,
+        "store_id": "store_1",
+        "customer_id": "cust_1",
+        "employee_id": "emp_1",
+        "total_money": total,
+        "total_tax": 0.0,
+        "total_discount": 0.0,
+        "receipt_type": receipt_type,
+        "source": "POS",
+        "dining_option": "Front",
+        "line_items": lines
+        if lines is not None
+        else [
+            {
+                "id": f"{receipt_id}-li1",
+                "item_id": "item_1",
+                "variant_id": "var_1",
+                "item_name": "Ice",
+                "sku": "ICE",
+                "quantity": 2,
+                "price": total / 2,
+                "total_money": total,
+                "cost": 10.0,
+            }
+        ],
+        "payments": payments
+        if payments is not None
+        else [
+            {
+                "payment_type_id": "pt_cash",
+                "name": "Cash",
+                "type": "CASH",
+                "money_amount": total,
+                "paid_at": created_at,
+            }
+        ],
+    }
+
+
+class LoyverseDBTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = LoyverseDB(str(Path(self.tmpdir.name) / "loyverse.db"))
+
+    def tearDown(self):
+        self.db.close_connections()
+        self.tmpdir.cleanup()
+
+    def _count(self, table):
+        conn = self.db.get_connection()
+        count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        conn.close()
+        return count
+
+    def test_save_receipts_writes_children_and_reports_throughput(self):
+        receipts = [
+            make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z"),
+            make_receipt("r2", "1-0002", "2026-02-01T04:00:00.000Z", total=50.0),
+        ]
+
+        saved = self.db.save_receipts(receipts)
+
+        self.assertEqual(saved, 2)
+        self.assertEqual(self._count("receipts"), 2)
+        self.assertEqual(self._count("line_items"), 2)
+        self.assertEqual(self._count("payments"), 2)
+        stats = self.db.last_ingest_stats
+        self.assertEqual(stats["receipts"], 2)
+        self.assertEqual(stats["line_items"], 2)
+        self.assertGreater(stats["rows_per_sec"], 0)
+
+    def test_resync_replaces_children_and_last_duplicate_wins(self):
+        self.db.save_receipts([make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z")])
+        self.db.save_receipts(
+            [
+                make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z", total=80.0),
+                make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z", total=90.0),
+            ]
+        )
+
+        self.assertEqual(self._count("receipts"), 1)
+        self.assertEqual(self._count("line_items"), 1)
+        self.assertEqual(self._count("payments"), 1)
+        df = self.db.get_receipts_dataframe()
+        self.assertEqual(float(df["receipt_total"].iloc[0]), 90.0)
+
+    def test_resync_of_unchanged_receipts_is_a_no_op(self):
+        split_tender = [
+            {"payment_type_id": "pt_cash", "money_amount": 50.0},
+            {"payment_type_id": "pt_card", "money_amount": 50.0},
+        ]
+        receipts = [
+            make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z", payments=split_tender),
+            make_receipt("r2", "1-0002", "2026-02-01T04:00:00.000Z"),
+        ]
+        self.db.save_receipts(receipts)
+        version = self.db.get_data_version()
+        conn = self.db.get_connection()
+        payment_ids = conn.execute("SELECT id, payment_key FROM payments ORDER BY id").fetchall()
+        conn.close()
+
+        self.db.save_receipts(receipts)
+        self.assertEqual(self.db.last_ingest_stats["receipts"], 0)
+        self.assertEqual(self.db.last_ingest_stats["unchanged"], 2)
+        self.assertEqual(self.db.get_data_version(), version)
+
+        # A changed receipt keeps its child row ids and drops children it lost
+        updated = make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z", payments=split_tender[:1])
+        updated["updated_at"] = "2026-02-01T05:00:00.000Z"
+        self.db.save_receipts([updated])
+        conn = self.db.get_connection()
+        remaining = conn.execute("SELECT id, payment_key FROM payments ORDER BY id").fetchall()
+        conn.close()
+        self.assertEqual(remaining, [payment_ids[0], payment_ids[2]])
+        self.assertEqual(payment_ids[0][1], "r1:0")
+        self.assertEqual(self.db.last_ingest_stats["unchanged"], 0)
+
+    def test_init_keys_legacy_payments_by_ordinal(self):
+        conn = self.db.get_connection()
+        conn.executemany(
+            "INSERT INTO payments (receipt_id, payment_type_id) VALUES (?, ?)",
+            [("r1", "pt_cash"), ("r2", "pt_cash"), ("r1", "pt_card")],
+        )
+        conn.commit()
+        conn.close()
+
+        self.db.init_database()
+
+        conn = self.db.get_connection()
+        keys = conn.execute("SELECT payment_key FROM payments ORDER BY id").fetchall()
+        conn.close()
+        self.assertEqual(keys, [("r1:0",), ("r2:0",), ("r1:1",)])
+
+    def test_uuids_get_integer_surrogate_keys(self):
+        self.db.save_categories([{"id": "cat_1", "name": "Front"}])
+        self.db.save_items([{"id": "item_1", "item_name": "Ice", "category_id": "cat_1", "variants": []}])
+        self.db.save_receipts(
+            [
+                make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z"),
+                make_receipt("r2", "1-0002", "2026-02-01T04:00:00.000Z"),
+            ]
+        )
+
+        conn = self.db.get_connection()
+        store_keys = conn.execute("SELECT DISTINCT store_key FROM receipts").fetchall()
+        line_keys = conn.execute("SELECT DISTINCT item_key FROM line_items").fetchall()
+        item_key = conn.execute("SELECT item_key FROM items WHERE item_id = 'item_1'").fetchone()
+        payment_keys = conn.execute("SELECT DISTINCT payment_type_key FROM payments").fetchall()
+        conn.close()
+        self.assertEqual(len(store_keys), 1)
+        self.assertIsInstance(store_keys[0][0], int)
+        self.assertEqual(line_keys, [item_key])
+        self.assertIsInstance(payment_keys[0][0], int)
+
+        # The frame still speaks UUIDs and joins items through the integer key
+        df = self.db.get_receipts_dataframe()
+        self.assertEqual(set(df["store_id"]), {"store_1"})
+        self.assertEqual(set(df["location"]), {"Front"})
+
+        # Rows stored before the key columns existed are keyed at init
+        conn = self.db.get_connection()
+        conn.execute("UPDATE receipts SET customer_key = NULL")
+        conn.commit()
+        conn.close()
+        self.db.init_database()
+        conn = self.db.get_connection()
+        missing = conn.execute("SELECT COUNT(*) FROM receipts WHERE customer_key IS NULL").fetchone()[0]
+        conn.close()
+        self.assertEqual(missing, 0)
+
+    def test_money_is_stored_as_exact_satang_with_signed_net(self):
+        sale = make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z", total=100.1)
+        sale["total_discount"] = 0.2
+        refund = make_receipt("r2", "1-0002", "2026-02-01T04:00:00.000Z", total=0.3, receipt_type="REFUND")
+        self.db.save_receipts([sale, refund])
+
+        conn = self.db.get_connection()
+        rows = conn.execute(
+            "SELECT receipt_id, total_money_satang, total_discount_satang, signed_net_satang FROM receipts ORDER BY receipt_id"
+        ).fetchall()
+        line_totals = conn.execute("SELECT total_money_satang FROM line_items ORDER BY line_item_id").fetchall()
+        conn.close()
+        self.assertEqual(rows, [("r1", 10010, 20, 9990), ("r2", 30, 0, -30)])
+        self.assertEqual(line_totals, [(10010,), (30,)])
+
+        df = self.db.get_receipts_dataframe()
+        self.assertEqual(int(df["signed_net_satang"].sum()), 9960)
+        summary = self.db.get_daily_summary()
+        self.assertAlmostEqual(float(summary["signed_net"].iloc[0]), 99.6)
+
+        # Receipts saved before the satang columns existed are converted at init,
+        # rounding half-up like ingest (1.005 * 100 is 100.4999... as a float)
+        conn = self.db.get_connection()
+        conn.execute("UPDATE receipts SET total_money_satang = NULL, signed_net_satang = NULL")
+        conn.execute("UPDATE line_items SET total_money = 1.005, total_money_satang = NULL WHERE receipt_id = 'r2'")
+        conn.commit()
+        conn.close()
+        self.db.init_database()
+        conn = self.db.get_connection()
+        backfilled = conn.execute("SELECT signed_net_satang FROM receipts ORDER BY receipt_id").fetchall()
+        line_total = conn.execute("SELECT total_money_satang FROM line_items WHERE receipt_id = 'r2'").fetchone()
+        conn.close()
+        self.assertEqual(backfilled, [(9990,), (-30,)])
+        self.assertEqual(line_total, (101,))
+
+    def test_connections_are_pooled_and_tuned(self):
+        conn = self.db.get_connection()
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(conn.execute("PRAGMA busy_timeout").fetchone()[0], 5000)
+        conn.close()
+
+        self.assertIs(self.db.get_connection(), conn)
+
+    def test_statements_are_profiled_and_slow_plans_logged(self):
+        self.db.save_receipts([make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z")])
+        self.db.reset_query_stats()
+        self.db.set_slow_query_threshold(0)
+        try:
+            conn = self.db.get_connection()
+            rows = conn.execute("SELECT receipt_id FROM receipts WHERE business_day = ?", ("2026-02-01",)).fetchall()
+            conn.close()
+        finally:
+            self.db.set_slow_query_threshold(250)
+
+        self.assertEqual(rows, [("r1",)])
+        stats = {row["sql"]: row for row in self.db.get_query_stats()}
+        entry = stats["SELECT receipt_id FROM receipts WHERE business_day = ?"]
+        self.assertEqual((entry["calls"], entry["rows"]), (1, 1))
+
+        slow = self.db.get_slow_queries()
+        self.assertEqual(slow["sql"].iloc[0], "SELECT receipt_id FROM receipts WHERE business_day = ?")
+        self.assertIn("idx_receipts_business_day", slow["plan"].iloc[0])
+        self.assertEqual(json.loads(slow["params"].iloc[0]), ["2026-02-01"])
+
+    def test_database_stats_come_from_counters_and_cache(self):
+        self.db.save_receipts(
+            [
+                make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z"),
+                make_receipt("r2", "1-0002", "2026-02-02T03:00:00.000Z"),
+            ]
+        )
+        stats = self.db.get_database_stats()
+        self.assertEqual((stats["receipts"], stats["line_items"], stats["customers"]), (2, 2, 0))
+        self.assertEqual(stats["date_range"], ("2026-02-01T03:00:00.000Z", "2026-02-02T03:00:00.000Z"))
+
+        self.db.reset_query_stats()
+        self.assertEqual(self.db.get_database_stats(), stats)
+        executed = [row["sql"] for row in self.db.get_query_stats(top=None)]
+        self.assertEqual(executed, ["SELECT version, last_updated FROM data_versions WHERE scope = 'stats'"])
+
+        self.db.remove_problematic_receipts(receipt_numbers=["1-0001"])
+        self.db.update_sync_time("receipts")
+        stats = self.db.get_database_stats()
+        self.assertEqual((stats["receipts"], stats["line_items"]), (1, 1))
+        self.assertIn("receipts", stats["last_syncs"])
+
+        # Writes adjust the counters by the rows they changed instead of recounting
+        two_lines = [
+            {"id": "r2-a", "item_id": "item_1", "quantity": 1, "total_money": 60.0},
+            {"id": "r2-b", "item_id": "item_2", "quantity": 1, "total_money": 40.0},
+        ]
+        self.db.reset_query_stats()
+        self.db.save_receipts([
+            make_receipt("r2", "1-0002", "2026-02-02T03:00:00.000Z", lines=two_lines),
+            make_receipt("r3", "1-0003", "2026-01-30T03:00:00.000Z"),
+        ])
+        executed = [row["sql"] for row in self.db.get_query_stats(top=None)]
+        self.assertFalse([sql for sql in executed if sql.startswith("SELECT COUNT(*) FROM receipts")])
+        stats = self.db.get_database_stats()
+        self.assertEqual((stats["receipts"], stats["line_items"]), (2, 3))
+        self.assertEqual(stats["date_range"], ("2026-01-30T03:00:00.000Z", "2026-02-02T03:00:00.000Z"))
+
+        self.db.delete_receipts(["r3"])
+        stats = self.db.get_database_stats()
+        self.assertEqual((stats["receipts"], stats["line_items"]), (1, 2))
+        self.assertEqual(stats["date_range"][0], "2026-02-02T03:00:00.000Z")
+
+    def test_delete_receipts_removes_children_and_reports_rows(self):
+        receipts = [
+            make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z"),
+            make_receipt("r2", "1-0002", "2026-02-01T03:00:00.000Z"),
+            make_receipt("r3", "1-0003", "2026-02-02T03:00:00.000Z", total=40.0),
+        ]
+        self.db.save_receipts(receipts)
+        version = self.db.get_data_version()
+
+        self.assertEqual(self.db.find_duplicate_receipts(), ["r2"])
+        self.assertEqual(self.db.find_duplicate_receipts(start_date="2026-02-02"), [])
+
+        removed = self.db.delete_receipts(["r2", "missing"])
+        self.assertEqual(removed["receipt_ids"], ["r2"])
+        self.assertEqual(removed["business_days"], ["2026-02-01"])
+        self.assertEqual(
+            removed["rows"],
+            {"line_items": 1, "payments": 1, "receipt_payment_summary": 1, "raw_payloads": 1, "receipts": 1},
+        )
+        self.assertEqual(self._count("receipts"), 2)
+        self.assertEqual(self._count("payments"), 2)
+        self.assertEqual(self.db.get_data_version(), version + 1)
+        self.assertEqual(self.db.get_database_stats()["receipts"], 2)
+        self.assertEqual(self.db.get_daily_summary()["receipt_count"].tolist(), [1, 1])
+
+        self.assertEqual(self.db.delete_receipts(["missing"])["receipt_ids"], [])
+        self.assertEqual(self.db.get_data_version(), version + 1)
+        self.assertEqual(self.db.remove_problematic_receipts(min_abs_total=50), 1)
+        self.assertEqual(self._count("receipts"), 1)
+
+    def test_remove_problematic_receipts_takes_one_receipt_per_number(self):
+        other_store = make_receipt("r2", "1-0001", "2026-02-01T04:00:00.000Z")
+        other_store["store_id"] = "store_2"
+        self.db.save_receipts([make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z"), other_store])
+
+        self.assertEqual(self.db.remove_problematic_receipts(receipt_numbers=["1-0001"], store_id="store_2"), 1)
+        self.assertEqual(self.db.remove_problematic_receipts(receipt_numbers=["1-0001", "1-0001"]), 1)
+        self.assertEqual(self._count("receipts"), 0)
+
+    def test_archive_months_move_out_and_stay_queryable(self):
+        self.db.save_receipts(
+            [
+                make_receipt("r1", "1-0001", "2025-12-10T03:00:00.000Z"),
+                make_receipt("r2", "1-0002", "2026-01-10T03:00:00.000Z", total=60.0),
+                make_receipt("r3", "1-0003", "2026-02-10T03:00:00.000Z", total=40.0),
+            ]
+        )
+        before = self.db.get_receipts_dataframe()
+        summary = self.db.get_daily_summary()
+        version = self.db.get_data_version()
+
+        results = self.db.archive_months(keep_months=1, today=date(2026, 2, 15))
+
+        self.assertEqual([result["month"] for result in results], ["2025-12", "2026-01"])
+        self.assertEqual(results[1]["rows"]["line_items"], 1)
+        self.assertTrue(Path(self.db.archive_path("2026-01")).exists())
+        self.assertEqual(self._count("receipts"), 1)
+        self.assertEqual(self.db.get_receipt_count(), 3)
+        self.assertEqual(self.db.get_data_version(), version)
+
+        after = self.db.get_receipts_dataframe()
+        self.assertEqual(sorted(after["bill_number"]), sorted(before["bill_number"]))
+        january = self.db.get_receipts_dataframe(start_date="2026-01-01", end_date="2026-01-31")
+        self.assertEqual(january["bill_number"].tolist(), ["1-0002"])
+        streamed = pd.concat(self.db.iter_receipts(columns=["business_day", "bill_number"]))
+        self.assertEqual(streamed["bill_number"].tolist(), ["1-0001", "1-0002", "1-0003"])
+
+        self.db.rebuild_daily_summary()
+        pd.testing.assert_frame_equal(self.db.get_daily_summary(), summary)
+
+        # Receipts for an archived month are written into its partition
+        self.db.save_receipts([make_receipt("r2", "1-0002", "2026-01-10T03:00:00.000Z", total=60.0)])
+        self.assertEqual(self.db.last_ingest_stats["unchanged"], 1)
+        self.db.save_receipts([
+            make_receipt("r2", "1-0002", "2026-01-10T03:00:00.000Z", total=80.0),
+            make_receipt("r4", "1-0004", "2026-01-11T03:00:00.000Z", total=10.0),
+        ])
+        self.assertEqual(self.db.get_archive_partitions()["month"].tolist(), ["2025-12", "2026-01"])
+        self.assertEqual((self._count("receipts"), self._count("payments")), (1, 1))
+        self.assertEqual(self.db.get_archive_partitions()["receipt_count"].tolist(), [1, 2])
+        january = self.db.get_daily_summary(start_date="2026-01-01", end_date="2026-01-31")
+        self.assertEqual(january["signed_net"].tolist(), [80.0, 10.0])
+        stats = self.db.get_database_stats()
+        self.assertEqual((stats["receipts"], stats["line_items"]), (4, 4))
+        self.assertEqual(self.db.get_receipt_count(), 4)
+        self.assertEqual(stats["date_range"], ("2025-12-10T03:00:00.000Z", "2026-02-10T03:00:00.000Z"))
+
+        # Deletes and duplicate checks reach archived receipts
+        duplicate = make_receipt("r5", "1-0005", "2026-01-11T03:00:00.000Z", total=10.0)
+        self.db.save_receipts([duplicate])
+        self.assertEqual(self.db.find_duplicate_receipts(), ["r5"])
+        removed = self.db.delete_receipts(["r5", "r3"])
+        self.assertEqual(removed["receipt_ids"], ["r3", "r5"])
+        self.assertEqual(removed["business_days"], ["2026-01-11", "2026-02-10"])
+        self.assertEqual(self.db.get_receipt_count(), 3)
+        self.assertEqual(self.db.get_daily_summary(start_date="2026-01-11")["receipt_count"].tolist(), [1])
+
+    def test_early_stop_of_a_stream_detaches_its_archive(self):
+        self.db.save_receipts(
+            [
+                make_receipt("r1", "1-0001", "2026-01-10T03:00:00.000Z"),
+                make_receipt("r2", "1-0002", "2026-01-11T03:00:00.000Z"),
+                make_receipt("r3", "1-0003", "2026-02-10T03:00:00.000Z"),
+            ]
+        )
+        self.db.archive_months(keep_months=1, today=date(2026, 2, 15))
+
+        stream = self.db.iter_receipts(columns=["bill_number"], chunk_size=1)
+        self.assertEqual(next(stream)["bill_number"].tolist(), ["1-0001"])
+        stream.close()
+
+        conn = self.db.get_connection()
+        schemas = [row[1] for row in conn.execute("PRAGMA database_list").fetchall()]
+        conn.close()
+        self.assertNotIn(LoyverseDB.ARCHIVE_SCHEMA, schemas)
+        self.assertEqual(len(self.db.get_receipts_dataframe()), 3)
+
+        # An open write transaction is never committed to make room for ATTACH
+        conn = self.db.get_connection()
+        conn.execute("INSERT INTO sync_metadata (key, value, last_updated) VALUES ('k', 'v', 'now')")
+        with self.assertRaises(RuntimeError):
+            self.db._attach_archive(conn, self.db.archive_path("2026-01"))
+        conn.close()
+        conn = self.db.get_connection()
+        self.assertIsNone(conn.execute("SELECT value FROM sync_metadata WHERE key = 'k'").fetchone())
+        conn.close()
+
+    def test_maintenance_runs_are_logged_and_scheduled(self):
+        self.db.save_receipts([make_receipt(f"r{i}", f"1-{i:04d}", "2026-02-01T03:00:00.000Z") for i in range(50)])
+        self.db.delete_receipts([f"r{i}" for i in range(50)])
+
+        # The dashboard's post-sync hook never runs the full VACUUM or integrity check
+        light = self.db.run_scheduled_maintenance(tasks=IN_REQUEST_MAINTENANCE_TASKS, full_vacuum=False)
+        self.assertEqual([entry["task"] for entry in light], ["optimize", "analyze", "vacuum"])
+        self.assertTrue(light[2]["result"].startswith("skipped"))
+        self.assertEqual(self.db.due_maintenance_tasks(), ["optimize", "vacuum", "integrity"])
+
+        results = self.db.run_maintenance()
+
+        self.assertEqual([entry["task"] for entry in results], ["optimize", "analyze", "vacuum", "integrity"])
+        vacuum = results[2]
+        self.assertEqual(vacuum["result"], "full vacuum, auto_vacuum=incremental")
+        self.assertEqual(vacuum["freelist_after"], 0)
+        self.assertLessEqual(vacuum["pages_after"], vacuum["pages_before"])
+        self.assertEqual(results[3]["result"], "ok")
+
+        conn = self.db.get_connection()
+        self.assertEqual(conn.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+        conn.close()
+        self.assertEqual(self.db.run_maintenance(("vacuum",))[0]["result"], "incremental")
+
+        log = self.db.get_maintenance_log()
+        self.assertEqual(log["task"].tolist()[:2], ["vacuum", "integrity"])
+        self.assertEqual(self.db.due_maintenance_tasks(), ["optimize"])
+        later = datetime.now() + timedelta(days=8)
+        self.assertEqual(self.db.due_maintenance_tasks(later), ["optimize", "analyze", "vacuum", "integrity"])
+        with self.assertRaises(ValueError):
+            self.db.run_maintenance(("defrag",))
+
+    def test_metadata_saves_write_only_new_or_changed_rows(self):
+        customers = [{"id": "cust_1", "name": "Alice"}, {"id": "cust_2", "name": "Bob"}]
+        self.assertEqual(self.db.save_customers(customers), 2)
+        self.assertEqual(self.db.last_metadata_stats["customers"], {"inserted": 2, "updated": 0, "unchanged": 0})
+        version = self.db.get_data_version("metadata")
+
+        self.db.save_customers(customers)
+        self.assertEqual(self.db.last_metadata_stats["customers"], {"inserted": 0, "updated": 0, "unchanged": 2})
+        self.assertEqual(self.db.get_data_version("metadata"), version)
+
+        self.db.save_customers([{"id": "cust_1", "name": "Alice"}, {"id": "cust_2", "name": "Robert"}])
+        self.assertEqual(self.db.last_metadata_stats["customers"], {"inserted": 0, "updated": 1, "unchanged": 1})
+        self.assertEqual(self.db.get_customer_map()["cust_2"], "Robert")
+        self.assertEqual(self.db.get_raw_payload("customer", "cust_2"), {"id": "cust_2", "name": "Robert"})
+
+        # Unchanged items leave the daily summary and receipts snapshot alone
+        items = [{"id": "item_1", "item_name": "Ice", "category_id": "cat_1", "variants": []}]
+        self.db.save_items(items)
+        receipts_version = self.db.get_data_version()
+        self.db.save_items(items)
+        self.assertEqual(self.db.get_data_version(), receipts_version)
+
+    def test_close_discards_uncommitted_work(self):
+        conn = self.db.get_connection()
+        conn.execute("INSERT INTO sync_metadata (key, value, last_updated) VALUES ('k', 'v', 'now')")
+        conn.close()
+
+        conn = self.db.get_connection()
+        self.assertIsNone(conn.execute("SELECT value FROM sync_metadata WHERE key = 'k'").fetchone())
+        conn.close()
+
+    def test_reads_proceed_while_a_write_is_open(self):
+        self.db.save_receipts([make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z")])
+        writer = self.db.get_connection()
+        writer.execute("DELETE FROM receipts")
+
+        self.assertEqual(len(self.db.get_receipts_dataframe()), 1)
+        writer.close()
+
+    def test_bangkok_business_day_is_stored_and_filtered(self):
+        # 18:30 UTC on Jan 31 is 01:30 on Sunday Feb 1 in Bangkok
+        self.db.save_receipts(
+            [
+                make_receipt("r1", "1-0001", "2026-01-31T18:30:00.000Z"),
+                make_receipt("r2", "1-0002", "2026-01-31T09:00:00.000Z"),
+            ]
+        )
+
+        conn = self.db.get_connection()
+        row = conn.execute(
+            "SELECT business_day, local_hour, local_weekday FROM receipts WHERE receipt_id = 'r1'"
+        ).fetchone()
+        conn.close()
+        self.assertEqual(row, ("2026-02-01", 1, 6))
+
+        df = self.db.get_receipts_dataframe(start_date="2026-02-01", end_date="2026-02-01")
+        self.assertEqual(df["bill_number"].tolist(), ["1-0001"])
+
+    def test_init_backfills_business_day_for_legacy_rows(self):
+        legacy_path = str(Path(self.tmpdir.name) / "legacy.db")
+        conn = sqlite3.connect(legacy_path)
+        conn.executescript(
+            """
+            CREATE TABLE receipts (
+                receipt_id TEXT PRIMARY KEY, receipt_number TEXT, receipt_date TEXT,
+                created_at TEXT, updated_at TEXT, store_id TEXT, customer_id TEXT,
+                employee_id TEXT, total_money REAL, total_tax REAL, total_discount REAL,
+                receipt_type TEXT, source TEXT, dining_option TEXT, location TEXT,
+                raw_data TEXT, last_updated TEXT
+            );
+            INSERT INTO receipts (receipt_id, receipt_number, created_at)
+            VALUES ('old', '1-0009', '2026-01-31T17:00:00.000Z');
+            """
+        )
+        conn.commit()
+        conn.close()
+
+        legacy_db = LoyverseDB(legacy_path)
+        conn = legacy_db.get_connection()
+        row = conn.execute("SELECT event_ts, business_day, local_hour FROM receipts").fetchone()
+        conn.close()
+        legacy_db.close_connections()
+
+        self.assertEqual(row, ("2026-01-31T17:00:00.000Z", "2026-02-01", 0))
+
+    def test_daily_summary_tracks_saves_and_removals(self):
+        self.db.save_categories([{"id": "cat_1", "name": "Front"}])
+        self.db.save_items([{"id": "item_1", "item_name": "Ice", "category_id": "cat_1", "variants": []}])
+        self.db.save_receipts(
+            [
+                make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z", total=100.0),
+                make_receipt("r2", "1-0002", "2026-02-01T04:00:00.000Z", total=30.0, receipt_type="REFUND"),
+                make_receipt("r3", "1-0003", "2026-02-02T04:00:00.000Z", total=70.0),
+            ]
+        )
+
+        daily = self.db.get_daily_summary(group_by=("business_day",))
+        self.assertEqual(daily["business_day"].tolist(), ["2026-02-01", "2026-02-02"])
+        self.assertEqual(daily["signed_net"].tolist(), [70.0, 70.0])
+        self.assertEqual(daily["gross_sales"].tolist(), [100.0, 70.0])
+        self.assertEqual(daily["refunds"].tolist(), [30.0, 0.0])
+        self.assertEqual(daily["receipt_count"].tolist(), [2, 1])
+
+        by_location = self.db.get_daily_summary(group_by=("location", "payment_type_ids"))
+        self.assertEqual(by_location["location"].tolist(), ["Front"])
+        self.assertEqual(by_location["payment_type_ids"].tolist(), ["pt_cash"])
+
+        # Moving a receipt to another day updates both days
+        self.db.save_receipts([make_receipt("r3", "1-0003", "2026-02-01T05:00:00.000Z", total=70.0)])
+        daily = self.db.get_daily_summary()
+        self.assertEqual(daily["business_day"].tolist(), ["2026-02-01"])
+        self.assertEqual(daily["signed_net"].tolist(), [140.0])
+
+        self.db.remove_problematic_receipts(receipt_numbers=["1-0001"])
+        total = self.db.get_daily_summary(group_by=())
+        self.assertEqual(total["signed_net"].tolist(), [40.0])
+        self.assertEqual(total["receipt_count"].tolist(), [2])
+
+        # A mixed receipt belongs to its first categorized line, as in the receipts frame
+        self.db.save_categories([{"id": "cat_2", "name": "Back"}])
+        self.db.save_items([{"id": "item_2", "item_name": "Bag", "category_id": "cat_2", "variants": []}])
+        mixed = [
+            {"id": "r4-a", "item_id": "item_1", "quantity": 1, "total_money": 10.0},
+            {"id": "r4-b", "item_id": "item_2", "quantity": 1, "total_money": 10.0},
+        ]
+        self.db.save_receipts([make_receipt("r4", "1-0004", "2026-02-03T04:00:00.000Z", total=20.0, lines=mixed)])
+        by_location = self.db.get_daily_summary(start_date="2026-02-03", group_by=("location",))
+        self.assertEqual(by_location["location"].tolist(), ["Front"])
+
+    def test_receipts_snapshot_patches_only_changed_days(self):
+        self.db.save_receipts(
+            [
+                make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z"),
+                make_receipt("r2", "1-0002", "2026-02-02T03:00:00.000Z"),
+            ]
+        )
+        first = self.db.load_receipts_snapshot()
+        self.assertEqual(len(first), 2)
+        self.assertTrue(Path(self.db.snapshot_path).exists())
+
+        # Unchanged version: served from the snapshot without touching SQL
+        original = self.db.get_receipts_dataframe
+        self.db.get_receipts_dataframe = lambda *a, **k: self.fail("snapshot should be current")
+        self.assertEqual(len(self.db.load_receipts_snapshot()), 2)
+        self.db.get_receipts_dataframe = original
+
+        queried_days = []
+
+        def tracking_query(*args, **kwargs):
+            queried_days.append(kwargs.get("business_days"))
+            return original(*args, **kwargs)
+
+        self.db.get_receipts_dataframe = tracking_query
+        self.db.save_receipts([make_receipt("r3", "1-0003", "2026-02-02T05:00:00.000Z")])
+        patched = self.db.load_receipts_snapshot()
+
+        self.assertEqual(queried_days, [{"2026-02-02"}])
+        self.assertEqual(sorted(patched["bill_number"]), ["1-0001", "1-0002", "1-0003"])
+
+        self.db.clear_all_data()
+        queried_days.clear()
+        self.assertTrue(self.db.load_receipts_snapshot().empty)
+        self.assertEqual(queried_days, [None])
+
+    def _analytics_fixture(self):
+        two_lines = [
+            {"id": "r2-a", "item_id": "item_1", "item_name": "Ice", "quantity": 1, "price": 30.0, "total_money": 30.0},
+            {"id": "r2-b", "item_id": "item_2", "item_name": "Water", "quantity": 1, "price": 30.0, "total_money": 30.0},
+        ]
+        self.db.save_receipts(
+            [
+                make_receipt("r1", "1-0001", "2025-02-01T03:00:00.000Z", total=100.0),
+                make_receipt("r2", "1-0002", "2026-02-01T03:00:00.000Z", total=60.0, lines=two_lines),
+                make_receipt("r3", "1-0003", "2026-02-01T04:00:00.000Z", total=20.0, receipt_type="REFUND"),
+                make_receipt("r4", "1-0004", "2026-02-02T03:00:00.000Z", total=90.0),
+            ]
+        )
+
+    def test_analytics_queries_run_on_sqlite(self):
+        self._analytics_fixture()
+
+        peaks = self.db.analytics_query("hourly_peaks", engine="sqlite")
+        ten_am = peaks[peaks["local_hour"] == 10]
+        self.assertEqual(ten_am["receipts"].sum(), 3)
+        self.assertAlmostEqual(ten_am["signed_net"].sum(), 250.0)
+
+        lifetime = self.db.analytics_query("customer_lifetime", engine="sqlite")
+        row = lifetime.iloc[0]
+        self.assertEqual((row["first_day"], row["last_day"]), ("2025-02-01", "2026-02-02"))
+        self.assertEqual((row["receipts"], row["active_days"], row["refunds"]), (4, 3, 1))
+        self.assertAlmostEqual(row["signed_net"], 230.0)
+
+        trend = self.db.analytics_query("monthly_trend", engine="sqlite")
+        feb_2026 = trend[(trend["year"] == 2026) & (trend["month"] == 2)].iloc[0]
+        self.assertAlmostEqual(feb_2026["signed_net"], 130.0)
+        self.assertAlmostEqual(feb_2026["prev_year_signed_net"], 100.0)
+        self.assertAlmostEqual(feb_2026["yoy_change"], 0.3)
+
+        ranged = self.db.analytics_query("monthly_trend", start_date="2026-01-01", engine="sqlite")
+        self.assertEqual(ranged["receipts"].tolist(), [3])
+
+        # Archived months stay in the results
+        self.db.archive_months(keep_months=1, today=date(2026, 2, 15))
+        archived = self.db.analytics_query("monthly_trend", engine="sqlite")
+        self.assertEqual(archived.astype(str).values.tolist(), trend.astype(str).values.tolist())
+        with self.assertRaises(ValueError):
+            self.db.analytics_query("no_such_query")
+
+    @unittest.skipUnless(database.duckdb is not None, "duckdb not installed")
+    def test_analytics_duckdb_matches_sqlite(self):
+        self._analytics_fixture()
+
+        for name in LoyverseDB.ANALYTICS_QUERIES:
+            expected = self.db.analytics_query(name, engine="sqlite")
+            actual = self.db.analytics_query(name, engine="duckdb")
+            self.assertEqual(actual.astype(str).values.tolist(), expected.astype(str).values.tolist(), name)
+        # The engine reads its own snapshot, re-exported in chunks after new writes
+        self.db.load_receipts_snapshot = lambda: self.fail("analytics should not rebuild the receipts frame")
+        self.db.save_receipts([make_receipt("r5", "1-0005", "2026-02-02T05:00:00.000Z", total=10.0)])
+        trend = self.db.analytics_query("monthly_trend", start_date="2026-02-01", engine="duckdb")
+        self.assertAlmostEqual(trend["signed_net"].iloc[0], 140.0)
+
+        self.db.archive_months(keep_months=1, today=date(2026, 2, 15))
+        self.db.save_receipts([make_receipt("r6", "1-0006", "2026-02-02T06:00:00.000Z", total=10.0)])
+        expected = self.db.analytics_query("customer_lifetime", engine="sqlite")
+        actual = self.db.analytics_query("customer_lifetime", engine="duckdb")
+        self.assertEqual(actual.astype(str).values.tolist(), expected.astype(str).values.tolist())
+
+    def test_raw_payloads_are_compressed_out_of_hot_tables(self):
+        receipt = make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z")
+        self.db.save_receipts([receipt])
+        self.db.save_customers([{"id": "cust_1", "name": "Customer One", "note": "x" * 500}])
+
+        conn = self.db.get_connection()
+        inline = conn.execute(
+            "SELECT COUNT(*) FROM receipts WHERE raw_data IS NOT NULL"
+        ).fetchone()[0] + conn.execute("SELECT COUNT(*) FROM customers WHERE raw_data IS NOT NULL").fetchone()[0]
+        payload = conn.execute("SELECT payload FROM raw_payloads WHERE entity = 'customer'").fetchone()[0]
+        conn.close()
+
+        self.assertEqual(inline, 0)
+        self.assertLess(len(payload), 500)
+        self.assertEqual(self.db.get_raw_receipt("r1"), receipt)
+        self.assertEqual(self.db.get_raw_payload("customer", "cust_1")["note"], "x" * 500)
+        self.assertIsNone(self.db.get_raw_receipt("missing"))
+
+        self.db.remove_problematic_receipts(receipt_numbers=["1-0001"])
+        self.assertIsNone(self.db.get_raw_receipt("r1"))
+
+    def test_init_moves_inline_raw_data_to_raw_payloads(self):
+        insert_inline = "INSERT OR REPLACE INTO stores (store_id, name, raw_data) VALUES (?, 'Main', ?)"
+        conn = self.db.get_connection()
+        # A database from before raw_payloads: inline data and no migration marker
+        conn.execute("DELETE FROM sync_metadata WHERE key = 'raw_payloads_migrated'")
+        conn.execute(insert_inline, ("store_1", '{"id": "store_1", "name": "Main"}'))
+        conn.commit()
+        conn.close()
+
+        self.db.init_database()
+
+        conn = self.db.get_connection()
+        inline = conn.execute("SELECT raw_data FROM stores").fetchone()[0]
+        conn.close()
+        self.assertIsNone(inline)
+        self.assertEqual(self.db.get_raw_payload("store", "store_1"), {"id": "store_1", "name": "Main"})
+
+        # Once recorded, later inits skip the scans
+        conn = self.db.get_connection()
+        conn.execute(insert_inline, ("store_2", "{}"))
+        conn.commit()
+        conn.close()
+        self.db.init_database()
+        self.assertIsNone(self.db.get_raw_payload("store", "store_2"))
+
+        # Clearing the data keeps the marker, so the scans stay skipped
+        self.db.clear_all_data()
+        self.db.init_database()
+        self.assertIsNone(self.db.get_raw_payload("store", "store_2"))
+
+    def test_payment_summary_is_one_row_per_receipt(self):
+        split_tender = [
+            {"payment_type_id": "pt_cash", "name": "Cash", "money_amount": 30.0},
+            {"payment_type_id": "pt_card", "name": "Card", "money_amount": 70.0},
+        ]
+        self.db.save_receipts(
+            [
+                make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z", payments=split_tender),
+                make_receipt("r2", "1-0002", "2026-02-01T04:00:00.000Z"),
+            ]
+        )
+
+        conn = self.db.get_connection()
+        rows = conn.execute(
+            """
+            SELECT receipt_id, payment_type_ids, payment_names, is_split, payment_count, amounts_by_type
+            FROM receipt_payment_summary ORDER BY receipt_id
+            """
+        ).fetchall()
+        conn.close()
+        self.assertEqual(rows[0][:5], ("r1", "pt_cash+pt_card", "Cash+Card", 1, 2))
+        self.assertEqual(json.loads(rows[0][5]), {"pt_cash": 30.0, "pt_card": 70.0})
+        self.assertEqual(rows[1][:5], ("r2", "pt_cash", "Cash", 0, 1))
+        self.assertEqual(self.db.get_receipts_dataframe()["bill_type"].tolist(), ["pt_cash+pt_card", "pt_cash"])
+        self.assertEqual(
+            database.summarize_payments([
+                {"payment_type_id": "pt_cash", "name": "Cash", "money_amount": 30.0},
+                {"payment_type_id": None, "name": "Other", "money_amount": 5.0},
+            ])[0::4],
+            ("pt_cash", '{"pt_cash": 30.0}'),
+        )
+
+        self.db.remove_problematic_receipts(receipt_numbers=["1-0001"])
+        self.assertEqual(self._count("receipt_payment_summary"), 1)
+
+        # Databases from before the summary table are backfilled from payments
+        conn = self.db.get_connection()
+        conn.execute("DELETE FROM receipt_payment_summary")
+        conn.commit()
+        conn.close()
+        self.db.init_database()
+        self.assertEqual(self.db.get_receipts_dataframe()["bill_type"].tolist(), ["pt_cash"])
+
+    def test_payment_ids_and_names_line_up_when_a_payment_has_no_type(self):
+        mixed = [
+            {"payment_type_id": "pt_cash", "name": "Cash", "money_amount": 30.0},
+            {"payment_type_id": None, "name": "Voucher", "money_amount": 5.0},
+            {"payment_type_id": "pt_card", "name": "Card", "money_amount": 65.0},
+        ]
+        self.db.save_receipts([make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z", payments=mixed)])
+
+        conn = self.db.get_connection()
+        row = conn.execute(
+            "SELECT payment_type_ids, payment_names, payment_count, total_paid FROM receipt_payment_summary"
+        ).fetchone()
+        conn.close()
+        self.assertEqual(row, ("pt_cash+pt_card", "Cash+Card", 3, 100.0))
+        self.assertEqual(len(row[0].split("+")), len(row[1].split("+")))
+
+    def test_iter_receipts_streams_projected_chunks(self):
+        self.db.save_categories([{"id": "cat_1", "name": "Front"}])
+        self.db.save_items([{"id": "item_1", "item_name": "Ice", "category_id": "cat_1", "variants": []}])
+        two_lines = [
+            {"id": "r1-a", "item_id": "item_1", "item_name": "Ice", "quantity": 1, "total_money": 60.0},
+            {"id": "r1-b", "item_id": "item_2", "item_name": "Bag", "quantity": 1, "total_money": 40.0},
+        ]
+        split_tender = [
+            {"payment_type_id": "pt_cash", "money_amount": 50.0},
+            {"payment_type_id": "pt_card", "money_amount": 50.0},
+        ]
+        self.db.save_receipts(
+            [
+                make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z", lines=two_lines, payments=split_tender),
+                make_receipt("r2", "1-0002", "2026-02-02T03:00:00.000Z"),
+                make_receipt("r3", "1-0003", "2026-02-03T03:00:00.000Z"),
+            ]
+        )
+
+        receipt_chunks = list(
+            self.db.iter_receipts(columns=["business_day", "bill_number", "receipt_total"], chunk_size=2)
+        )
+        self.assertEqual([len(chunk) for chunk in receipt_chunks], [2, 1])
+        self.assertEqual(list(receipt_chunks[0].columns), ["business_day", "bill_number", "receipt_total"])
+        self.assertEqual(
+            [bill for chunk in receipt_chunks for bill in chunk["bill_number"]], ["1-0001", "1-0002", "1-0003"]
+        )
+
+        line_rows = next(self.db.iter_receipts(columns=["bill_number", "item", "bill_type"], end_date="2026-02-01"))
+        self.assertEqual(len(line_rows), 2)
+        self.assertEqual(line_rows["bill_type"].tolist(), ["pt_cash+pt_card", "pt_cash+pt_card"])
+
+        front = next(self.db.iter_receipts(columns=["bill_number", "item"], location="Front", as_arrow=True))
+        self.assertEqual(front.num_rows, 3)
+        self.assertNotIn("Bag", front.column("item").to_pylist())
+
+        with self.assertRaises(ValueError):
+            next(self.db.iter_receipts(columns=["raw_data"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
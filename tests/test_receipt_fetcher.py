@@ -0,0 +1,85 @@
+import threading
+import time
+import unittest
+from datetime import date, datetime
+
+import pytz
+
+from utils.receipt_fetcher import build_shards, fetch_receipts_sharded
+
+
+class FakeClient:
+    """Serves receipt pages per created_at_min; earlier shards answer slower"""
+
+    def __init__(self, pages_by_start, fail_starts=()):
+        self.pages_by_start = pages_by_start
+        self.delays = {start: 0.05 * (len(pages_by_start) - i) for i, start in enumerate(sorted(pages_by_start))}
+        self.fail_starts = set(fail_starts)
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def iter_pages(self, endpoint, key, params=None, limit=250, cursor=None):
+        start = params["created_at_min"]
+        pages = self.pages_by_start.get(start, [[]])
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delays.get(start, 0))
+            if start in self.fail_starts:
+                raise RuntimeError("boom")
+            for number, page in enumerate(pages, start=1):
+                yield page, None if number == len(pages) else f"c{number}"
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+class ReceiptFetcherTests(unittest.TestCase):
+    def test_day_shards_follow_bangkok_days(self):
+        shards = build_shards(date(2025, 11, 1), date(2025, 11, 3))
+        self.assertEqual([shard.params["created_at_min"] for shard in shards], [
+            "2025-10-31T17:00:00.000Z", "2025-11-01T17:00:00.000Z", "2025-11-02T17:00:00.000Z",
+        ])
+        self.assertEqual(shards[-1].params["created_at_max"], "2025-11-03T16:59:59.999Z")
+
+        hourly = build_shards(date(2025, 11, 1), date(2025, 11, 1), "hour", ["s1", "s2"])
+        self.assertEqual(len(hourly), 48)
+        self.assertEqual((hourly[0].store_id, hourly[1].store_id), ("s1", "s2"))
+
+        partial = build_shards(pytz.UTC.localize(datetime(2025, 11, 1, 20, 30)), datetime(2025, 11, 2, 3, 0))
+        self.assertEqual(len(partial), 1)
+        self.assertEqual(partial[0].params["created_at_max"], "2025-11-02T03:00:00.000Z")
+
+    def test_merge_is_ordered_deduped_and_parallel(self):
+        starts = [shard.params["created_at_min"] for shard in build_shards(date(2025, 11, 1), date(2025, 11, 3))]
+        client = FakeClient({
+            starts[0]: [[{"receipt_number": "1-1"}], [{"receipt_number": "1-2"}]],
+            starts[1]: [[{"receipt_number": "1-2"}, {"receipt_number": "1-3"}]],
+            starts[2]: [[{"receipt_number": "1-4"}]],
+        })
+
+        result = fetch_receipts_sharded(client, date(2025, 11, 1), date(2025, 11, 3), max_workers=3, max_rps=0)
+
+        self.assertEqual([r["receipt_number"] for r in result.receipts], ["1-1", "1-2", "1-3", "1-4"])
+        self.assertEqual(result.duplicates, 1)
+        self.assertEqual([shard["pages"] for shard in result.shards], [2, 1, 1])
+        self.assertEqual(result.pages, 4)
+        self.assertEqual(client.max_active, 3)
+
+    def test_failed_shard_is_reported_without_stopping_others(self):
+        starts = [shard.params["created_at_min"] for shard in build_shards(date(2025, 11, 1), date(2025, 11, 2))]
+        client = FakeClient({starts[0]: [[{"receipt_number": "1-1"}]], starts[1]: [[]]}, fail_starts=[starts[1]])
+        done = []
+
+        result = fetch_receipts_sharded(client, date(2025, 11, 1), date(2025, 11, 2), max_rps=0,
+                                        on_shard_done=lambda stats, count, total: done.append((count, total)))
+
+        self.assertEqual(len(result.receipts), 1)
+        self.assertEqual([shard["error"] for shard in result.errors], ["boom"])
+        self.assertEqual(sorted(done), [(1, 2), (2, 2)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,211 @@
+import tempfile
+import threading
+import unittest
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from database import LoyverseDB
+from utils.loyverse_client import LoyverseAPIError
+from tests.test_loyverse_db import make_receipt
+from utils.receipt_fetcher import iter_receipt_pages
+from utils.receipt_sync import ReceiptGuardrail, stream_receipts_to_db, sync_updated_receipts
+
+
+class PagedClient:
+    """Serves the same pages for every shard, resuming from cursor "cN" after page N"""
+
+    def __init__(self, pages, fail_after=None, expired=()):
+        self.pages = pages
+        self.fail_after = fail_after
+        self.expired = set(expired)
+        self.cursors = []
+        self.requested = 0
+        self.lock = threading.Lock()
+
+    def iter_pages(self, endpoint, key, params=None, limit=250, cursor=None):
+        self.params = params
+        self.cursors.append(cursor)
+        if cursor and cursor in self.expired:
+            raise LoyverseAPIError(endpoint, 400, "cursor expired")
+        first = int(cursor[1:]) if cursor else 0
+        for number, page in enumerate(self.pages[first:], start=first + 1):
+            with self.lock:
+                self.requested += 1
+            if self.fail_after is not None and number > self.fail_after:
+                raise RuntimeError("connection reset")
+            yield page, None if number == len(self.pages) else f"c{number}"
+
+
+class ReceiptSyncTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = LoyverseDB(str(Path(self.tmpdir.name) / "loyverse.db"))
+
+    def tearDown(self):
+        self.db.close_connections()
+        self.tmpdir.cleanup()
+
+    def test_pages_are_saved_one_transaction_each_and_deduped(self):
+        self.db.save_receipts([make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z")])
+        pages = [
+            [make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z"), make_receipt("r2", "1-0002", "2026-02-01T04:00:00.000Z")],
+            [make_receipt("r2", "1-0002", "2026-02-01T04:00:00.000Z"), make_receipt("r3", "1-0003", "2026-02-01T05:00:00.000Z")],
+        ]
+        saves = []
+        original_save = self.db.save_receipts
+        self.db.save_receipts = lambda receipts: saves.append(len(receipts)) or original_save(receipts)
+
+        guardrail = ReceiptGuardrail(self.db, "2026-02-01", "2026-02-01")
+        report = stream_receipts_to_db(self.db, PagedClient(pages), date(2026, 2, 1), date(2026, 2, 1), guardrail, max_rps=0)
+
+        self.assertEqual(saves, [1, 1])
+        self.assertEqual((report["pages_fetched"], report["receipts_found"], report["unique_count"]), (2, 4, 2))
+        self.assertEqual((guardrail.duplicate_by_id, guardrail.duplicates), (2, 2))
+        self.assertEqual(self.db.get_receipt_count(), 3)
+        self.assertNotIn("error", report)
+
+    def test_pages_written_before_a_failure_are_kept(self):
+        pages = [[make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z")], [make_receipt("r2", "1-0002", "2026-02-01T04:00:00.000Z")]]
+        guardrail = ReceiptGuardrail(self.db, "2026-02-01", "2026-02-01")
+
+        report = stream_receipts_to_db(self.db, PagedClient(pages, fail_after=1), date(2026, 2, 1), date(2026, 2, 1),
+                                       guardrail, max_rps=0)
+
+        self.assertIn("connection reset", report["error"])
+        self.assertEqual(self.db.get_receipt_count(), 1)
+
+    def test_stream_applies_backpressure_and_stops_when_closed(self):
+        client = PagedClient([[{"receipt_number": str(n)}] for n in range(50)])
+        stream = iter_receipt_pages(client, date(2026, 2, 1), date(2026, 2, 2), max_workers=2, max_rps=0, queue_size=1)
+
+        next(stream)
+        stream.close()
+
+        # Two workers, one queued page and one page each blocked on the queue at most
+        self.assertLess(client.requested, 10)
+
+    def test_incremental_sync_upserts_changes_and_advances_watermark(self):
+        self.db.save_receipts([make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z")])
+        self.assertEqual(self.db.get_receipts_watermark(), "2026-02-01T03:00:00.000Z")
+
+        refunded = make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z", total=80.0)
+        refunded["updated_at"] = "2026-02-03T09:00:00.000Z"
+        late = make_receipt("r2", "1-0002", "2026-02-02T03:00:00.000Z")
+        late["updated_at"] = "2026-02-02T03:00:00.000Z"
+        client = PagedClient([[refunded], [late]])
+
+        report = sync_updated_receipts(self.db, client)
+
+        self.assertEqual(client.params, {"updated_at_min": "2026-02-01T03:00:00.000Z"})
+        self.assertEqual(report["receipts_found"], 2)
+        self.assertEqual(self.db.get_receipts_watermark(), "2026-02-03T09:00:00.000Z")
+        conn = self.db.get_connection()
+        total = conn.execute("SELECT total_money FROM receipts WHERE receipt_id = 'r1'").fetchone()[0]
+        conn.close()
+        self.assertEqual(total, 80.0)
+        self.assertEqual(self.db.get_receipt_count(), 2)
+
+    def test_incremental_sync_of_an_empty_database_starts_from_the_default_window(self):
+        client = PagedClient([[]])
+
+        report = sync_updated_receipts(self.db, client, first_sync_days=30)
+
+        since = datetime.strptime(client.params["updated_at_min"], "%Y-%m-%dT%H:%M:%S.000Z")
+        self.assertAlmostEqual((datetime.utcnow() - since).total_seconds(), 30 * 86400, delta=60)
+        self.assertEqual(report["since"], client.params["updated_at_min"])
+        self.assertEqual(self.db.get_receipts_watermark(fallback=False), report["since"])
+
+    def test_incremental_sync_keeps_watermark_when_interrupted(self):
+        self.db.save_receipts([make_receipt("r1", "1-0001", "2026-02-01T03:00:00.000Z")])
+        changed = make_receipt("r2", "1-0002", "2026-02-02T03:00:00.000Z")
+        changed["updated_at"] = "2026-02-05T00:00:00.000Z"
+
+        report = sync_updated_receipts(self.db, PagedClient([[changed], []], fail_after=1))
+
+        self.assertIn("connection reset", report["error"])
+        self.assertEqual(self.db.get_receipt_count(), 2)
+        self.assertEqual(self.db.get_receipts_watermark(), "2026-02-01T03:00:00.000Z")
+
+    def test_interrupted_range_sync_resumes_from_last_committed_page(self):
+        pages = [[make_receipt(f"r{n}", f"1-000{n}", f"2026-02-01T0{n}:00:00.000Z")] for n in range(1, 4)]
+
+        def run(client):
+            guardrail = ReceiptGuardrail(self.db, "2026-02-01", "2026-02-01")
+            return stream_receipts_to_db(self.db, client, date(2026, 2, 1), date(2026, 2, 1), guardrail, max_rps=0)
+
+        first = run(PagedClient(pages, fail_after=1))
+        runs = self.db.get_sync_runs()
+        self.assertIn("connection reset", first["error"])
+        self.assertEqual(runs.loc[0, ["status", "pages_done", "receipts_done"]].tolist(), ["failed", 1, 1])
+
+        client = PagedClient(pages)
+        second = run(client)
+        self.assertEqual((second["run_id"], second["shards_resumed"]), (first["run_id"], 1))
+        self.assertEqual(client.cursors, ["c1"])
+        self.assertEqual(second["pages_fetched"], 2)
+        self.assertEqual(self.db.get_receipt_count(), 3)
+        runs = self.db.get_sync_runs()
+        self.assertEqual(runs.loc[0, ["status", "pages_done", "receipts_done"]].tolist(), ["done", 3, 3])
+
+        # A finished run is not resumed; an expired cursor restarts its shard from the start
+        third = run(PagedClient(pages))
+        self.assertEqual((third["run_id"], third["shards_resumed"], third["pages_fetched"]), (first["run_id"] + 1, 0, 3))
+
+        run(PagedClient(pages, fail_after=2))
+        client = PagedClient(pages, expired=["c2"])
+        fourth = run(client)
+        self.assertEqual(client.cursors, ["c2", None])
+        self.assertNotIn("error", fourth)
+        self.assertEqual(self.db.get_sync_runs().loc[0, "status"], "done")
+
+    def test_only_recent_runs_resume_and_shards_ending_after_the_start_restart(self):
+        shards = [("2026-02-01T17:00:00.000Z", "2026-02-02T16:59:59.999Z"),
+                  ("2026-02-02T17:00:00.000Z", "2026-02-03T16:59:59.999Z")]
+        started = datetime(2026, 2, 3, 12, 0)
+        run_id, _ = self.db.open_sync_run(shards[0][0], shards[-1][1], None, shards, now=started)
+        for shard_start, _ in shards:
+            self.db.checkpoint_sync_shard(run_id, shard_start, None, 5, "done")
+        self.db.checkpoint_sync_shard(run_id, shards[1][0], receipts=None, status="failed", error="timeout")
+
+        # The first shard closed before the run started; the second was still open
+        resumed, state = self.db.open_sync_run(shards[0][0], shards[-1][1], None, shards,
+                                               now=started + timedelta(hours=1))
+        self.assertEqual(resumed, run_id)
+        self.assertEqual(state[shards[0][0]]["status"], "done")
+        self.assertEqual((state[shards[1][0]]["status"], state[shards[1][0]]["cursor"]), ("pending", None))
+
+        fresh, _ = self.db.open_sync_run(shards[0][0], shards[-1][1], None, shards,
+                                         fresh=True, now=started + timedelta(hours=1))
+        self.assertEqual(fresh, run_id + 1)
+        stale, _ = self.db.open_sync_run(shards[0][0], shards[-1][1], None, shards,
+                                         now=started + timedelta(days=2))
+        self.assertEqual(stale, run_id + 2)
+
+    def test_concurrent_syncs_never_share_a_run_id(self):
+        shards = [("2026-02-01T17:00:00.000Z", "2026-02-02T16:59:59.999Z")]
+        self.db.init_database()
+        barrier = threading.Barrier(6)
+        run_ids, errors = [], []
+
+        def open_run():
+            db = LoyverseDB(self.db.db_path)
+            try:
+                barrier.wait()
+                run_ids.append(db.open_sync_run(shards[0][0], shards[0][1], None, shards, fresh=True)[0])
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.close_connections()
+
+        threads = [threading.Thread(target=open_run) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(run_ids), list(range(1, 7)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+from database import LoyverseDB
+from utils.reference_data import ReferenceData
+
+
+class ReferenceDataTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = LoyverseDB(str(Path(self.tmpdir.name) / "loyverse.db"))
+        self.db.save_customers([{"id": "cust_1", "name": "Alice"}])
+        self.db.save_stores([{"id": "store_1", "name": "Main"}])
+        self.db.save_payment_types([{"id": "pt_cash", "name": "Cash", "type": "CASH"}])
+
+    def tearDown(self):
+        self.db.close_connections()
+        self.tmpdir.cleanup()
+
+    def test_enrich_maps_ids_to_names_with_fallbacks(self):
+        ref = ReferenceData(self.db)
+        df = pd.DataFrame(
+            {
+                "customer_id": ["cust_1", "cust_2", None, ""],
+                "store_id": ["store_1", "store_9", "store_1", None],
+                "bill_type": ["pt_cash", "pt_cash+pt_gone", None, "pt_cash"],
+            }
+        )
+
+        out = ref.enrich_dataframe(df)
+
+        self.assertEqual(
+            out["customer_name"].tolist(), ["Alice", "Unknown Customer", "Walk-in Customer", "Walk-in Customer"]
+        )
+        self.assertEqual(out["store_name"].tolist(), ["Main", "Unknown Store", "Main", "Unknown Store"])
+        self.assertEqual(out["payment_name"].tolist(), ["Cash", "Cash+Unknown Payment", "Unknown", "Cash"])
+
+    def test_reloads_only_when_metadata_version_moves(self):
+        ref = ReferenceData(self.db)
+        self.assertFalse(ref.refresh_if_stale())
+
+        self.db.save_customers([{"id": "cust_2", "name": "Bob"}])
+        self.assertTrue(ref.refresh_if_stale())
+        self.assertEqual(ref.get_customer_name("cust_2"), "Bob")
+        self.assertFalse(ref.refresh_if_stale())
+
+
+if __name__ == "__main__":
+    unittest.main()
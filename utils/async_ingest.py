@@ -0,0 +1,242 @@
+"""
+Async ingestion pipeline for the Loyverse API.
+One httpx.AsyncClient (HTTP/2 when the h2 package is installed) fetches the
+metadata endpoints and the receipt shards of a date range concurrently, with a
+semaphore bounding the requests in flight and the shared FETCH_MAX_RPS limit
+spacing them out. A full refresh therefore takes about as long as the slowest
+endpoint instead of the sum of all of them.
+"""
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+
+from utils.loyverse_client import (
+    API_BASE_URL, PAGE_LIMIT, RETRY_STATUSES, LoyverseAPIError, RequestStats, retry_delay,
+)
+from utils.receipt_fetcher import FETCH_MAX_RPS, DateLike, build_shards, merge_shard_receipts
+
+try:
+    import h2  # noqa: F401  (httpx only negotiates HTTP/2 when h2 is importable)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "8"))
+
+# Metadata endpoint -> LoyverseDB save method, in the order the app syncs them
+METADATA_ENDPOINTS = {
+    "customers": "save_customers",
+    "payment_types": "save_payment_types",
+    "stores": "save_stores",
+    "employees": "save_employees",
+    "categories": "save_categories",
+    "items": "save_items",
+}
+
+
+class AsyncRateLimiter:
+    """Spaces requests at least 1/rate seconds apart across the tasks of one event loop"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class AsyncLoyverseClient:
+    """
+    Async counterpart of LoyverseClient with the same retry rules (GETs on
+    connection errors, 429 and 5xx, honoring Retry-After) and stats shape.
+    Every attempt, retries included, waits for a max_rps slot (0 = no limit).
+    Use as an async context manager.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        base_url: str = API_BASE_URL,
+        timeout: float = 60,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+        max_backoff: float = 30,
+        concurrency: int = INGEST_CONCURRENCY,
+        max_rps: float = FETCH_MAX_RPS,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.rate_limiter = AsyncRateLimiter(max_rps)
+        self.stats = RequestStats()
+        self.http = httpx.AsyncClient(
+            base_url=base_url.rstrip("/") + "/",
+            headers={"Authorization": f"Bearer {token}", "Accept": "application/json"},
+            timeout=timeout,
+            http2=HTTP2_AVAILABLE and transport is None,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            transport=transport,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.http.aclose()
+
+    async def get(self, endpoint: str, params: Optional[Dict] = None) -> Dict:
+        """GET an endpoint and return its JSON body; raises LoyverseAPIError on failure"""
+        attempt = 0
+        while True:
+            response = None
+            await self.rate_limiter.wait()
+            start = time.perf_counter()
+            try:
+                async with self.semaphore:
+                    response = await self.http.get(endpoint.lstrip("/"), params=params)
+            except (httpx.TransportError, httpx.TimeoutException):
+                if attempt >= self.max_retries:
+                    self.stats.record(endpoint, time.perf_counter() - start, attempt > 0, True)
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    failed = response.status_code != 200
+                    self.stats.record(endpoint, time.perf_counter() - start, attempt > 0, failed)
+                    if failed:
+                        raise LoyverseAPIError(endpoint, response.status_code, response.text)
+                    return response.json() if response.content else {}
+            self.stats.record(endpoint, time.perf_counter() - start, attempt > 0, True)
+            retry_after = response.headers.get("Retry-After") if response is not None else None
+            await asyncio.sleep(retry_delay(attempt, retry_after, self.backoff, self.max_backoff))
+            attempt += 1
+
+    async def iter_pages(self, endpoint: str, key: str, params: Optional[Dict] = None,
+                         limit: int = PAGE_LIMIT, cursor: Optional[str] = None
+                         ) -> AsyncIterator[Tuple[List[Dict], Optional[str]]]:
+        """Async version of LoyverseClient.iter_pages: (items, next_cursor) per page"""
+        params = {**(params or {}), "limit": limit}
+        while True:
+            if cursor:
+                params["cursor"] = cursor
+            data = await self.get(endpoint, params)
+            cursor = data.get("cursor") or None
+            yield data.get(key, []), cursor
+            if not cursor:
+                return
+
+    async def fetch_all(self, endpoint: str, key: Optional[str] = None, params: Optional[Dict] = None,
+                        limit: int = PAGE_LIMIT) -> List[Dict]:
+        items: List[Dict] = []
+        async for page, _ in self.iter_pages(endpoint, key or endpoint, params, limit):
+            items.extend(page)
+        return items
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        return self.stats.snapshot()
+
+
+@dataclass
+class IngestResult:
+    """Items per endpoint ("receipts" included) with per-task timings and errors"""
+    data: Dict[str, List[Dict]] = field(default_factory=dict)
+    seconds: Dict[str, float] = field(default_factory=dict)
+    errors: Dict[str, str] = field(default_factory=dict)
+    receipt_duplicates: int = 0
+    total_seconds: float = 0.0
+    stats: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+
+async def _timed(name: str, coro, result: IngestResult):
+    start = time.perf_counter()
+    try:
+        return await coro
+    except Exception as e:
+        result.errors[name] = str(e)
+        return None
+    finally:
+        result.seconds[name] = round(time.perf_counter() - start, 3)
+
+
+async def ingest_async(
+    token: str,
+    start: Optional[DateLike] = None,
+    end: Optional[DateLike] = None,
+    endpoints: Iterable[str] = tuple(METADATA_ENDPOINTS),
+    store_id: Optional[str] = None,
+    window: str = "day",
+    concurrency: int = INGEST_CONCURRENCY,
+    max_rps: float = FETCH_MAX_RPS,
+    client: Optional[AsyncLoyverseClient] = None,
+    endpoint_params: Optional[Dict[str, Dict]] = None,
+) -> IngestResult:
+    """
+    Fetch the given metadata endpoints and, when start/end are set, the
+    receipts of that Bangkok range (one task per day/hour shard), all at once.
+    endpoint_params adds query filters per metadata endpoint, e.g.
+    {"customers": {"updated_at_min": ...}} to fetch only changed customers.
+    Receipts are merged in shard order with boundary duplicates dropped. A
+    failing endpoint or shard is reported in errors; the rest still complete.
+    """
+    endpoints = list(endpoints)
+    unknown = [endpoint for endpoint in endpoints if endpoint not in METADATA_ENDPOINTS]
+    if unknown:
+        raise ValueError(f"Unknown metadata endpoints: {unknown}")
+
+    result = IngestResult()
+    started = time.perf_counter()
+    owns_client = client is None
+    client = client or AsyncLoyverseClient(token, concurrency=concurrency, max_rps=max_rps)
+    try:
+        shards = build_shards(start, end, window, [store_id] if store_id else None) if start and end else []
+        endpoint_params = endpoint_params or {}
+        tasks = [
+            _timed(endpoint, client.fetch_all(endpoint, params=endpoint_params.get(endpoint)), result)
+            for endpoint in endpoints
+        ]
+        tasks += [
+            _timed(f"receipts {shard.label}", client.fetch_all("receipts", params=shard.params), result)
+            for shard in shards
+        ]
+        fetched = await asyncio.gather(*tasks)
+
+        for endpoint, items in zip(endpoints, fetched):
+            result.data[endpoint] = items or []
+        if shards:
+            result.data["receipts"], result.receipt_duplicates = merge_shard_receipts(
+                items or [] for items in fetched[len(endpoints):]
+            )
+        result.stats = client.get_stats()
+    finally:
+        if owns_client:
+            await client.http.aclose()
+    result.total_seconds = round(time.perf_counter() - started, 3)
+    return result
+
+
+def ingest(token: str, *args, **kwargs) -> IngestResult:
+    """Blocking entry point for scripts, cron jobs and the app (see ingest_async)"""
+    return asyncio.run(ingest_async(token, *args, **kwargs))
+
+
+def save_ingest(db, result: IngestResult) -> Dict[str, int]:
+    """Write an ingest result through the LoyverseDB save methods; returns rows received per endpoint"""
+    saved = {}
+    for endpoint, method in METADATA_ENDPOINTS.items():
+        if result.data.get(endpoint):
+            getattr(db, method)(result.data[endpoint])
+            saved[endpoint] = len(result.data[endpoint])
+    if result.data.get("receipts"):
+        saved["receipts"] = db.save_receipts(result.data["receipts"])
+    return saved
@@ -0,0 +1,212 @@
+"""
+Shared Loyverse API client.
+One keep-alive requests.Session per token, retries with exponential backoff that
+honor 429 Retry-After, a generic cursor paginator and per-endpoint latency counters.
+"""
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+API_BASE_URL = "https://api.loyverse.com/v1.0"
+PAGE_LIMIT = 250
+
+# Status codes worth retrying: rate limit and transient server errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class LoyverseAPIError(RuntimeError):
+    """Non-success response from the Loyverse API after retries"""
+
+    def __init__(self, endpoint: str, status_code: int, body: str):
+        super().__init__(f"Loyverse API error {status_code} on {endpoint}: {body[:500]}")
+        self.endpoint = endpoint
+        self.status_code = status_code
+        self.body = body
+
+
+def retry_delay(attempt: int, retry_after: Optional[str], backoff: float, max_backoff: float) -> float:
+    """Retry-After when the server sent one, else jittered exponential backoff"""
+    if retry_after:
+        try:
+            return min(max_backoff, max(0.0, float(retry_after)))
+        except ValueError:
+            try:
+                return min(max_backoff, max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time()))
+            except (TypeError, ValueError):
+                pass
+    delay = min(max_backoff, backoff * (2 ** attempt))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class RequestStats:
+    """Per-endpoint request, retry and error counts with latency, safe across threads"""
+
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float, retried: bool, failed: bool):
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, {
+                "requests": 0, "retries": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0,
+            })
+            stats["requests"] += 1
+            stats["retries"] += int(retried)
+            stats["errors"] += int(failed)
+            stats["total_ms"] += seconds * 1000
+            stats["max_ms"] = max(stats["max_ms"], seconds * 1000)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                endpoint: {**stats, "avg_ms": stats["total_ms"] / stats["requests"] if stats["requests"] else 0.0}
+                for endpoint, stats in self._stats.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class LoyverseClient:
+    """
+    Thread-safe client for the Loyverse REST API.
+
+    Every request goes through one pooled session, so pages reuse the same TLS
+    connection. GETs are retried on connection errors, 429 and 5xx; POSTs only
+    on 429, which the API rejects before doing anything.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        base_url: str = API_BASE_URL,
+        timeout: float = 60,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+        max_backoff: float = 30,
+        pool_size: int = 10,
+        session: Optional[requests.Session] = None,
+    ):
+        self.token = token
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.session = session or requests.Session()
+        if session is None:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            self.session.mount("https://", adapter)
+            self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/json",
+        })
+        self.stats = RequestStats()
+
+    # ===== REQUESTS =====
+
+    def _retry_delay(self, attempt: int, response: Optional[requests.Response]) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        return retry_delay(attempt, retry_after, self.backoff, self.max_backoff)
+
+    def request(self, method: str, endpoint: str, params: Optional[Dict] = None,
+                json: Optional[Dict] = None) -> requests.Response:
+        """
+        Send a request with retries and return the final response (any status).
+        Raises requests.RequestException when the connection keeps failing.
+        """
+        url = f"{self.base_url}/{endpoint.lstrip('/')}"
+        idempotent = method.upper() in ("GET", "HEAD")
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            response = None
+            try:
+                response = self.session.request(method, url, params=params, json=json, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                elapsed = time.perf_counter() - start
+                if not idempotent or attempt >= self.max_retries:
+                    self.stats.record(endpoint, elapsed, attempt > 0, True)
+                    raise
+            else:
+                elapsed = time.perf_counter() - start
+                retryable = response.status_code == 429 or (idempotent and response.status_code in RETRY_STATUSES)
+                if not retryable or attempt >= self.max_retries:
+                    self.stats.record(endpoint, elapsed, attempt > 0, response.status_code >= 400)
+                    return response
+            self.stats.record(endpoint, elapsed, attempt > 0, True)
+            time.sleep(self._retry_delay(attempt, response))
+            attempt += 1
+
+    def get(self, endpoint: str, params: Optional[Dict] = None) -> Dict:
+        """GET an endpoint and return its JSON body; raises LoyverseAPIError on failure"""
+        response = self.request("GET", endpoint, params=params)
+        if response.status_code != 200:
+            raise LoyverseAPIError(endpoint, response.status_code, response.text)
+        return response.json() if response.content else {}
+
+    def post(self, endpoint: str, payload: Dict) -> requests.Response:
+        """POST a JSON payload and return the response for the caller to inspect"""
+        return self.request("POST", endpoint, json=payload)
+
+    # ===== PAGINATION =====
+
+    def iter_pages(self, endpoint: str, key: str, params: Optional[Dict] = None,
+                   limit: int = PAGE_LIMIT, cursor: Optional[str] = None) -> Iterator[Tuple[List[Dict], Optional[str]]]:
+        """
+        Walk a cursor-paginated collection, yielding (items, next_cursor) per
+        page. Start from cursor to resume a walk; next_cursor is None on the
+        last page.
+        """
+        params = {**(params or {}), "limit": limit}
+        while True:
+            if cursor:
+                params["cursor"] = cursor
+            data = self.get(endpoint, params)
+            cursor = data.get("cursor") or None
+            yield data.get(key, []), cursor
+            if not cursor:
+                return
+
+    def fetch_all(self, endpoint: str, key: Optional[str] = None, params: Optional[Dict] = None,
+                  limit: int = PAGE_LIMIT) -> List[Dict]:
+        """Every item of a collection (key defaults to the endpoint name)"""
+        items: List[Dict] = []
+        for page, _ in self.iter_pages(endpoint, key or endpoint, params, limit):
+            items.extend(page)
+        return items
+
+    # ===== STATS =====
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-endpoint request, retry and error counts with total/avg/max latency in ms"""
+        return self.stats.snapshot()
+
+    def reset_stats(self):
+        self.stats.reset()
+
+    def close(self):
+        self.session.close()
+
+
+# One client per token for the whole process, like the database connection pools
+_clients: Dict[str, LoyverseClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(token: Optional[str] = None) -> LoyverseClient:
+    """The process-wide client for a token (LOYVERSE_TOKEN by default)"""
+    token = token or os.getenv("LOYVERSE_TOKEN", "")
+    with _clients_lock:
+        client = _clients.get(token)
+        if client is None:
+            client = _clients[token] = LoyverseClient(token)
+        return client
@@ -0,0 +1,320 @@
+"""
+Parallel, range-sharded receipt fetching for the Loyverse API.
+A Bangkok date range is split into day or hour windows (optionally per store),
+each window walks its own cursor chain on a bounded thread pool, and the pages
+are merged back in shard order with receipts on shard boundaries deduplicated.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from utils.loyverse_client import PAGE_LIMIT, LoyverseAPIError, LoyverseClient
+from utils.sync_dates import BANGKOK, UTC
+
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "4"))
+# Page requests per second across all workers; 0 disables the limiter
+FETCH_MAX_RPS = float(os.getenv("FETCH_MAX_RPS", "5"))
+
+SHARD_WINDOWS = {"day": timedelta(days=1), "hour": timedelta(hours=1)}
+
+DateLike = Union[date, datetime]
+
+
+def _format_api_time(dt: datetime) -> str:
+    return dt.astimezone(UTC).strftime("%Y-%m-%dT%H:%M:%S.") + f"{dt.microsecond // 1000:03d}Z"
+
+
+def _to_utc(value: DateLike, end: bool = False) -> datetime:
+    """Bangkok calendar dates cover the whole day; datetimes are taken as UTC when naive"""
+    if isinstance(value, datetime):
+        return UTC.localize(value) if value.tzinfo is None else value.astimezone(UTC)
+    bound = datetime.max.time() if end else datetime.min.time()
+    return BANGKOK.localize(datetime.combine(value, bound)).astimezone(UTC)
+
+
+def utc_bounds(start: DateLike, end: DateLike):
+    """(start_utc, end_utc) covering start..end, both inclusive"""
+    return _to_utc(start), _to_utc(end, end=True)
+
+
+@dataclass(frozen=True)
+class Shard:
+    """One window of the range (inclusive bounds, UTC) for one store or all stores"""
+    index: int
+    start_utc: datetime
+    end_utc: datetime
+    store_id: Optional[str] = None
+    # Cursor to resume the walk from (a checkpoint of an interrupted run)
+    cursor: Optional[str] = None
+
+    @property
+    def label(self) -> str:
+        start = self.start_utc.astimezone(BANGKOK).strftime("%Y-%m-%d %H:%M")
+        return f"{start}{' @' + self.store_id if self.store_id else ''}"
+
+    @property
+    def params(self) -> Dict[str, str]:
+        params = {
+            "created_at_min": _format_api_time(self.start_utc),
+            "created_at_max": _format_api_time(self.end_utc),
+        }
+        if self.store_id:
+            params["store_id"] = self.store_id
+        return params
+
+
+def build_shards(start: DateLike, end: DateLike, window: str = "day",
+                 store_ids: Optional[Iterable[str]] = None) -> List[Shard]:
+    """
+    Split start..end into contiguous windows aligned to Bangkok day/hour
+    boundaries, times each store in store_ids (all stores when None).
+    """
+    if window not in SHARD_WINDOWS:
+        raise ValueError(f"Unknown shard window {window!r}; expected one of {sorted(SHARD_WINDOWS)}")
+    start_utc, end_utc = utc_bounds(start, end)
+    step = SHARD_WINDOWS[window]
+
+    # Align window edges to Bangkok local time so a day shard is a business day
+    local = start_utc.astimezone(BANGKOK)
+    edge = local.replace(minute=0, second=0, microsecond=0)
+    if window == "day":
+        edge = edge.replace(hour=0)
+    edge = BANGKOK.localize(edge.replace(tzinfo=None))
+
+    windows = []
+    lower = start_utc
+    while lower <= end_utc:
+        upper = BANGKOK.normalize(edge + step).astimezone(UTC)
+        windows.append((lower, min(upper - timedelta(milliseconds=1), end_utc)))
+        lower, edge = upper, BANGKOK.normalize(edge + step)
+
+    stores = list(store_ids) if store_ids else [None]
+    shards: List[Shard] = []
+    for lower, upper in windows:
+        for store in stores:
+            shards.append(Shard(len(shards), lower, upper, store))
+    return shards
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across threads"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+@dataclass
+class ShardedFetch:
+    """Merged receipts plus per-shard timings from fetch_receipts_sharded"""
+    receipts: List[Dict]
+    shards: List[Dict]
+    duplicates: int
+    seconds: float
+
+    @property
+    def errors(self) -> List[Dict]:
+        return [shard for shard in self.shards if shard["error"]]
+
+    @property
+    def pages(self) -> int:
+        return sum(shard["pages"] for shard in self.shards)
+
+
+class _Cancelled(Exception):
+    """Raised inside a worker when the consumer of a page stream has gone away"""
+
+
+def _walk_shard(client: LoyverseClient, shard: Shard, limiter: RateLimiter, limit: int,
+                on_page: Callable[[List[Dict], Optional[str]], None]) -> Dict:
+    """Walk one shard's cursor chain, handing each page to on_page; returns its stats"""
+    stats = {
+        "shard": shard.label, "store_id": shard.store_id,
+        "start": shard.params["created_at_min"], "end": shard.params["created_at_max"],
+        "pages": 0, "receipts": 0, "seconds": 0.0, "error": None, "resumed": bool(shard.cursor),
+    }
+    started = time.perf_counter()
+    cursor = shard.cursor
+    try:
+        while True:
+            pages = client.iter_pages("receipts", "receipts", shard.params, limit, cursor=cursor)
+            try:
+                while True:
+                    limiter.wait()
+                    try:
+                        items, next_cursor = next(pages)
+                    except StopIteration:
+                        break
+                    stats["pages"] += 1
+                    stats["receipts"] += len(items)
+                    on_page(items, next_cursor)
+                break
+            except LoyverseAPIError as e:
+                # A saved cursor the API no longer accepts: walk the shard again from its start
+                if cursor and not stats["pages"] and 400 <= e.status_code < 500:
+                    cursor = None
+                    stats["resumed"] = False
+                    continue
+                raise
+    except _Cancelled:
+        raise
+    except Exception as e:
+        stats["error"] = str(e)
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def _fetch_shard(client: LoyverseClient, shard: Shard, limiter: RateLimiter, limit: int):
+    receipts: List[Dict] = []
+    stats = _walk_shard(client, shard, limiter, limit, lambda items, _: receipts.extend(items))
+    return receipts, stats
+
+
+def receipt_key(receipt: Dict):
+    return (receipt.get("store_id") or "", str(receipt.get("receipt_number") or receipt.get("id") or ""))
+
+
+def merge_shard_receipts(shard_receipts: Iterable[List[Dict]]):
+    """Concatenate per-shard receipts in the given order; returns (receipts, duplicates dropped)"""
+    receipts: List[Dict] = []
+    seen = set()
+    duplicates = 0
+    for batch in shard_receipts:
+        for receipt in batch:
+            key = receipt_key(receipt)
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            receipts.append(receipt)
+    return receipts, duplicates
+
+
+def fetch_receipts_sharded(
+    client: LoyverseClient,
+    start: DateLike,
+    end: DateLike,
+    window: str = "day",
+    store_ids: Optional[Iterable[str]] = None,
+    max_workers: int = FETCH_WORKERS,
+    max_rps: float = FETCH_MAX_RPS,
+    limit: int = PAGE_LIMIT,
+    on_shard_done: Optional[Callable[[Dict, int, int], None]] = None,
+) -> ShardedFetch:
+    """
+    Fetch every receipt in start..end with one cursor walk per shard on up to
+    max_workers threads. Receipts come back in shard order (oldest window
+    first, stores in the given order) with API page order kept inside a shard,
+    so the result does not depend on which worker finished first. A failed
+    shard is reported in its stats entry instead of aborting the others.
+    on_shard_done(stats, done, total) runs on the calling thread.
+    """
+    shards = build_shards(start, end, window, store_ids)
+    limiter = RateLimiter(max_rps)
+    results: Dict[int, tuple] = {}
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(shards)))) as pool:
+        futures = {pool.submit(_fetch_shard, client, shard, limiter, limit): shard for shard in shards}
+        for done, future in enumerate(as_completed(futures), start=1):
+            shard = futures[future]
+            results[shard.index] = future.result()
+            if on_shard_done:
+                on_shard_done(results[shard.index][1], done, len(shards))
+
+    receipts, duplicates = merge_shard_receipts(results[index][0] for index in sorted(results))
+
+    return ShardedFetch(
+        receipts=receipts,
+        shards=[results[index][1] for index in sorted(results)],
+        duplicates=duplicates,
+        seconds=round(time.perf_counter() - started, 3),
+    )
+
+
+@dataclass
+class ReceiptPage:
+    """One downloaded page; cursor is the shard's next cursor (None on its last page)"""
+    shard: Shard
+    receipts: List[Dict]
+    cursor: Optional[str]
+
+
+def iter_receipt_pages(
+    client: LoyverseClient,
+    start: DateLike,
+    end: DateLike,
+    window: str = "day",
+    store_ids: Optional[Iterable[str]] = None,
+    max_workers: int = FETCH_WORKERS,
+    max_rps: float = FETCH_MAX_RPS,
+    limit: int = PAGE_LIMIT,
+    queue_size: Optional[int] = None,
+    shard_stats: Optional[List[Dict]] = None,
+    shards: Optional[List[Shard]] = None,
+) -> Iterator[ReceiptPage]:
+    """
+    Yield receipt pages as the shard workers download them, in arrival order.
+    At most queue_size pages (default max_workers) wait between the workers
+    and the caller, so a slow consumer pauses the downloads and memory stays
+    at a few pages. Finished shards' stats are appended to shard_stats.
+    Closing the generator early stops the workers after their current request.
+    Pass shards (e.g. with resume cursors) to walk those instead of start..end.
+    """
+    if shards is None:
+        shards = build_shards(start, end, window, store_ids)
+    if not shards:
+        return
+    limiter = RateLimiter(max_rps)
+    workers = max(1, min(max_workers, len(shards)))
+    pages: "queue.Queue" = queue.Queue(maxsize=queue_size or workers)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise _Cancelled()
+
+    def work(shard):
+        try:
+            stats = _walk_shard(client, shard, limiter, limit,
+                                lambda items, cursor: put(ReceiptPage(shard, items, cursor)))
+            put(stats)
+        except _Cancelled:
+            pass
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for shard in shards:
+            pool.submit(work, shard)
+        try:
+            finished = 0
+            while finished < len(shards):
+                item = pages.get()
+                if isinstance(item, ReceiptPage):
+                    yield item
+                else:
+                    finished += 1
+                    if shard_stats is not None:
+                        shard_stats.append(item)
+        finally:
+            stop.set()
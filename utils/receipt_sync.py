@@ -0,0 +1,204 @@
+"""
+Streaming receipt sync: pages flow from the shard workers straight into the
+database, each page deduplicated and saved in its own transaction while the
+next pages download. Peak memory is a few pages, and a crash keeps every page
+already written; range syncs checkpoint each shard's cursor in sync_runs so an
+interrupted run picks up where it stopped.
+"""
+import os
+import time
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from utils.loyverse_client import LoyverseClient
+from utils.receipt_fetcher import (
+    FETCH_MAX_RPS, FETCH_WORKERS, DateLike, build_shards, iter_receipt_pages,
+)
+
+# How far back the first incremental sync of an empty database reaches (days)
+INCREMENTAL_FIRST_SYNC_DAYS = int(os.getenv("INCREMENTAL_FIRST_SYNC_DAYS", "30"))
+
+
+class ReceiptGuardrail:
+    """
+    Duplicate guardrail for one sync range. Receipts already stored (by id, or
+    by store + receipt number) are skipped; same second + amount + store is
+    only counted as a collision signal, since legitimate receipts share those.
+    Keys of saved receipts are added as pages go, so later pages dedupe
+    against earlier ones.
+    """
+
+    def __init__(self, db, start_day: str, end_day: str, store_id: Optional[str] = None):
+        query = """
+            SELECT receipt_id, receipt_number, store_id, created_at, total_money
+            FROM receipts
+            WHERE business_day >= ? AND business_day <= ?
+        """
+        params = [start_day, end_day]
+        if store_id:
+            query += " AND store_id = ?"
+            params.append(store_id)
+        conn = db.get_connection()
+        existing = pd.read_sql_query(query, conn, params=params)
+        conn.close()
+
+        self.existing_count = len(existing)
+        self.receipt_ids = set(existing["receipt_id"].dropna().astype(str))
+        self.number_keys = set(zip(
+            existing["store_id"].fillna("").astype(str),
+            existing["receipt_number"].fillna("").astype(str),
+        ))
+        self.time_amount_keys = set(zip(
+            existing["created_at"].fillna("").astype(str),
+            existing["total_money"].fillna(0).astype(float).round(2),
+            existing["store_id"].fillna("").astype(str),
+        ))
+        self.duplicate_by_id = 0
+        self.duplicate_by_number = 0
+        self.collisions = 0
+
+    def filter(self, receipts: Iterable[Dict]) -> List[Dict]:
+        """Receipts of this page that are not already stored"""
+        unique = []
+        for r in receipts:
+            receipt_id = str(r.get("id") or r.get("receipt_number") or "")
+            receipt_number = str(r.get("receipt_number") or "")
+            receipt_store = str(r.get("store_id") or "")
+
+            if receipt_id and receipt_id in self.receipt_ids:
+                self.duplicate_by_id += 1
+                continue
+            if receipt_number and (receipt_store, receipt_number) in self.number_keys:
+                self.duplicate_by_number += 1
+                continue
+            # Guardrail signal only: we don't skip on this weak key.
+            time_amount = (str(r.get("created_at") or ""), round(float(r.get("total_money", 0) or 0), 2), receipt_store)
+            if time_amount in self.time_amount_keys:
+                self.collisions += 1
+
+            unique.append(r)
+            if receipt_id:
+                self.receipt_ids.add(receipt_id)
+            if receipt_number:
+                self.number_keys.add((receipt_store, receipt_number))
+        return unique
+
+    @property
+    def duplicates(self) -> int:
+        return self.duplicate_by_id + self.duplicate_by_number
+
+
+def stream_receipts_to_db(
+    db,
+    client: LoyverseClient,
+    start: DateLike,
+    end: DateLike,
+    guardrail: ReceiptGuardrail,
+    store_id: Optional[str] = None,
+    window: str = "day",
+    max_workers: int = FETCH_WORKERS,
+    max_rps: float = FETCH_MAX_RPS,
+    on_page=None,
+    fresh: bool = False,
+) -> Dict:
+    """
+    Download start..end and save each page as it arrives. Returns counts and
+    per-shard stats in the same shape as the fetch_all_receipts debug sink.
+    on_page(report) runs after every saved page.
+
+    Progress is checkpointed in sync_runs after every saved page: a run over
+    the same range that was interrupted (restart, API error) is resumed,
+    skipping finished shards and continuing the others from their last
+    committed cursor. At most the page in flight is fetched again, and the
+    guardrail skips its receipts. fresh=True always starts a new run (see
+    LoyverseDB.open_sync_run for which runs are resumed).
+    """
+    shards = build_shards(start, end, window, [store_id] if store_id else None)
+    run_id, state = db.open_sync_run(
+        shards[0].params["created_at_min"], shards[-1].params["created_at_max"], store_id,
+        [(shard.params["created_at_min"], shard.params["created_at_max"]) for shard in shards],
+        fresh=fresh,
+    )
+    pending = [
+        replace(shard, cursor=state[shard.params["created_at_min"]]["cursor"])
+        for shard in shards
+        if state[shard.params["created_at_min"]]["status"] != "done"
+    ]
+
+    shard_stats: List[Dict] = []
+    report = {
+        "run_id": run_id, "shards_total": len(shards), "shards_skipped": len(shards) - len(pending),
+        "shards_resumed": sum(1 for shard in pending if shard.cursor),
+        "pages_fetched": 0, "receipts_found": 0, "unique_count": 0, "saved_count": 0, "write_seconds": 0.0,
+    }
+    started = time.perf_counter()
+    for page in iter_receipt_pages(client, start, end, max_workers=max_workers, max_rps=max_rps,
+                                   shard_stats=shard_stats, shards=pending):
+        report["pages_fetched"] += 1
+        report["receipts_found"] += len(page.receipts)
+        unique = guardrail.filter(page.receipts)
+        report["unique_count"] += len(unique)
+        if unique:
+            write_start = time.perf_counter()
+            report["saved_count"] += db.save_receipts(unique)
+            report["write_seconds"] += time.perf_counter() - write_start
+        db.checkpoint_sync_shard(run_id, page.shard.params["created_at_min"], page.cursor,
+                                 len(page.receipts), "running" if page.cursor else "done")
+        if on_page:
+            on_page(report)
+
+    report["write_seconds"] = round(report["write_seconds"], 3)
+    report["fetch_seconds"] = round(time.perf_counter() - started, 3)
+    report["shards"] = shard_stats
+    errors = [shard for shard in shard_stats if shard["error"]]
+    for shard in errors:
+        db.checkpoint_sync_shard(run_id, shard["start"], receipts=None, status="failed", error=shard["error"])
+    if errors:
+        report["error"] = "; ".join(f"{shard['shard']}: {shard['error']}" for shard in errors)
+    return report
+
+
+def sync_updated_receipts(db, client: LoyverseClient, since: Optional[str] = None, on_page=None,
+                          first_sync_days: int = INCREMENTAL_FIRST_SYNC_DAYS) -> Dict:
+    """
+    Incremental sync: fetch every receipt created or changed (edited, refunded,
+    cancelled, paid late) since the updated_at watermark and upsert it page by
+    page; unchanged receipts are skipped by save_receipts' content hash. The
+    watermark only moves, to the newest updated_at seen, after the whole walk
+    succeeds, so an interrupted run is simply repeated. Always covers all
+    stores, since the watermark is shared. An empty database with no
+    watermark starts first_sync_days back instead of downloading all history;
+    older receipts come from a range sync.
+    """
+    stored = db.get_receipts_watermark(fallback=False)
+    since = since or stored or db.get_receipts_watermark()
+    if not since:
+        start = datetime.now(timezone.utc) - timedelta(days=first_sync_days)
+        since = start.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    if not stored:
+        # Pin the first watermark so receipts saved by an interrupted run cannot move it
+        db.set_receipts_watermark(since)
+    params = {"updated_at_min": since}
+    report = {"mode": "updated_since", "since": since, "pages_fetched": 0, "receipts_found": 0, "saved_count": 0}
+    newest = since
+    started = time.perf_counter()
+    try:
+        for receipts, _ in client.iter_pages("receipts", "receipts", params):
+            report["pages_fetched"] += 1
+            report["receipts_found"] += len(receipts)
+            if receipts:
+                report["saved_count"] += db.save_receipts(receipts)
+                newest = max([newest or ""] + [r.get("updated_at") or "" for r in receipts]) or None
+            if on_page:
+                on_page(report)
+    except Exception as e:
+        report["error"] = str(e)
+    else:
+        if newest and newest != since:
+            db.set_receipts_watermark(newest)
+    report["watermark"] = db.get_receipts_watermark()
+    report["fetch_seconds"] = round(time.perf_counter() - started, 3)
+    return report
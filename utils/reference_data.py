@@ -2,11 +2,18 @@
 Unified ReferenceData class for managing all lookup data (customers, stores, payment types, etc.)
 Simplifies data access throughout the application
 """
+import threading
+
+import pandas as pd
+
 
 class ReferenceData:
     """
     Central cache for all reference/lookup data
     Provides clean interface for mapping IDs to human-readable names
+    
+    One instance can be shared by every session in the process: it reloads
+    itself when the database's 'metadata' data version moves.
     """
     
     def __init__(self, db):
@@ -15,10 +22,18 @@ class ReferenceData:
         Loads all reference data maps on startup
         """
         self.db = db
+        self.version = None
+        self._lock = threading.Lock()
         self._load_all_maps()
     
     def _load_all_maps(self):
         """Load all mapping dictionaries from database"""
+        try:
+            version = self.db.get_data_version('metadata')
+        except Exception as e:
+            print(f"Warning: Could not read metadata version: {e}")
+            version = None
+        
         try:
             self.customers = self.db.get_customer_map()
         except Exception as e:
@@ -42,10 +57,33 @@ class ReferenceData:
         except Exception as e:
             print(f"Warning: Could not load employees: {e}")
             self.employees = {}
+        
+        # id -> name Series used for vectorized lookups in enrich_dataframe
+        self._lookups = {
+            'customers': pd.Series(self.customers, dtype=object),
+            'stores': pd.Series(self.stores, dtype=object),
+            'employees': pd.Series(self.employees, dtype=object),
+        }
+        self.version = version
     
     def refresh(self):
         """Reload all maps from database (call after sync)"""
-        self._load_all_maps()
+        with self._lock:
+            self._load_all_maps()
+    
+    def refresh_if_stale(self):
+        """Reload only when metadata changed since the last load; returns True if reloaded"""
+        try:
+            current = self.db.get_data_version('metadata')
+        except Exception:
+            return False
+        if current == self.version:
+            return False
+        with self._lock:
+            if current != self.version:
+                self._load_all_maps()
+                return True
+        return False
     
     # === Customer Methods ===
     
@@ -109,6 +147,20 @@ class ReferenceData:
     
     # === Batch Operations ===
     
+    @staticmethod
+    def _map_ids(ids, lookup, missing, blank):
+        """
+        Vectorized id -> name: resolve each distinct id once against the lookup
+        Series, then broadcast the names back through the factorized codes.
+        Blank ids ('', 'nan', 'None') get `blank`, unknown ids get `missing`.
+        """
+        codes, uniques = pd.factorize(ids.astype(object).fillna('').astype(str))
+        uniques = pd.Index(uniques)
+        names = uniques.map(lookup).to_numpy(dtype=object)
+        names[pd.isna(names)] = missing
+        names[uniques.isin(['', 'nan', 'None'])] = blank
+        return pd.Series(names[codes], index=ids.index, dtype=object)
+    
     def enrich_dataframe(self, df):
         """
         Add human-readable name columns to a DataFrame
@@ -119,32 +171,33 @@ class ReferenceData:
         Returns:
             DataFrame with additional name columns
         """
-        import pandas as pd
-        
         df = df.copy()
+        lookups = self._lookups
         
         # Add customer names
         if 'customer_id' in df.columns and self.has_customers():
-            df['customer_name'] = df['customer_id'].astype(str).map(
-                lambda x: self.get_customer_name(x)
+            df['customer_name'] = self._map_ids(
+                df['customer_id'], lookups['customers'], "Unknown Customer", "Walk-in Customer"
             )
         
-        # Add payment names
+        # Add payment names (resolve each distinct payment combination once)
         if 'bill_type' in df.columns and self.has_payment_types():
-            df['payment_name'] = df['bill_type'].apply(
-                lambda x: self.get_payment_names(x)
-            )
+            lookup = {
+                ids: self.get_payment_names(ids)
+                for ids in df['bill_type'].dropna().unique()
+            }
+            df['payment_name'] = df['bill_type'].map(lookup).fillna("Unknown")
         
         # Add store names
         if 'store_id' in df.columns and self.has_stores():
-            df['store_name'] = df['store_id'].astype(str).map(
-                lambda x: self.get_store_name(x)
+            df['store_name'] = self._map_ids(
+                df['store_id'], lookups['stores'], "Unknown Store", "Unknown Store"
             )
         
         # Add employee names
         if 'employee_id' in df.columns and self.has_employees():
-            df['employee_name'] = df['employee_id'].astype(str).map(
-                lambda x: self.get_employee_name(x)
+            df['employee_name'] = self._map_ids(
+                df['employee_id'], lookups['employees'], "Unknown Employee", "Unknown Employee"
             )
         
         return df
@@ -181,6 +234,3 @@ class ReferenceData:
         return missing
 
 
-# Import pandas for type hints
-import pandas as pd
-
@@ -46,3 +46,25 @@ def utc_to_bangkok_date(utc_timestamp: Union[str, datetime]) -> date:
     elif dt.tzinfo != UTC:
         dt = dt.astimezone(UTC)
     return dt.astimezone(BANGKOK).date()
+
+
+def bangkok_local_parts(utc_timestamp: Union[str, datetime]) -> Tuple[str, int, int]:
+    """
+    Return (business_day, local_hour, local_weekday) for a UTC timestamp, where
+    business_day is the Bangkok calendar date as YYYY-MM-DD and local_weekday
+    follows datetime.weekday() (Monday=0). Returns (None, None, None) if missing
+    or unparseable, so ingest never fails on a bad timestamp.
+    """
+    if not utc_timestamp:
+        return None, None, None
+    try:
+        if isinstance(utc_timestamp, str):
+            dt = datetime.fromisoformat(utc_timestamp.replace("Z", "+00:00"))
+        else:
+            dt = utc_timestamp
+    except ValueError:
+        return None, None, None
+    if dt.tzinfo is None:
+        dt = UTC.localize(dt)
+    local = dt.astimezone(BANGKOK)
+    return local.date().isoformat(), local.hour, local.weekday()